@@ -1,14 +1,32 @@
 #! /usr/bin/env python3
-"""Fabric file to setup continuous integration server for iotlab-os-ci."""
+"""Fabric file to setup continuous integration server for iotlab-os-ci.
+
+'setup' can be run on multiple servers in parallel with 'fab -H A,B setup'.
+Steps already done are detected with cheap probes and skipped, the duration
+of each step is printed for each server.
+
+Packages are installed from the bundle pushed with 'push_bundle' when present
+and valid, see 'build_bundle'.
+
+Consecutive remote operations are grouped in a 'Batch' run in one round trip,
+'fab dry_run TASK' prints the batches scripts instead of running them.
+"""
 
 import os
 import sys
+import time
+import uuid
+import shlex
+import base64
+import hashlib
+import tarfile
+import tempfile
 import contextlib
 import io
 
-from fabric.api import env, task, runs_once, execute
+from fabric.api import env, task, runs_once, execute, parallel, hide
 from fabric.api import run, sudo, put, get
-from fabric.contrib.files import append, sed
+from fabric.contrib.files import append, contains, sed
 from fabric.context_managers import settings
 import fabric.utils
 
@@ -24,6 +42,41 @@ DISK = '/dev/vda'
 
 HOME_CONFIG_FILE = '.profile'
 
+# 'apt-get update' is re-run if older
+APT_UPDATE_MAX_AGE = 60  # minutes
+
+# Packages installed by 'install_all_packages'
+COMMON_PACKAGES = [
+    'vim', 'tar', 'git', 'build-essential', 'aptitude',
+    'python3', 'python3-dev', 'python3-pip', 'python3-virtualenv',
+    'htop', 'screen', 'tmux',
+]
+IOTLAB_PACKAGES = ['libssl-dev']
+IOTLAB_PIP_PACKAGES = ['iotlabcli', 'iotlabsshcli']
+RIOT_PACKAGES = [
+    'make', 'docker.io', 'ccache',
+    'python3-serial', 'python3-pexpect',
+    'python3-cryptography', 'python3-pyasn1', 'python3-ecdsa',
+    'python3-crypto',
+]
+RIOT_PIP_PACKAGES = ['pytest', 'pytest-html', 'pyserial', 'scapy']
+
+# Compiler cache shared by the builds, see 'tools/cmdxml/clean_all.mk.pre'
+CCACHE_DIR = '/builds/ccache'
+CCACHE_MAX_SIZE = '20G'
+
+# Local apt packages and wheels bundle, and where it is pushed on the server
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bundle')
+REMOTE_BUNDLE_DIR = '/var/cache/iotlab-os-ci/bundle'
+BUNDLE_CHECKSUMS = 'SHA256SUMS'
+# The bundle debs are an apt local repository, only used with these options
+BUNDLE_SOURCES = 'bundle.list'
+BUNDLE_APT_OPTIONS = ('-o Dir::Etc::SourceList={0}/{1} '
+                      '-o Dir::Etc::SourceParts=- '
+                      '-o Dir::State::Lists={0}/lists').format(
+                          REMOTE_BUNDLE_DIR, BUNDLE_SOURCES)
+_BUNDLE_VALID = {}
+
 # It requires having configured your .ssh/config as described in the README
 env.host_string = 'root@{server}'.format(server=SERVER)
 env.ssh_config_path = '~/.ssh/config'
@@ -36,11 +89,222 @@ env.use_ssh_config = True
 
 @contextlib.contextmanager
 def running_as_ci():
-    """Context manager to connect to the server as 'ci'."""
-    with settings(host_string='ci@{server}'.format(server=SERVER)):
+    """Context manager to connect to the current server as 'ci'."""
+    with settings(host_string='ci@{server}'.format(server=env.host)):
         yield
 
 
+def _probe(command):
+    """Return if 'command' succeeds, without output.
+
+    Used to check if a step is already done.
+    """
+    with settings(hide('everything'), warn_only=True):
+        return run(command).succeeded
+
+
+@contextlib.contextmanager
+def _timed(step, timings):
+    """Print and append to 'timings' the duration of 'step'."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        timings.append((step, duration))
+        fabric.utils.puts('{step}: {duration:.1f}s'.format(
+            step=step, duration=duration))
+
+
+class BatchStep():
+    """Step of a 'Batch', 'return_code' is None if it did not run."""
+
+    def __init__(self, name, command, warn_only=False):
+        self.name = name
+        self.command = command
+        self.warn_only = warn_only
+        self.return_code = None
+        self.output = ''
+
+    @property
+    def succeeded(self):
+        """The step ran successfully."""
+        return self.return_code == 0
+
+
+class Batch():
+    """Remote operations run as one shell script in one round trip.
+
+    Steps run in order in the same shell, so variables are kept, until one
+    fails. Files given to 'put' are sent inside the script as one archive.
+    When the 'unless' command succeeds, no step is run.
+
+    The exit code and output of each step are reported.
+    With 'env.batch_dry_run', set by the 'dry_run' task, the script is only
+    printed.
+    """
+    # Bigger scripts are copied with 'put' instead of given in the command
+    MAX_COMMAND_SIZE = 64 * 1024
+
+    def __init__(self, name, unless=None, use_sudo=False):
+        self.name = name
+        self.unless = unless
+        self.use_sudo = use_sudo
+        self.steps = []
+        self.files = []
+        self.skipped = False
+        self.marker = 'batch-' + uuid.uuid4().hex
+
+    def run(self, command, name=None, warn_only=False):
+        """Add 'command' step."""
+        self.steps.append(BatchStep(name or command, command, warn_only))
+
+    def put(self, local_path, remote_path, mode=None):
+        """Add a step copying 'local_path' to 'remote_path'.
+
+        'remote_path' is expanded by the shell, it can use variables.
+        """
+        command = 'mkdir -p "$(dirname "{1}")" && cp "$BATCH_DIR/{0}" "{1}"'
+        if mode is not None:
+            command += ' && chmod {2:o} "{1}"'
+        self.run(command.format(len(self.files), remote_path, mode),
+                 name='put {0} {1}'.format(local_path, remote_path))
+        self.files.append(local_path)
+
+    def append(self, filename, line):
+        """Add a step appending 'line' to 'filename' if not already there."""
+        command = 'grep -qsxF -e {0} {1} || echo {0} >> {1}'
+        self.run(command.format(shlex.quote(line), filename),
+                 name='append {0}'.format(filename))
+
+    def script(self):
+        """Return the batch shell script."""
+        lines = ['BATCH_DIR=$(mktemp -d)',
+                 'trap \'rm -rf "$BATCH_DIR"\' EXIT']
+        if self.unless is not None:
+            lines += ['if {0}; then'.format(self.unless),
+                      "    printf '{0} skipped\\n'".format(self.marker),
+                      '    exit 0',
+                      'fi']
+        if self.files:
+            lines.append('base64 -d <<\'{0}\' | tar -xzf - -C "$BATCH_DIR"'
+                         .format(self.marker))
+            lines.append(self._archive())
+            lines.append(self.marker)
+
+        for index, step in enumerate(self.steps):
+            lines += ["printf '{0} start {1}\\n'".format(self.marker, index),
+                      '{',
+                      step.command,
+                      '} 2>&1 </dev/null',
+                      'rc=$?',
+                      "printf '\\n{0} end {1} %d\\n' \"$rc\""
+                      .format(self.marker, index)]
+            if not step.warn_only:
+                lines.append('[ "$rc" -eq 0 ] || exit "$rc"')
+        return '\n'.join(lines) + '\n'
+
+    def _archive(self):
+        """Base64 tar archive of the files, named by their index."""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            for index, local_path in enumerate(self.files):
+                tar.add(local_path, arcname=str(index))
+        encoded = base64.encodebytes(archive.getvalue()).decode()
+        return encoded.rstrip('\n')
+
+    def execute(self):
+        """Run the batch and report each step, return the steps.
+
+        Aborts if a step without 'warn_only' failed.
+        """
+        script = self.script()
+        if env.get('batch_dry_run'):
+            fabric.utils.puts('[{0}] batch {1}:\n{2}'.format(
+                env.host_string, self.name, script))
+            return self.steps
+
+        encoded = base64.b64encode(script.encode()).decode()
+        if len(encoded) < self.MAX_COMMAND_SIZE:
+            command = ('script=$(mktemp) && echo {0} | base64 -d > "$script" '
+                       '&& bash "$script"; rc=$?; rm -f "$script"; exit $rc'
+                       .format(encoded))
+        else:
+            path = '/tmp/{0}.sh'.format(self.marker)
+            put(io.BytesIO(script.encode()), path)
+            command = 'bash {0}; rc=$?; rm -f {0}; exit $rc'.format(path)
+
+        runner = sudo if self.use_sudo else run
+        with settings(hide('running', 'stdout'), warn_only=True):
+            result = runner(command, pty=False)
+        self._parse(result, result.return_code)
+        self._report(result)
+        return self.steps
+
+    def _parse(self, output, return_code):
+        """Set the steps 'return_code' and 'output' from the script output.
+
+        A step interrupted by the end of the script gets its 'return_code'.
+        Lines with only the marker, like a step printing it, are ignored.
+        """
+        current = None
+        lines = []
+        for line in output.splitlines():
+            fields = line.rstrip('\r').split(' ')
+            if fields[0] != self.marker:
+                lines.append(line.rstrip('\r'))
+                continue
+            if len(fields) < 2:
+                continue
+            if fields[1] == 'skipped':
+                self.skipped = True
+            elif fields[1] == 'start':
+                current = self.steps[int(fields[2])]
+                lines = []
+            elif fields[1] == 'end' and current is not None:
+                # Remove the newline added before the end marker
+                if lines and not lines[-1]:
+                    lines.pop()
+                current.output = '\n'.join(lines)
+                current.return_code = int(fields[3])
+                current = None
+        if current is not None:
+            current.output = '\n'.join(lines)
+            current.return_code = return_code
+
+    def _report(self, result):
+        prefix = '[{0}] {1}'.format(env.host_string, self.name)
+        if self.skipped:
+            fabric.utils.puts('{0}: already done'.format(prefix))
+            return
+        for step in self.steps:
+            if step.return_code is None:
+                continue
+            fabric.utils.puts('{0}: {1}: exit {2}'.format(
+                prefix, step.name, step.return_code))
+            for line in step.output.splitlines():
+                fabric.utils.puts('    ' + line, show_prefix=False)
+
+        failed = [step for step in self.steps
+                  if step.return_code not in (None, 0) and not step.warn_only]
+        if failed:
+            fabric.utils.abort('{0}: {1!r} failed with exit {2}'.format(
+                prefix, failed[0].name, failed[0].return_code))
+        if result.failed:
+            fabric.utils.abort('{0}: batch failed with exit {1}:\n{2}'.format(
+                prefix, result.return_code, result))
+
+
+@task
+def dry_run():
+    """Print the batches scripts of the next tasks instead of running them.
+
+    Usage: 'fab dry_run setup_sudo_and_ssh_key'
+    Probes run outside of batches are still run.
+    """
+    env.batch_dry_run = True
+
+
 @task
 def hello_word():
     """Check we can run a command on the server."""
@@ -50,57 +314,60 @@ def hello_word():
 @task
 def setup_sudo_and_ssh_key():
     """Setup sudo no password for 'ci' and add ssh key."""
-    _setup_authorized_keys()
-    _setup_authorized_keys_user('ci', 'ci')
+    batch = Batch('setup_sudo_and_ssh_key')
+    _setup_authorized_keys(batch)
+    _setup_authorized_keys_user(batch, 'ci', 'ci')
 
-    run('apt-get update && apt-get install sudo')
-    _setup_ci_sudo_nopasswd()
+    batch.run('which sudo || (apt-get update && apt-get install -yqq sudo)')
+    _setup_ci_sudo_nopasswd(batch)
+    batch.execute()
 
 
-def _setup_ci_sudo_nopasswd(no_passwd_file='template/ci_no_passwd'):
+def _setup_ci_sudo_nopasswd(batch, no_passwd_file='template/ci_no_passwd'):
     sudoers_tmp = '/tmp/ci_no_passwd'
     sudoers_no_passwd = '/etc/sudoers.d/ci_no_passwd'
 
     command = 'chown root:root {0}; mv {0} {1}'
     command = command.format(sudoers_tmp, sudoers_no_passwd)
-    cmd = 'bash -c "%s"' % command  # Use bash -c command for sudo
 
-    put(no_passwd_file, '/tmp/ci_no_passwd')
-    sudo(cmd)
+    batch.put(no_passwd_file, sudoers_tmp)
+    batch.run(command)
 
 
-def _setup_authorized_keys(authorized_keys='template/authorized_keys',
+def _setup_authorized_keys(batch, authorized_keys='template/authorized_keys',
                            home_dir='/root'):
-    run('mkdir -p {dir}/.ssh'.format(dir=home_dir))
-    put(authorized_keys, '{dir}/.ssh/authorized_keys'.format(dir=home_dir))
+    batch.put(authorized_keys, '{dir}/.ssh/authorized_keys'.format(
+        dir=home_dir))
 
 
-def _setup_authorized_keys_user(user, group):
-    ci_home_dir = run('getent passwd ci | cut -d: -f6')
+def _setup_authorized_keys_user(batch, user, group):
+    batch.run('ci_home_dir=$(getent passwd {user} | cut -d: -f6)'.format(
+        user=user))
 
-    _setup_authorized_keys(home_dir=ci_home_dir)
-    cmd = 'chown -R {user}:{group} {dir}/.ssh'
-    run(cmd.format(user=user, group=group, dir=ci_home_dir))
+    _setup_authorized_keys(batch, home_dir='$ci_home_dir')
+    cmd = 'chown -R {user}:{group} "$ci_home_dir/.ssh"'
+    batch.run(cmd.format(user=user, group=group))
 
 
 @task
 def disable_ssh_password_auth():
     """Disable password authentication."""
-    sed('/etc/ssh/sshd_config',
-        r'^.*PasswordAuthentication yes', 'PasswordAuthentication no')
-    run('grep PasswordAuthentication /etc/ssh/sshd_config')
+    batch = Batch('disable_ssh_password_auth')
+    batch.run("sed -i.bak -r -e 's/^.*PasswordAuthentication yes/"
+              "PasswordAuthentication no/' /etc/ssh/sshd_config")
+    batch.run('grep PasswordAuthentication /etc/ssh/sshd_config')
+    batch.execute()
 
 
 @task
 def create_partition():
     """Create partition with fdisk and format it."""
     partition = DISK + '1'
-    mounted_cmd = 'mount -l | grep {0}'.format(DISK)
-    mounted = not run(mounted_cmd, warn_only=True).return_code
-    if mounted:
-        return
-    _fdisk(DISK)
-    _mkfs_ext4(partition)
+    mounted_cmd = 'mount -l | grep -q {0}'.format(DISK)
+    batch = Batch('create_partition', unless=mounted_cmd)
+    batch.run(_fdisk(DISK))
+    batch.run(_mkfs_ext4(partition))
+    batch.execute()
 
 
 def _fdisk(disk):
@@ -113,11 +380,11 @@ def _fdisk(disk):
     commands += r'\n'   # Last sector (Accept default: varies)
     commands += r'w\n'  # Write changes
     commands += r'y\n'  # Quit
-    run("printf '{0}' | fdisk {1}".format(commands, disk))
+    return "printf '{0}' | fdisk {1}".format(commands, disk)
 
 
 def _mkfs_ext4(partition, option='-F'):
-    run('mkfs.ext4 {0} {1}'.format(option, partition))
+    return 'mkfs.ext4 {0} {1}'.format(option, partition)
 
 
 @task
@@ -126,26 +393,118 @@ def mount_builds_directory():
     builds_partition = DISK + '1'
     mount = '{0} /builds         ext4    defaults 0 1'.format(builds_partition)
 
-    run('mkdir -p /builds')
-    append('/etc/fstab', mount)
-    run('mount -a')
-    run('chown -R ci:ci /builds')
+    batch = Batch('mount_builds_directory', unless='mountpoint -q /builds')
+    batch.run('mkdir -p /builds')
+    batch.append('/etc/fstab', mount)
+    batch.run('mount -a')
+    batch.run('chown -R ci:ci /builds')
+    batch.execute()
+
+
+@task
+def setup_ccache(max_size=CCACHE_MAX_SIZE):
+    """Create the compiler cache in '/builds' and set its maximum size.
+
+    'ccache' removes the least recently used files above 'max_size'.
+    """
+    install('ccache')
+    batch = Batch('setup_ccache')
+    batch.run('mkdir -p {0} && chown ci:ci {0}'.format(CCACHE_DIR))
+    batch.run(_ccache_as_ci('--max-size {0}'.format(max_size)))
+    batch.execute()
+
+
+@task
+def prune_ccache(max_size=None):
+    """Remove the compiler cache files above its maximum size.
+
+    With 'max_size', the maximum size is updated first.
+    With 'max_size=0', the whole cache is cleared.
+    """
+    batch = Batch('prune_ccache')
+    if max_size == '0':
+        batch.run(_ccache_as_ci('--clear'))
+    elif max_size is not None:
+        batch.run(_ccache_as_ci('--max-size {0}'.format(max_size)))
+    batch.run(_ccache_as_ci('--cleanup'))
+    batch.run(_ccache_as_ci('--show-stats'))
+    batch.execute()
+
+
+def _ccache_as_ci(args):
+    return 'sudo -u ci CCACHE_DIR={0} ccache {1}'.format(CCACHE_DIR, args)
 
 
 # Apt-get/aptitude recipes
 
-@runs_once
 @task
-def update():
-    """apt-get update"""
-    sudo('apt-get update')
+def update(max_age=None):
+    """apt-get update
+
+    With 'max_age' minutes, only update if the last update is older.
+    Failures are ignored when the packages bundle is available, for offline
+    installs.
+    """
+    if max_age is not None and _probe(
+            'test -n "$(find /var/lib/apt/lists -maxdepth 0 -mmin -{0})"'
+            .format(max_age)):
+        return
+    sudo('apt-get update', warn_only=_bundle_available())
 
 
 @task
 def install(packages, options=''):
-    """Install packages in non-interactive mode."""
-    execute(update)
-    sudo('apt-get install {0} -yqq {1}'.format(options, packages))
+    """Install packages in non-interactive mode.
+
+    Only the packages not already installed are installed.
+    """
+    missing = _missing_packages(packages.split())
+    if not missing:
+        return
+    if _bundle_available():
+        # The bundle repository is the only apt source, dependencies are
+        # also taken from it
+        if sudo('mkdir -p {0}/lists/partial && apt-get update -qq {1} && '
+                'apt-get install {2} -yqq {1} {3}'.format(
+                    REMOTE_BUNDLE_DIR, BUNDLE_APT_OPTIONS, options,
+                    ' '.join(missing)), warn_only=True).succeeded:
+            return
+        fabric.utils.warn('Packages not in bundle: ' + ' '.join(missing))
+    update(APT_UPDATE_MAX_AGE)
+    sudo('apt-get install {0} -yqq {1}'.format(options, ' '.join(missing)))
+
+
+def _missing_packages(packages):
+    """Return the 'packages' not installed."""
+    with settings(hide('everything'), warn_only=True):
+        output = run("dpkg-query -W -f='${{Package}} ${{Status}}\\n' {0}"
+                     .format(' '.join(packages)))
+    installed = {line.split()[0] for line in output.splitlines()
+                 if line.endswith(' installed')}
+    # Ignore ':arch' suffix
+    return [package for package in packages
+            if package.split(':')[0] not in installed]
+
+
+@task
+def pip_install(packages):
+    """Install python packages with one pip call if some are missing."""
+    packages = packages.split()
+    with settings(hide('everything'), warn_only=True):
+        output = run('pip3 show {0}'.format(' '.join(packages)))
+    installed = {line.split(':', 1)[1].strip().lower()
+                 for line in output.splitlines() if line.startswith('Name:')}
+    missing = [package for package in packages
+               if package.lower() not in installed]
+    if not missing:
+        return
+    if _bundle_available():
+        cmd = 'pip3 install --no-index --find-links {0}/wheels {1}'
+        if run(cmd.format(REMOTE_BUNDLE_DIR, ' '.join(missing)),
+               warn_only=True).succeeded:
+            return
+        fabric.utils.warn('Python packages not in bundle, using the index')
+    run('pip3 install {0}'.format(' '.join(missing)))
 
 
 @task
@@ -164,6 +523,8 @@ def install_build_dep(packages, options=''):
 @task
 def upgrade():
     """Upgrade packages in non-interactive mode."""
+    if not _upgradable('upgrade'):
+        return
     sudo('apt-get upgrade -yqq')
     sudo('apt-get autoremove -yqq')
 
@@ -171,10 +532,17 @@ def upgrade():
 @task
 def dist_upgrade():
     """Dist upgrade packages in non-interactive mode."""
+    if not _upgradable('dist-upgrade'):
+        return
     sudo('apt-get dist-upgrade -yqq')
     sudo('apt-get autoremove -yqq')
 
 
+def _upgradable(command):
+    """Simulate 'apt-get command' to see if it would install something."""
+    return _probe("apt-get -s {0} | grep -q '^Inst '".format(command))
+
+
 @task
 def apt_cache_clean():
     """Clean package cache and autoremove packages."""
@@ -193,7 +561,8 @@ def setup_ci_home(ci_home='/builds/ci'):
     * Re-set all files a 'ci' user as modifications where done as root
     * Get 'iotlab' user account '.iotlabrc'
     """
-    _set_ci_home_path(ci_home)
+    if run('getent passwd ci | cut -d: -f6') != ci_home:
+        _set_ci_home_path(ci_home)
     append(os.path.join(ci_home, HOME_CONFIG_FILE),
            'export PATH=${HOME}/.local/bin:${PATH}')
 
@@ -224,36 +593,159 @@ def _setup_iotlab_account_auth_cli():
         _copy_file_from_iotlab_server('.ssh/id_rsa', mode=0o600)
 
 
+# Packages bundle
+
+@task
+def build_bundle(bundle_dir=BUNDLE_DIR):
+    """Download all the packages and wheels on the server into 'bundle_dir'.
+
+    The server should be a fresh install of the same release as the CI
+    servers, like a local container, so all the dependencies are downloaded.
+    The debs are indexed with 'apt-ftparchive' so they can be used as a
+    local apt repository. A 'SHA256SUMS' file is written for the bundle
+    files.
+    """
+    remote_dir = run('mktemp -d')
+    packages = COMMON_PACKAGES + IOTLAB_PACKAGES + RIOT_PACKAGES
+    pip_packages = IOTLAB_PIP_PACKAGES + RIOT_PIP_PACKAGES
+
+    update()
+    # apt-get downloads in 'partial' first and does not create it
+    run('mkdir -p {0}/debs/partial'.format(remote_dir))
+    sudo('apt-get install --download-only -yqq '
+         '-o Dir::Cache::Archives={0}/debs/ {1}'.format(
+             remote_dir, ' '.join(packages)))
+    install('python3-pip apt-utils')
+    run('cd {0} && apt-ftparchive packages debs > debs/Packages'.format(
+        remote_dir))
+    run('pip3 wheel --quiet --wheel-dir {0}/wheels {1}'.format(
+        remote_dir, ' '.join(pip_packages)))
+
+    archive = io.BytesIO()
+    run('cd {0} && tar -czf {0}.tar.gz debs/*.deb debs/Packages wheels'
+        .format(remote_dir))
+    get(remote_dir + '.tar.gz', archive)
+    sudo('rm -rf {0} {0}.tar.gz'.format(remote_dir))
+
+    archive.seek(0)
+    with tarfile.open(fileobj=archive) as tar:
+        tar.extractall(bundle_dir)
+    with open(os.path.join(bundle_dir, BUNDLE_SOURCES), 'w') as sourcesfd:
+        sourcesfd.write('deb [trusted=yes] file:{0} debs/\n'.format(
+            REMOTE_BUNDLE_DIR))
+    _write_checksums(bundle_dir)
+    fabric.utils.puts('Bundle written in {0}'.format(bundle_dir))
+
+
+def _write_checksums(bundle_dir):
+    checksums = []
+    for root, _, files in os.walk(bundle_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, bundle_dir)
+            if relpath == BUNDLE_CHECKSUMS:
+                continue
+            checksums.append((relpath, _sha256(path)))
+    with open(os.path.join(bundle_dir, BUNDLE_CHECKSUMS), 'w') as sumsfd:
+        for relpath, digest in sorted(checksums):
+            sumsfd.write('{0}  {1}\n'.format(digest, relpath))
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as filefd:
+        for block in iter(lambda: filefd.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@task
+def push_bundle(bundle_dir=BUNDLE_DIR):
+    """Copy the bundle to the server in one archive and verify it.
+
+    The local files are verified before the copy.
+    """
+    checksums = os.path.join(bundle_dir, BUNDLE_CHECKSUMS)
+    with open(checksums) as sumsfd:
+        for line in sumsfd:
+            digest, relpath = line.rstrip('\n').split('  ', 1)
+            if _sha256(os.path.join(bundle_dir, relpath)) != digest:
+                fabric.utils.abort('Invalid bundle file {0}'.format(relpath))
+
+    with tempfile.TemporaryFile() as archive:
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            tar.add(bundle_dir, arcname='.')
+        archive.seek(0)
+        run('mkdir -p {0}'.format(os.path.dirname(REMOTE_BUNDLE_DIR)))
+        put(archive, REMOTE_BUNDLE_DIR + '.tar')
+
+    sudo('rm -rf {0} && mkdir -p {0} && tar -C {0} -xf {0}.tar && '
+         'rm {0}.tar'.format(REMOTE_BUNDLE_DIR))
+    _BUNDLE_VALID.pop(env.host_string, None)
+    if not _bundle_available():
+        fabric.utils.abort('Bundle checksums verification failed on server')
+
+
+def _push_local_bundle(bundle_dir=BUNDLE_DIR):
+    """Push the local bundle if it was built and is not already there."""
+    checksums = os.path.join(bundle_dir, BUNDLE_CHECKSUMS)
+    if not os.path.isfile(checksums):
+        return
+    with open(checksums) as sumsfd:
+        local = sumsfd.read()
+    with settings(hide('everything'), warn_only=True):
+        remote = run('cat {0}/{1}'.format(REMOTE_BUNDLE_DIR, BUNDLE_CHECKSUMS))
+    if remote.strip() == local.strip() and _bundle_available():
+        return
+    push_bundle(bundle_dir)
+
+
+def _bundle_available():
+    """Return if the bundle is on the server and its checksums are valid.
+
+    Checksums are only verified once per server.
+    """
+    if env.host_string not in _BUNDLE_VALID:
+        _BUNDLE_VALID[env.host_string] = _probe(
+            'cd {0} && sha256sum --check --quiet {1}'.format(
+                REMOTE_BUNDLE_DIR, BUNDLE_CHECKSUMS))
+    return _BUNDLE_VALID[env.host_string]
+
+
 # Packages setup
 
 
 @task
 def install_all_packages():
-    """Meta recipe that installs all packages."""
-    install_common()
-    install_iotlab()
-    install_riot()
+    """Meta recipe that installs all packages.
+
+    Packages are installed in one apt transaction and one pip call.
+    """
+    install(' '.join(COMMON_PACKAGES + IOTLAB_PACKAGES + RIOT_PACKAGES))
+    pip_install(' '.join(IOTLAB_PIP_PACKAGES + RIOT_PIP_PACKAGES))
+    _set_bash_default_shell()
+    disable_dns_mask_for_docker()
 
 
 @task
 def install_common():
     """Install common server dependencies."""
-    packages = ['vim', 'tar', 'git', 'build-essential', 'aptitude']
-    packages += ['python3', 'python3-dev', 'python3-pip', 'python3-virtualenv']
-    packages += ['htop', 'screen', 'tmux']
-    install(' '.join(packages))
+    install(' '.join(COMMON_PACKAGES))
+    _set_bash_default_shell()
+
 
-    # Set bash as default environment
+def _set_bash_default_shell():
+    """Set bash as default environment."""
+    if _probe('test "$(readlink -f /bin/sh)" = /bin/bash'):
+        return
     run('update-alternatives --install /bin/sh sh /bin/bash 100')
 
 
 @task
 def install_iotlab():
     """Install iotlab specific tools."""
-    packages = ['libssl-dev']
-    install(' '.join(packages))
-
-    run('pip3 install iotlabcli iotlabsshcli')
+    install(' '.join(IOTLAB_PACKAGES))
+    pip_install(' '.join(IOTLAB_PIP_PACKAGES))
 
 
 def _check_iotlab_account_access(user='iotlab', site='grenoble'):
@@ -283,52 +775,83 @@ def _copy_file_from_iotlab_server(file_path, user='iotlab', site='grenoble',
 @task
 def install_riot():
     """Install iot-lab repository dependencies."""
-
-    packages = ['make', 'docker.io']
-    packages += ['python3-serial', 'python3-pexpect']
-    packages += ['python3-cryptography', 'python3-pyasn1', 'python3-ecdsa',
-                 'python3-crypto']
-    install(' '.join(packages))
+    install(' '.join(RIOT_PACKAGES))
     disable_dns_mask_for_docker()
-    run('pip3 install pytest pytest-html pyserial scapy')
+    pip_install(' '.join(RIOT_PIP_PACKAGES))
 
 
 @task
 def disable_dns_mask_for_docker():
     """Disable dnsmask for NetworkManager."""
+    config = '/etc/NetworkManager/NetworkManager.conf'
+    if not contains(config, '^dns=dnsmasq', escape=False):
+        return
     sed('/etc/NetworkManager/NetworkManager.conf',
-        r'^dns=dnsmasq','#dns=dnsmasq')
+        r'^dns=dnsmasq', '#dns=dnsmasq')
     run('systemctl restart NetworkManager.service')
 
 
 @task
 def add_and_generate_locale():
     """Add en_US locale and generate it."""
-    sed('/etc/locale.gen', '^en_US', '# en_US')
-    sed('/etc/locale.gen', '# en_US.UTF-8 UTF-8', 'en_US.UTF-8 UTF-8')
-    run('locale-gen')
-
-    run('update-locale LANG=en_US.UTF-8')
-    run('update-locale LC_ALL=en_US.UTF-8')
-    run('update-locale LC=C')
+    done = ('locale -a | grep -qi "^en_US.utf8$" && '
+            'grep -q LC=C /etc/default/locale')
+    batch = Batch('add_and_generate_locale', unless=done)
+    batch.run("sed -i.bak -r -e 's/^en_US/# en_US/' /etc/locale.gen")
+    batch.run("sed -i.bak -r -e 's/# en_US.UTF-8 UTF-8/en_US.UTF-8 UTF-8/' "
+              "/etc/locale.gen")
+    batch.run('locale-gen')
+
+    batch.run('update-locale LANG=en_US.UTF-8')
+    batch.run('update-locale LC_ALL=en_US.UTF-8')
+    batch.run('update-locale LC=C')
+    batch.execute()
+
+
+# Steps of 'setup' with their arguments
+SETUP_STEPS = [
+    (hello_word, {}),
+    (setup_sudo_and_ssh_key, {}),
+    (disable_ssh_password_auth, {}),
+    (create_partition, {}),
+    (mount_builds_directory, {}),
+    (setup_ci_home, {}),
+    (add_and_generate_locale, {}),
+    (_push_local_bundle, {}),
+    (update, {'max_age': APT_UPDATE_MAX_AGE}),
+    (upgrade, {}),
+    (dist_upgrade, {}),
+    (install_all_packages, {}),
+    (setup_ccache, {}),
+    (apt_cache_clean, {}),
+]
 
 
+@runs_once
 @task
 def setup():
     """Setup the whole server.
 
-    This can be called multiple times without problems
+    This can be called multiple times without problems.
+    With multiple hosts, they are setup in parallel.
     """
-    execute(hello_word)
-    execute(setup_sudo_and_ssh_key)
-    execute(disable_ssh_password_auth)
-    execute(create_partition)
-    execute(mount_builds_directory)
-    execute(setup_ci_home)
-    execute(add_and_generate_locale)
-
-    execute(update)
-    execute(upgrade)
-    execute(dist_upgrade)
-    execute(install_all_packages)
-    execute(apt_cache_clean)
+    hosts = env.hosts or [env.host_string]
+    timings = execute(_setup_host, hosts=hosts)
+
+    for host, host_timings in sorted(timings.items()):
+        total = sum(duration for _, duration in host_timings)
+        fabric.utils.puts('{host}: {total:.1f}s'.format(
+            host=host, total=total))
+        for step, duration in host_timings:
+            fabric.utils.puts('    {step:<28} {duration:.1f}s'.format(
+                step=step, duration=duration))
+
+
+@parallel
+def _setup_host():
+    """Run the setup steps on the current host, return their timings."""
+    timings = []
+    for step, kwargs in SETUP_STEPS:
+        with _timed(step.__name__, timings):
+            step(**kwargs)
+    return timings
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+"""Benchmark the 'cmdxml' startup with pytest and with '--fast'.
+
+The same commands are run as 'clean_all.mk.pre' does, once per call:
+
+* 'pytest': the default 'pytest.main' run
+* 'fast': with '--fast', without importing pytest
+
+'--fast' only runs without pytest with pytest 5.3, before python 3.10, it
+uses pytest otherwise and the times are the same.
+
+The reports of both modes are compared, without the times, timestamp and
+hostname that always differ.
+
+'pytest_jenkins' must be in PYTHONPATH as for 'clean_all.mk.pre'.
+
+Usage:
+
+    PYTHONPATH=$PWD/.. ./bench_startup.py --runs 20 --command false
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+from pytest_cmdxml import fast as cmdxml_fast
+
+CMDXML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cmdxml')
+FLAGS = ['-p', 'pytest_jenkins',
+         '--junit-prefix=BOARD.APPLICATION.compilation',
+         '-o', 'junit_suite_name=BOARD.APPLICATION']
+
+# Report values depending on the run
+VARIABLES = (
+    (re.compile(r'\b(time|timestamp|hostname)="[^"]*"'), r'\1=""'),
+    (re.compile(r'(name="(?:wall_time|user_time|sys_time|maxrss)") '
+                r'value="[^"]*"'), r'\1 value=""'),
+)
+
+PARSER = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawTextHelpFormatter)
+PARSER.add_argument('--runs', type=int, default=10,
+                    help='Number of calls of each mode')
+PARSER.add_argument('--command', dest='commands', action='append', default=[],
+                    help='Command to run, default: true')
+
+
+def run(directory, name, commands, *args):
+    """Run 'cmdxml' and return its time and its report."""
+    report = os.path.join(directory, name, 'report.xml')
+    # Same output logs paths in the reports of both modes
+    output_dir = os.path.join(directory, 'output')
+    cmd = [sys.executable, CMDXML, '--junit-xml=' + report,
+           '--output-dir=' + output_dir] + FLAGS
+    cmd += list(args)
+    for command in commands:
+        cmd += ['--command', command]
+    start = time.monotonic()
+    subprocess.run(cmd, cwd=directory, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    duration = time.monotonic() - start
+    with open(report) as reportfd:
+        return duration, reportfd.read()
+
+
+def normalize(report):
+    """Report without the values depending on the run."""
+    for regex, replacement in VARIABLES:
+        report = regex.sub(replacement, report)
+    return report
+
+
+def main():
+    """Run both modes and print their times."""
+    opts = PARSER.parse_args()
+    commands = opts.commands or ['true']
+    with tempfile.TemporaryDirectory() as directory:
+        pytest_runs = [run(directory, 'pytest', commands)
+                       for _ in range(opts.runs)]
+        fast_runs = [run(directory, 'fast', commands, '--fast')
+                     for _ in range(opts.runs)]
+
+    slow = min(duration for duration, _ in pytest_runs)
+    fast = min(duration for duration, _ in fast_runs)
+    print('runs: {}, commands: {}'.format(opts.runs, len(commands)))
+    print('pytest: {:.3f}s'.format(slow))
+    print('fast:   {:.3f}s ({:.0%} saved)'.format(fast, 1 - fast / slow))
+    if not cmdxml_fast.supported_pytest():
+        print('fast:   pytest used, the installed pytest is not supported')
+
+    same = normalize(pytest_runs[-1][1]) == normalize(fast_runs[-1][1])
+    print('reports: {}'.format('same' if same else 'DIFFERENT'))
+    return 0 if same else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,21 @@
 """
 Define command line options and associated fixtures.
 This allows triggering tests based on the command line provided options.
+
+'pytest' is not imported so 'cmdxml --fast' can use the options and executor
+without it, the 'executor' fixture is defined in 'cmdxml.py'.
 """
 
 import os
+import argparse
+
+from .backends import BACKENDS
+from .cache import ResultCache, ENV_VARS, MAX_SIZE
+from .ccache import CcacheStats
+from . import containers
+from .executor import Executor
+from .metrics import Metrics
+from .output import OutputLog
 
 __version__ = '0.1.0'
 
@@ -14,6 +26,15 @@ PYTEST_ARGS = [TEST_FILE]
 FIXTURES = ('command', 'script')
 
 
+def positive_int(value):
+    """argparse type for integers of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: {}'.format(
+            value))
+    return number
+
+
 def pytest_addoption(parser):
     """Define options to configure the fixtures.
 
@@ -25,6 +46,152 @@ def pytest_addoption(parser):
     parser.addoption('--script', default=[], action="append",
                      metavar='script',
                      help='Script to test, can be specified multiple times')
+    parser.addoption('--jobs', default=1, type=positive_int, metavar='N',
+                     help='Number of commands/scripts executed in parallel')
+    parser.addoption('--backend', default='subprocess',
+                     choices=sorted(BACKENDS),
+                     help='How commands are executed, "coprocess" uses one '
+                          'long-lived bash per job, "docker" one warm '
+                          'container per job (default: subprocess)')
+    parser.addoption('--docker-image', default=containers.IMAGE,
+                     metavar='IMAGE',
+                     help='Toolchain image of the "docker" backend '
+                          'containers')
+    parser.addoption('--docker-runtime', default=containers.RUNTIME,
+                     metavar='RUNTIME',
+                     help='docker compatible command, or "local" to run on '
+                          'the host as a stand-in')
+    parser.addoption('--docker-recycle', default=containers.RECYCLE,
+                     type=int, metavar='N',
+                     help='Replace the containers after N items')
+    parser.addoption('--docker-volume', default=[], action='append',
+                     metavar='DIR',
+                     help='Directory mounted in the containers, can be '
+                          'specified multiple times, default: current '
+                          'directory')
+    parser.addoption('--docker-env', default=[], action='append',
+                     metavar='VAR',
+                     help='Environment variable given to the items, '
+                          'default: {}'.format(' '.join(containers.ENV_VARS)))
+    parser.addoption('--docker-keep', default=False, action='store_true',
+                     help='Keep the containers running for the next '
+                          'sessions')
+    parser.addoption('--output-dir', default=None, metavar='DIR',
+                     help='Directory for the items output log files, '
+                          'default: the junit-xml report directory')
+    parser.addoption('--output-head', default=20, type=int, metavar='LINES',
+                     help='First output lines written in the report')
+    parser.addoption('--output-tail', default=100, type=int, metavar='LINES',
+                     help='Last output lines written in the report')
+    parser.addoption('--metrics-json', default=None, metavar='PATH',
+                     help='JSON file for the items metrics, '
+                          'default: the junit-xml report with ".json"')
+    parser.addoption('--cache-dir', default=None, metavar='DIR',
+                     help='Replay results from a cache in DIR when the '
+                          'command, environment and inputs did not change')
+    parser.addoption('--cache-env', default=[], action='append',
+                     metavar='VAR',
+                     help='Environment variable used in the cache key, '
+                          'default: {}'.format(' '.join(ENV_VARS)))
+    parser.addoption('--cache-input', default=[], action='append',
+                     metavar='PATH',
+                     help='Input file or directory used in the cache key, '
+                          'can be specified multiple times')
+    parser.addoption('--cache-ignore', default=[], action='append',
+                     metavar='DIR',
+                     help='Directory under the inputs not used in the cache '
+                          'key, can be specified multiple times')
+    parser.addoption('--cache-max-size', default=MAX_SIZE, type=int,
+                     metavar='BYTES',
+                     help='Cache size, least recently used results are '
+                          'removed above it')
+    parser.addoption('--cache-refresh', default=False, action='store_true',
+                     help='Do not use cached results but update them')
+    parser.addoption('--ccache-stats', default=False, action='store_true',
+                     help='Add the items ccache hits and misses as '
+                          'properties')
+
+
+def pytest_configure(config):
+    """Create the items executor."""
+    # pylint:disable=protected-access
+    output = OutputLog(_output_dir(config),
+                       head=config.getoption('output_head'),
+                       tail=config.getoption('output_tail'))
+    metrics = Metrics(_metrics_json(config),
+                      prefix=getattr(config.option, 'junitprefix', None))
+    backend = _backend(config)
+    ccache = None
+    if config.getoption('ccache_stats'):
+        ccache = CcacheStats(
+            check_output=getattr(backend, 'check_output', None))
+    config._cmdxml = Executor(backend, output, metrics, _cache(config),
+                              jobs=config.getoption('jobs'), ccache=ccache)
+
+
+def _backend(config):
+    """Return the '--backend' configured by the options."""
+    name = config.getoption('backend')
+    kwargs = {}
+    if name == 'docker':
+        kwargs = dict(
+            image=config.getoption('docker_image'),
+            runtime=config.getoption('docker_runtime'),
+            recycle=config.getoption('docker_recycle'),
+            volumes=config.getoption('docker_volume'),
+            env_vars=config.getoption('docker_env') or containers.ENV_VARS,
+            keep=config.getoption('docker_keep'))
+    return BACKENDS[name](**kwargs)
+
+
+def _output_dir(config):
+    """Return the '--output-dir' or a directory next to the junit report."""
+    output_dir = config.getoption('output_dir')
+    if output_dir is not None:
+        return output_dir
+    xmlpath = getattr(config.option, 'xmlpath', None) or '.'
+    return os.path.join(os.path.dirname(xmlpath), 'output')
+
+
+def _cache(config):
+    """Return the results cache if '--cache-dir' is given."""
+    cache_dir = config.getoption('cache_dir')
+    if cache_dir is None:
+        return None
+    return ResultCache(cache_dir,
+                       env_vars=config.getoption('cache_env') or ENV_VARS,
+                       inputs=config.getoption('cache_input'),
+                       ignore=config.getoption('cache_ignore'),
+                       max_size=config.getoption('cache_max_size'),
+                       refresh=config.getoption('cache_refresh'))
+
+
+def _metrics_json(config):
+    """Return the '--metrics-json' or the junit report path with '.json'."""
+    metrics_json = config.getoption('metrics_json')
+    if metrics_json is not None:
+        return metrics_json
+    xmlpath = getattr(config.option, 'xmlpath', None)
+    if xmlpath is None:
+        return None
+    return os.path.splitext(xmlpath)[0] + '.json'
+
+
+def pytest_collection_finish(session):
+    """Start executing the selected items when running in parallel.
+
+    Items marked as 'skip', for example by 'pytest_impact', are not executed.
+    """
+    items = [item for item in session.items
+             if item.get_closest_marker('skip') is None]
+    # pylint:disable=protected-access
+    session.config._cmdxml.start(_items_params(items))
+
+
+def pytest_sessionfinish(session):
+    """Stop the items executor."""
+    # pylint:disable=protected-access
+    session.config._cmdxml.stop()
 
 
 def pytest_generate_tests(metafunc):
@@ -58,3 +225,12 @@ def _filter_empty_fixtures(config, items):
         else:
             selected.append(item)
     return selected, deselected
+
+
+def _items_params(items):
+    """Return '(nodeid, fixture, value)' for items using a fixture option."""
+    for item in items:
+        params = getattr(getattr(item, 'callspec', None), 'params', {})
+        for fixture in FIXTURES:
+            if fixture in params:
+                yield item.nodeid, fixture, params[fixture]
@@ -0,0 +1,194 @@
+"""Backends executing the items with bash.
+
+* 'subprocess': one 'bash -xe' process per item, commands are first written to
+  a temporary file.
+* 'coprocess': one long-lived bash per worker thread reads the commands from a
+  pipe and executes each of them in a subshell, so the items cannot change
+  each other state. Scripts are still executed with 'subprocess'.
+* 'docker': one warm container per worker thread, see 'containers.py'.
+
+Output of the items is written to their 'log' file.
+
+Backends also measure the items 'wall_time', 'user_time', 'sys_time' and
+'maxrss' (peak RSS in kB) for the whole process tree when available.
+"""
+
+import os
+import time
+import tempfile
+import threading
+import subprocess
+
+# TODO: I think this should be configurable
+BASH_OPT = '-xe'
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+
+class Result():
+    """Outcome of a command or script execution.
+
+    'log' is the file with the full output and 'excerpt' the part of it that
+    goes to the report.
+    """
+
+    def __init__(self, returncode, log=None, excerpt='', metrics=None):
+        self.returncode = returncode
+        self.log = log
+        self.excerpt = excerpt
+        self.metrics = metrics or {}
+
+
+class SubprocessBackend():
+    """Execute each item in a new bash process."""
+
+    def command(self, command, log):
+        """Execute 'command' as a bash script."""
+        with tempfile.NamedTemporaryFile('w+') as script:
+            script.write(command)
+            script.flush()
+            return self.script(script.name, log)
+
+    @staticmethod
+    def script(path, log):
+        """Execute 'path' with bash, stdout and stderr are written to 'log'.
+
+        The process is waited with 'wait4' to get the resources used by it
+        and all its waited for descendants.
+        """
+        start = time.monotonic()
+        with open(log, 'wb') as logfd:
+            proc = subprocess.Popen(['bash', BASH_OPT, path],
+                                    stdout=logfd, stderr=subprocess.STDOUT)
+            _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = _exitcode(status)
+
+        metrics = {
+            'wall_time': time.monotonic() - start,
+            'user_time': rusage.ru_utime,
+            'sys_time': rusage.ru_stime,
+            'maxrss': rusage.ru_maxrss,
+        }
+        return Result(proc.returncode, log, metrics=metrics)
+
+    def close(self):
+        """Release the backend resources."""
+
+
+class CoprocessBackend(SubprocessBackend):
+    """Execute commands in a long-lived bash coprocess per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._coprocesses = []
+
+    def command(self, command, log):
+        """Execute 'command' in a subshell of the thread coprocess."""
+        coprocess = getattr(self._local, 'coprocess', None)
+        if coprocess is None or not coprocess.alive():
+            coprocess = self._local.coprocess = BashCoprocess()
+            with self._lock:
+                self._coprocesses.append(coprocess)
+        start = time.monotonic()
+        cpu_times = coprocess.children_times()
+        returncode = coprocess.execute(command, log)
+
+        metrics = {'wall_time': time.monotonic() - start}
+        if cpu_times is not None:
+            user, system = coprocess.children_times()
+            metrics['user_time'] = user - cpu_times[0]
+            metrics['sys_time'] = system - cpu_times[1]
+        return Result(returncode, log, metrics=metrics)
+
+    def close(self):
+        """Stop all the coprocesses."""
+        with self._lock:
+            for coprocess in self._coprocesses:
+                coprocess.close()
+            self._coprocesses = []
+
+
+class BashCoprocess():
+    """Long-lived bash executing commands received on its stdin.
+
+    Protocol: the log path and the command are sent NUL terminated. The
+    command is executed in a subshell with its output in the log file and
+    without stdin. When it finishes, the coprocess writes a status line:
+
+        cmdxml-status RETURNCODE
+
+    The 'set' is evaluated with the command so the trace, as with
+    'bash -xe file', only starts with the command itself.
+
+    The subshells are not waited by us, so their CPU time is read from the
+    coprocess children times in '/proc' and their peak RSS is not known.
+    """
+    STATUS = b'cmdxml-status '
+    LOOP = r'''
+    while IFS= read -r -d '' log && IFS= read -r -d '' cmd; do
+        ( eval "set {opt}"$'\n'"$cmd" ) >"$log" 2>&1 </dev/null
+        printf 'cmdxml-status %d\n' "$?"
+    done
+    '''.format(opt=BASH_OPT)
+
+    def __init__(self):
+        self.proc = subprocess.Popen(['bash', '-c', self.LOOP],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+
+    def alive(self):
+        """Coprocess is still running."""
+        return self.proc.poll() is None
+
+    def execute(self, command, log):
+        """Execute 'command' and return its exit code."""
+        request = b'%s\0%s\0' % (log.encode(), command.encode())
+        try:
+            self.proc.stdin.write(request)
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            raise RuntimeError('bash coprocess died') from None
+
+        status = self.proc.stdout.readline()
+        if not status.startswith(self.STATUS):
+            self.close()
+            raise RuntimeError('bash coprocess died: %r' % status)
+        return int(status[len(self.STATUS):])
+
+    def children_times(self):
+        """Return the coprocess waited for children user and sys time.
+
+        Returns None when not available.
+        """
+        try:
+            with open('/proc/{}/stat'.format(self.proc.pid)) as statfd:
+                stat = statfd.read()
+        except OSError:
+            return None
+        # 'comm' can contain spaces, fields are counted after it
+        fields = stat.rsplit(')', 1)[1].split()
+        cutime, cstime = int(fields[13]), int(fields[14])
+        return cutime / CLK_TCK, cstime / CLK_TCK
+
+    def close(self):
+        """Stop the coprocess, it exits when its stdin is closed."""
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.proc.wait()
+
+
+def _exitcode(status):
+    """Return a 'subprocess' returncode from a 'wait' status."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+# 'docker' is added by 'containers.py'
+BACKENDS = {
+    'subprocess': SubprocessBackend,
+    'coprocess': CoprocessBackend,
+}
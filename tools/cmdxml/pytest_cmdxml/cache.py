@@ -0,0 +1,184 @@
+"""Content addressed cache of the items results.
+
+Results are stored with a key computed from:
+
+* the item kind and command, or the script content
+* the selected environment variables values
+* a digest of the declared input paths content, without the 'ignore' paths
+  under them, for example the build output directories
+
+On a hit, the stored exit code, output excerpt and metrics are replayed
+instead of executing the item.
+
+Entries are JSON files in 'directory'. Their modification time is updated on
+each hit, so the least recently used are removed first when the total size
+goes over 'max_size'. The size is checked once, when the session stops.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+from .backends import Result
+
+ENV_VARS = ('BOARD', 'APPLICATION', 'RIOT_VERSION')
+MAX_SIZE = 100 * 1024 * 1024
+
+
+class ResultCache():
+    """Cache results in 'directory'.
+
+    With 'refresh', lookups always miss but results are still stored.
+    """
+
+    def __init__(self, directory, env_vars=ENV_VARS, inputs=(), ignore=(),
+                 max_size=MAX_SIZE, refresh=False):
+        # pylint:disable=too-many-arguments
+        self.directory = os.path.abspath(directory)
+        self.env_vars = env_vars
+        self.inputs = inputs
+        self.ignore = ignore
+        self.max_size = max_size
+        self.refresh = refresh
+        self._inputs_digest = None
+        self._lock = threading.Lock()
+
+    def key(self, kind, value):
+        """Return the cache key for item 'kind' 'value'."""
+        if kind == 'script':
+            try:
+                value = _file_digest(value)
+            except OSError:
+                pass
+        keydata = {
+            'kind': kind,
+            'value': value,
+            'env': {var: os.environ.get(var) for var in self.env_vars},
+            'inputs': self.inputs_digest(),
+        }
+        keydata = json.dumps(keydata, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(keydata).hexdigest()
+
+    def inputs_digest(self):
+        """Digest of the input paths, computed only once."""
+        with self._lock:
+            if self._inputs_digest is None:
+                self._inputs_digest = _paths_digest(self.inputs,
+                                                    self.ignore)
+            return self._inputs_digest
+
+    def get(self, key, log):
+        """Return the cached result for 'key' or None.
+
+        The excerpt is written to 'log' as it replaces the output.
+        """
+        if self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as entryfd:
+                entry = json.load(entryfd)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        excerpt = 'Cached result from {}\n{}'.format(
+            time.ctime(entry['created']), entry['excerpt'])
+        with open(log, 'w') as logfd:
+            logfd.write(excerpt)
+
+        metrics = dict(entry['metrics'], cached=True)
+        return Result(entry['returncode'], log, excerpt, metrics)
+
+    def put(self, key, result):
+        """Store 'result' for 'key'."""
+        entry = {
+            'created': time.time(),
+            'returncode': result.returncode,
+            'excerpt': result.excerpt,
+            'metrics': result.metrics,
+        }
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write and rename to never have partial entries
+        # The directory can be shared by concurrent sessions
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(),
+                                         threading.get_ident())
+        with open(tmp_path, 'w') as entryfd:
+            json.dump(entry, entryfd)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """Evict old entries at the end of the session."""
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries above 'max_size'."""
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith('.json'):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size,
+                                    os.path.join(root, name)))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+
+def _file_digest(path, digest=None):
+    """Update 'digest' with 'path' content or return a new hex digest."""
+    hexdigest = digest is None
+    digest = hashlib.sha256() if digest is None else digest
+    with open(path, 'rb') as pathfd:
+        for chunk in iter(lambda: pathfd.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest() if hexdigest else digest
+
+
+def _paths_digest(paths, ignore=()):
+    """Digest of the files names and content in 'paths', walked sorted."""
+    digest = hashlib.sha256()
+    ignore = {os.path.abspath(path) for path in ignore}
+    for path in sorted(paths):
+        for filepath in _walk_files(path, ignore):
+            digest.update(filepath.encode('utf-8') + b'\0')
+            try:
+                _file_digest(filepath, digest)
+            except OSError:
+                digest.update(b'\0unreadable\0')
+    return digest.hexdigest()
+
+
+def _walk_files(path, ignore=()):
+    """Files in 'path' in a stable order.
+
+    '.git' directories and the 'ignore' absolute paths are skipped.
+    """
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(
+            d for d in dirs if d != '.git' and
+            os.path.abspath(os.path.join(root, d)) not in ignore)
+        for name in sorted(files):
+            yield os.path.join(root, name)
@@ -0,0 +1,103 @@
+"""Compiler cache statistics of the items.
+
+The compiler cache itself is configured through the environment, 'CCACHE_DIR'
+and 'CCACHE_MAXSIZE', see 'clean_all.mk.pre'. 'ccache' keeps the cache under
+its maximum size by removing the least recently used files.
+
+The statistics are read with 'ccache --print-stats' before and after each
+item, the difference gives the item hits and misses. 'ccache' before 3.7 does
+not have it, the 'ccache -s' human readable output is parsed instead. When
+none works, a warning is printed once and the items get no ccache metrics.
+With '--jobs', the items running at the same time are counted in each other
+statistics.
+
+'ccache' is executed where the items are, given by 'check_output', so with the
+'docker' backend it reads the statistics in the worker container.
+"""
+
+import re
+import sys
+import subprocess
+
+# 'ccache --print-stats' counters
+HITS = ('direct_cache_hit', 'preprocessed_cache_hit')
+MISSES = ('cache_miss',)
+# 'ccache -s' lines for the same counters
+SUMMARY_COUNTERS = {
+    'cache hit (direct)': 'direct_cache_hit',
+    'cache hit (preprocessed)': 'preprocessed_cache_hit',
+    'cache miss': 'cache_miss',
+}
+SUMMARY_RE = re.compile(r'^(?P<name>\S.*?)\s+(?P<value>\d+)$')
+
+
+def _check_output(args):
+    return subprocess.check_output(args, stderr=subprocess.DEVNULL,
+                                   universal_newlines=True)
+
+
+class CcacheStats():
+    """Measure the 'ccache' hits and misses of the items.
+
+    'check_output(args)' returns the output of 'args', on the host by default.
+    """
+
+    def __init__(self, ccache='ccache', check_output=None):
+        self.ccache = ccache
+        self.check_output = check_output or _check_output
+        self._warned = False
+
+    def snapshot(self):
+        """Return the 'ccache' counters or None if not available."""
+        for option, parse in (('--print-stats', self._parse_stats),
+                              ('-s', self._parse_summary)):
+            try:
+                output = self.check_output([self.ccache, option])
+            except (OSError, subprocess.CalledProcessError):
+                continue
+            counters = parse(output)
+            if counters:
+                return counters
+        self._warn()
+        return None
+
+    @staticmethod
+    def _parse_stats(output):
+        """Counters from the tab separated 'ccache --print-stats' output."""
+        counters = {}
+        for line in output.splitlines():
+            fields = line.split('\t')
+            if len(fields) == 2 and fields[1].isdigit():
+                counters[fields[0]] = int(fields[1])
+        return counters
+
+    @staticmethod
+    def _parse_summary(output):
+        """Counters from 'ccache -s', with the '--print-stats' names."""
+        counters = {}
+        for line in output.splitlines():
+            match = SUMMARY_RE.match(line.strip())
+            if match and match.group('name') in SUMMARY_COUNTERS:
+                name = SUMMARY_COUNTERS[match.group('name')]
+                counters[name] = int(match.group('value'))
+        return counters
+
+    def _warn(self):
+        if not self._warned:
+            print('cmdxml: ccache statistics not available, '
+                  '"{} --print-stats" and "-s" failed'.format(self.ccache),
+                  file=sys.stderr)
+            self._warned = True
+
+    @staticmethod
+    def metrics(before, after):
+        """Return the hits and misses metrics between two snapshots."""
+        if before is None or after is None:
+            return {}
+        hits = sum(after.get(name, 0) - before.get(name, 0) for name in HITS)
+        misses = sum(after.get(name, 0) - before.get(name, 0)
+                     for name in MISSES)
+        metrics = {'ccache_hits': hits, 'ccache_misses': misses}
+        if hits + misses:
+            metrics['ccache_hit_rate'] = hits / (hits + misses)
+        return metrics
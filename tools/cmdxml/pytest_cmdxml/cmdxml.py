@@ -1,28 +1,23 @@
 """Hardwritten 'test' file for 'cmdxml'"""
+# pylint:disable=redefined-outer-name
 
-import tempfile
-import subprocess
+import pytest
 
-# TODO: I think this should be configurable
-BASH_OPT = '-xe'
+from pytest_cmdxml.executor import ItemExecutor
 
 
-def test_command(command):
-    """Execute given test command."""
-    assert _execute_command(command) == 0
-
-
-def test_script(script):
-    """Execute given script."""
-    assert _execute_script(script) == 0
+@pytest.fixture
+def executor(request):
+    """Return the executor for the current item 'command' or 'script'."""
+    # pylint:disable=protected-access
+    return ItemExecutor(request.config._cmdxml, request.node)
 
 
-def _execute_command(command):
-    with tempfile.NamedTemporaryFile('w+') as script:
-        script.write(command)
-        script.flush()
-        return _execute_script(script.name)
+def test_command(command, executor):
+    """Execute given test command."""
+    assert executor.command(command) == 0
 
 
-def _execute_script(path):
-    return subprocess.call(['bash', BASH_OPT, path])
+def test_script(script, executor):
+    """Execute given script."""
+    assert executor.script(script) == 0
@@ -0,0 +1,318 @@
+"""Backend executing the items in warm build containers.
+
+Starting a container for each build costs the container creation and the
+volumes setup. Instead, one container per worker thread is started from the
+toolchain image with 'sleep infinity' and the items are executed in it with
+'docker exec'. The container is recycled, removed and started again on the
+next item, after 'recycle' items or when an item failed.
+
+With 'keep', the containers are not removed at the end of the session and
+are reused by the next ones, the number of items they executed is saved in
+the container. Their name is made from the image, the volumes and an index.
+Each worker leases the first index not used by another session with a 'flock'
+on a file in 'LOCK_DIR', so concurrent sessions get their own containers. The
+file is removed when the session ends.
+
+The 'local' runtime is a stand-in executing the items on the host, with the
+same recycling and metrics, to use the backend without docker.
+
+Items get the 'container_startup' time when they started the container, the
+'container_overhead' of a 'docker exec' and the 'container_builds' number of
+items executed in the container.
+
+'check_output' executes a command in the worker container, to read the
+'ccache' statistics where the items are built. When it starts the container,
+the startup time goes to the next item.
+"""
+
+import os
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+import subprocess
+
+from .backends import BASH_OPT, BACKENDS, Result
+
+IMAGE = 'riot/riotbuild:latest'
+RUNTIME = 'docker'
+RECYCLE = 50
+# Environment variables given to the items in the container
+ENV_VARS = ('BOARD', 'APPLICATION', 'RIOT_VERSION', 'RIOT_CCACHE',
+            'CCACHE_DIR', 'CCACHE_MAXSIZE', 'CCACHE_BASEDIR')
+
+BUILDS_FILE = '/tmp/cmdxml-builds'
+# Lock files of the containers names leased by the sessions
+LOCK_DIR = tempfile.gettempdir()
+
+
+class ContainerBackend():
+    """Execute the items in a warm container per worker thread."""
+
+    def __init__(self, image=IMAGE, runtime=RUNTIME, recycle=RECYCLE,
+                 volumes=(), env_vars=ENV_VARS, keep=False):
+        # pylint:disable=too-many-arguments
+        self.image = image
+        self.runtime = runtime
+        self.recycle = recycle
+        self.volumes = [os.path.abspath(v) for v in volumes or [os.getcwd()]]
+        self.env_vars = env_vars
+        self.keep = keep
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._containers = []
+        self._leases = []
+
+    def command(self, command, log):
+        """Execute 'command' with bash in the container."""
+        return self._execute(['bash', BASH_OPT, '-c', command], log)
+
+    def script(self, path, log):
+        """Execute 'path' with bash in the container.
+
+        'path' must be in one of the volumes.
+        """
+        return self._execute(['bash', BASH_OPT, os.path.abspath(path)], log)
+
+    def check_output(self, args):
+        """Return the output of 'args' executed in the container."""
+        container = self._container()
+        if not container.running:
+            container.start()
+        return container.check_output(args)
+
+    def _execute(self, args, log):
+        container = self._container()
+        metrics = {}
+        if not container.running:
+            container.start()
+        if container.startup is not None:
+            metrics['container_startup'] = container.startup
+            container.startup = None
+
+        start = time.monotonic()
+        returncode = container.execute(args, log)
+        metrics['wall_time'] = time.monotonic() - start
+        metrics['container_overhead'] = container.overhead
+        metrics['container_builds'] = container.builds
+
+        if returncode != 0 or container.builds >= self.recycle:
+            container.remove()
+        return Result(returncode, log, metrics=metrics)
+
+    def _container(self):
+        """Return the current thread container."""
+        container = getattr(self._local, 'container', None)
+        if container is None:
+            with self._lock:
+                name = self._lease_name()
+                if self.runtime == 'local':
+                    container = LocalContainer(name)
+                else:
+                    container = DockerContainer(
+                        name, self.image, self.volumes, self.env_vars,
+                        runtime=self.runtime)
+                self._containers.append(container)
+            self._local.container = container
+        return container
+
+    def _name(self, index):
+        """Container name, the same for the same configuration."""
+        config = '\0'.join([self.image] + self.volumes)
+        digest = hashlib.sha1(config.encode('utf-8')).hexdigest()[:12]
+        return 'cmdxml-{}-{}'.format(digest, index)
+
+    def _lease_name(self):
+        """Return the first container name not leased by another worker.
+
+        The lease is a 'flock' on the name lock file kept until 'close'.
+        The file is removed on 'close', a lock taken on a file removed since
+        it was opened is taken again on the new file.
+        """
+        index = 0
+        while True:
+            name = self._name(index)
+            path = os.path.join(LOCK_DIR, name + '.lock')
+            lockfd = open(path, 'w')
+            try:
+                fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lockfd.close()
+                index += 1
+                continue
+            if not _same_file(lockfd, path):
+                lockfd.close()
+                continue
+            self._leases.append(lockfd)
+            return name
+
+    def close(self):
+        """Remove the containers, unless 'keep', and release their names."""
+        with self._lock:
+            for container in self._containers:
+                if not self.keep:
+                    container.remove()
+            self._containers = []
+            for lockfd in self._leases:
+                # Removed while locked, see '_lease_name'
+                os.unlink(lockfd.name)
+                lockfd.close()
+            self._leases = []
+
+
+def _same_file(fileobj, path):
+    """Return if 'path' is still the opened 'fileobj'."""
+    try:
+        return os.path.samestat(os.fstat(fileobj.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+class DockerContainer():
+    """Container running 'sleep infinity' to execute items with 'exec'.
+
+    An already running container with the same name is reused.
+    """
+
+    def __init__(self, name, image, volumes, env_vars, runtime=RUNTIME):
+        # pylint:disable=too-many-arguments
+        self.name = name
+        self.image = image
+        self.volumes = volumes
+        self.env_vars = env_vars
+        self.runtime = runtime
+        self.running = False
+        self.builds = 0
+        self.overhead = None
+        self.startup = None
+
+    def start(self):
+        """Start or reuse the container, return the time it took."""
+        start = time.monotonic()
+        if self._inspect_running():
+            self.builds = self._saved_builds()
+        else:
+            self._call(['rm', '--force', self.name])
+            self.builds = 0
+            cmd = ['run', '--detach', '--init', '--name', self.name,
+                   '--user', '{}:{}'.format(os.getuid(), os.getgid()),
+                   '--entrypoint', 'sleep']
+            for volume in self.volumes:
+                cmd += ['--volume', '{0}:{0}'.format(volume)]
+            if self._runtime(subprocess.call, cmd + [self.image, 'infinity'],
+                             stdout=subprocess.DEVNULL) != 0:
+                raise RuntimeError('Could not start container %s' % self.name)
+        self.startup = time.monotonic() - start
+
+        self.running = True
+        overhead_start = time.monotonic()
+        self._call(['exec', self.name, 'true'])
+        self.overhead = time.monotonic() - overhead_start
+        return self.startup
+
+    def execute(self, args, log):
+        """Execute 'args' in the current directory, output in 'log'.
+
+        The number of builds is incremented in the container before.
+        """
+        self.builds += 1
+        count = 'echo {} > {}; exec "$@"'.format(self.builds, BUILDS_FILE)
+        cmd = self._exec() + ['sh', '-c', count, 'sh'] + args
+        with open(log, 'wb') as logfd:
+            return subprocess.call(cmd, stdout=logfd, stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL)
+
+    def check_output(self, args):
+        """Return the output of 'args' executed in the container."""
+        return subprocess.check_output(self._exec() + args,
+                                       stderr=subprocess.DEVNULL,
+                                       universal_newlines=True)
+
+    def _exec(self):
+        """'exec' command with the current directory and environment."""
+        cmd = [self.runtime, 'exec', '--workdir', os.getcwd()]
+        for var in self.env_vars:
+            if var in os.environ:
+                cmd += ['--env', var]
+        return cmd + [self.name]
+
+    def remove(self):
+        """Remove the container."""
+        if self.running:
+            self._call(['rm', '--force', self.name])
+        self.running = False
+
+    def _inspect_running(self):
+        try:
+            output = self._runtime(
+                subprocess.check_output,
+                ['inspect', '--format', '{{.State.Running}}', self.name],
+                stderr=subprocess.DEVNULL, universal_newlines=True)
+        except subprocess.CalledProcessError:
+            return False
+        return output.strip() == 'true'
+
+    def _saved_builds(self):
+        try:
+            output = subprocess.check_output(
+                [self.runtime, 'exec', self.name, 'cat', BUILDS_FILE],
+                stderr=subprocess.DEVNULL, universal_newlines=True)
+            return int(output)
+        except (subprocess.CalledProcessError, ValueError):
+            return 0
+
+    def _call(self, args):
+        return self._runtime(subprocess.call, args, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+
+    def _runtime(self, function, args, **kwargs):
+        """Call 'function' with the runtime command 'args'."""
+        try:
+            return function([self.runtime] + args, **kwargs)
+        except FileNotFoundError:
+            raise RuntimeError('Container runtime %s not found' %
+                               self.runtime) from None
+
+
+class LocalContainer():
+    """Stand-in for 'DockerContainer' executing the items on the host."""
+
+    def __init__(self, name):
+        self.name = name
+        self.running = False
+        self.builds = 0
+        self.overhead = None
+        self.startup = None
+
+    def start(self):
+        """Start a new 'container', return the time it took."""
+        start = time.monotonic()
+        self.running = True
+        self.builds = 0
+        self.startup = time.monotonic() - start
+        overhead_start = time.monotonic()
+        subprocess.call(['true'])
+        self.overhead = time.monotonic() - overhead_start
+        return self.startup
+
+    def execute(self, args, log):
+        """Execute 'args' on the host, output in 'log'."""
+        self.builds += 1
+        with open(log, 'wb') as logfd:
+            return subprocess.call(args, stdout=logfd,
+                                   stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL)
+
+    @staticmethod
+    def check_output(args):
+        """Return the output of 'args' executed on the host."""
+        return subprocess.check_output(args, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True)
+
+    def remove(self):
+        """Forget the 'container'."""
+        self.running = False
+
+
+BACKENDS['docker'] = ContainerBackend
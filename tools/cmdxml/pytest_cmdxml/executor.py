@@ -0,0 +1,118 @@
+"""Execution of the 'command' and 'script' items.
+
+Items are either executed directly when the test runs, or with '--jobs N',
+submitted all at once on a bounded pool when the collection is finished.
+Tests then only wait for their own result so they are still run and reported
+by pytest in the collection order.
+
+Items are executed by a backend, see 'backends.py'. The output is not kept in
+memory but written to a log file per item, see 'output.py'. Resources used are
+recorded, see 'metrics.py', with the compiler cache statistics if enabled,
+see 'ccache.py'. Results can be replayed from a cache, see 'cache.py'.
+"""
+
+import sys
+import concurrent.futures
+
+
+class Executor():
+    """Run items, sequentially or in parallel on 'jobs' workers.
+
+    Each worker only waits for its bash process, so a threads pool is enough
+    to bound the number of running processes.
+    """
+
+    def __init__(self, backend, output, metrics, cache=None, jobs=1,
+                 ccache=None):
+        # pylint:disable=too-many-arguments
+        self.backend = backend
+        self.output = output
+        self.metrics = metrics
+        self.cache = cache
+        self.jobs = jobs
+        self.ccache = ccache
+        self._pool = None
+        self._futures = {}
+
+    def start(self, items):
+        """Submit all items '(nodeid, kind, value)' when running in parallel.
+
+        Submission is done in the items order, so they also start in order.
+        """
+        if self.jobs <= 1:
+            return
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        for nodeid, kind, value in items:
+            future = self._pool.submit(self._execute, nodeid, kind, value)
+            self._futures[nodeid] = future
+
+    def stop(self):
+        """Cancel not started items and wait for the running ones."""
+        if self._pool is not None:
+            for future in self._futures.values():
+                future.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self.backend.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.metrics.write()
+
+    def run(self, node, kind, value):
+        """Return the result for item 'node'.
+
+        The output excerpt is written to 'stderr' so it is captured for this
+        item only.
+        """
+        future = self._futures.pop(node.nodeid, None)
+        if future is None:
+            result = self._execute(node.nodeid, kind, value)
+        else:
+            result = future.result()
+
+        sys.stderr.write(result.excerpt)
+        self.metrics.record(node, kind, value, result)
+        return result
+
+    def _execute(self, nodeid, kind, value):
+        log = self.output.path(nodeid)
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(kind, value)
+            result = self.cache.get(key, log)
+            if result is not None:
+                return result
+
+        execute = getattr(self.backend, kind)
+        if self.ccache is None:
+            result = execute(value, log)
+        else:
+            before = self.ccache.snapshot()
+            result = execute(value, log)
+            result.metrics.update(
+                self.ccache.metrics(before, self.ccache.snapshot()))
+        result.excerpt = self.output.excerpt(result.log)
+
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+
+class ItemExecutor():
+    """Executor fixture for one test item."""
+
+    def __init__(self, executor, node):
+        self._executor = executor
+        self._node = node
+
+    def command(self, command):
+        """Execute 'command' and return its exit code."""
+        return self._executor.run(self._node, 'command', command).returncode
+
+    def script(self, script):
+        """Execute 'script' and return its exit code."""
+        return self._executor.run(self._node, 'script', script).returncode
+
+    def __repr__(self):
+        return 'executor'
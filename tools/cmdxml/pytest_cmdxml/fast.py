@@ -0,0 +1,452 @@
+"""Native 'cmdxml' runner, without pytest.
+
+'cmdxml --fast' executes the commands and scripts directly and writes the
+same junit-xml report as pytest running 'cmdxml.py'. The pytest import,
+plugins loading, collection and parametrization are not paid for each call.
+
+Only the arguments needed for that are handled:
+
+* the 'pytest_cmdxml' options
+* '--junit-xml', '--junit-prefix' and '-o junit_suite_name=NAME'
+* '-o junit_family=xunit1', the pytest 5.3 default
+* '-p pytest_jenkins' for its 'BOARD.APPLICATION' classname split
+* '--verbosity', '-v', '-q' and '--tb=short'
+
+With any other argument, with 'PYTEST_ADDOPTS' set, or when the installed
+pytest is not 5.3, 'run' returns None and pytest must be used instead.
+
+The report follows pytest 5.3 'junitxml' with the 'xunit1' family, the pytest
+version 'pytest_jenkins' needs, so it is only written when that pytest is
+installed and can run, before python 3.10. Testcases names are the pytest
+parametrized names with the test 'file' and 'line', properties are the items
+metrics, the output excerpt is in 'system-err' and a failure has the assertion
+explanation as message and the short traceback as text. It is written as
+'py.xml' does, with sorted attributes. Only the times, the timestamp and the
+hostname differ.
+Items raising an exception, not the assertion, have a simplified failure.
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import reprlib
+import argparse
+import platform
+import datetime
+import contextlib
+import collections
+
+import pytest_cmdxml
+from .executor import ItemExecutor
+
+SUITE_NAME = 'pytest'
+JUNIT_FAMILY = 'xunit1'
+# pytest version writing the same report, it does not run after python 3.9
+PYTEST_VERSION = '5.3.'
+PYTHON_MAX = (3, 10)
+JENKINS_PLUGIN = 'pytest_jenkins'
+PLUGINS = (JENKINS_PLUGIN, 'no:cacheprovider')
+# pytest repr size for assertions
+REPR_MAX_SIZE = 240
+EXIT_OK, EXIT_FAILED, EXIT_NO_TESTS = 0, 1, 5
+
+# pytest 'bin_xml_escape' invalid XML characters
+ILLEGAL_XML = re.compile(r'[^\u0009\u000a\u000d\u0020-\u007e\u0080-\ud7ff'
+                         r'\ue000-\ufffd\U00010000-\U0010ffff]')
+# 'py.xml' escaped characters, in text and attributes
+XML_ESCAPES = {'"': '&quot;', '<': '&lt;', '>': '&gt;', '&': '&amp;',
+               "'": '&apos;'}
+XML_ESCAPE_RE = re.compile('|'.join(XML_ESCAPES))
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """Parser raising 'ValueError' instead of exiting."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+    def addoption(self, *opts, **attrs):
+        """'pytest_addoption' parser interface."""
+        self.add_argument(*opts, **attrs)
+
+
+class _Config():
+    """'pytest' config interface used by 'pytest_cmdxml.pytest_configure'."""
+
+    def __init__(self, option):
+        self.option = option
+        self._cmdxml = None
+
+    def getoption(self, name):
+        """Return option 'name' value."""
+        return getattr(self.option, name)
+
+
+class _Node():
+    """Item node interface used by the executor."""
+
+    def __init__(self, nodeid):
+        self.nodeid = nodeid
+        self.user_properties = []
+
+
+def parser():
+    """Return the arguments parser, with the 'pytest_cmdxml' options."""
+    argparser = _ArgumentParser(add_help=False, allow_abbrev=False)
+    pytest_cmdxml.pytest_addoption(argparser)
+    argparser.add_argument('paths', nargs='*')
+    argparser.add_argument('--fast', action='store_true')
+    argparser.add_argument('--junit-xml', '--junitxml', dest='xmlpath')
+    argparser.add_argument('--junit-prefix', '--junitprefix',
+                           dest='junitprefix')
+    argparser.add_argument('-o', '--override-ini', dest='override_ini',
+                           action='append', default=[])
+    argparser.add_argument('-p', dest='plugins', action='append', default=[])
+    argparser.add_argument('-v', '--verbose', action='count', default=0)
+    argparser.add_argument('-q', '--quiet', action='count', default=0)
+    argparser.add_argument('--verbosity', type=int, default=0)
+    argparser.add_argument('--tb', dest='tbstyle', default='auto')
+    return argparser
+
+
+def supported_pytest():
+    """Return if the installed pytest writes the same report as 'run'.
+
+    The version is read from the package metadata, pytest is not imported.
+    """
+    if sys.version_info >= PYTHON_MAX:
+        return False
+    # pylint:disable=import-outside-toplevel
+    try:
+        from importlib import metadata
+    except ImportError:
+        return False
+    try:
+        return metadata.version('pytest').startswith(PYTEST_VERSION)
+    except metadata.PackageNotFoundError:
+        return False
+
+
+def parse_args(args):
+    """Return the options or None if not supported."""
+    if os.environ.get('PYTEST_ADDOPTS') or not supported_pytest():
+        return None
+    try:
+        opts, unknown = parser().parse_known_args(args)
+    except ValueError:
+        return None
+    if unknown or opts.paths != pytest_cmdxml.PYTEST_ARGS:
+        return None
+    if set(opts.plugins) - set(PLUGINS) or opts.tbstyle != 'short':
+        return None
+
+    opts.suite_name = SUITE_NAME
+    for override in opts.override_ini:
+        name, sep, value = override.partition('=')
+        if name == 'junit_suite_name' and sep:
+            opts.suite_name = value
+        elif name != 'junit_family' or value != JUNIT_FAMILY:
+            return None
+    return opts
+
+
+def run(args):
+    """Run the items for 'args' and return the exit code.
+
+    Returns None if 'args' are not supported.
+    """
+    opts = parse_args(args)
+    if opts is None:
+        return None
+    verbosity = opts.verbosity + opts.verbose - opts.quiet
+    start = time.time()
+
+    config = _Config(opts)
+    pytest_cmdxml.pytest_configure(config)
+    executor = config._cmdxml  # pylint:disable=protected-access
+
+    items = list(_items(opts))
+    executor.start(items)
+    testcases = []
+    failed = 0
+    try:
+        for nodeid, kind, value in items:
+            testcase = _run_item(executor, nodeid, kind, value, verbosity)
+            failed += testcase.failure is not None
+            testcases.append(testcase)
+    finally:
+        executor.stop()
+
+    if opts.xmlpath:
+        jenkins = JENKINS_PLUGIN in opts.plugins
+        write_report(opts.xmlpath, opts, testcases, start, jenkins)
+        if verbosity >= 0:
+            print('generated xml file: {}'.format(
+                _logfile(opts.xmlpath)))
+
+    print(_summary(failed, len(testcases) - failed, time.time() - start))
+    if not testcases:
+        return EXIT_NO_TESTS
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def _summary(failed, passed, duration):
+    """pytest final line, the outcomes without the zero counts."""
+    outcomes = ['{} {}'.format(count, outcome)
+                for count, outcome in ((failed, 'failed'), (passed, 'passed'))
+                if count]
+    return '{} in {:.2f}s'.format(', '.join(outcomes) or 'no tests ran',
+                                  duration)
+
+
+class Testcase():
+    """Result of an item for the report."""
+
+    def __init__(self, nodeid, kind, duration, properties, failure=None,
+                 excerpt=''):
+        # pylint:disable=too-many-arguments
+        self.nodeid = nodeid
+        self.kind = kind
+        self.duration = duration
+        self.properties = properties
+        self.failure = failure
+        self.excerpt = excerpt
+
+
+def _run_item(executor, nodeid, kind, value, verbosity):
+    """Execute the item, print its outcome and return its 'Testcase'."""
+    node = _Node(nodeid)
+    item_executor = ItemExecutor(executor, node)
+    excerpt = io.StringIO()
+    start = time.monotonic()
+    with contextlib.redirect_stderr(excerpt):
+        try:
+            returncode = getattr(item_executor, kind)(value)
+            failure = None
+            if returncode != 0:
+                failure = _assertion_failure(kind, value, returncode,
+                                             verbosity)
+        except Exception as err:  # pylint:disable=broad-except
+            failure = ('{}: {}'.format(type(err).__name__, err),) * 2
+    duration = time.monotonic() - start
+
+    outcome = 'PASSED' if failure is None else 'FAILED'
+    if verbosity > 0:
+        print('{} {}'.format(nodeid, outcome))
+    if failure is not None:
+        print('_' * 20 + ' {} '.format(nodeid.rsplit('::', 1)[-1]) + '_' * 20)
+        print(failure[1])
+        print('-' * 20 + ' Captured stderr call ' + '-' * 20)
+        print(excerpt.getvalue(), end='')
+    return Testcase(nodeid, kind, duration, node.user_properties, failure,
+                    excerpt.getvalue())
+
+
+def _items(opts):
+    """Yield '(nodeid, kind, value)' as pytest collects 'cmdxml.py'.
+
+    Kinds without values are not yielded, pytest deselects them.
+    """
+    path = _test_path()
+    for kind in pytest_cmdxml.FIXTURES:
+        values = getattr(opts, kind)
+        for value, param_id in zip(values, _param_ids(values)):
+            yield '{}::test_{}[{}]'.format(path, kind, param_id), kind, value
+
+
+def _test_path():
+    """'cmdxml.py' path relative to the pytest rootdir.
+
+    Without configuration file, the pytest rootdir is the first directory
+    with a 'setup.py' from the test file directory.
+    """
+    directory = pytest_cmdxml.CURDIR
+    while True:
+        if os.path.isfile(os.path.join(directory, 'setup.py')):
+            break
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            directory = pytest_cmdxml.CURDIR
+            break
+        directory = parent
+    return os.path.relpath(pytest_cmdxml.TEST_FILE, directory).replace(
+        os.sep, '/')
+
+
+def _param_ids(values):
+    """pytest ids for string parameters, duplicates get a counter."""
+    ids = [value.encode('unicode_escape').decode('ascii') for value in values]
+    counts = collections.Counter(ids)
+    suffixes = collections.defaultdict(int)
+    used = set(ids)
+    for index, param_id in enumerate(ids):
+        if counts[param_id] <= 1:
+            continue
+        separator = '_' if param_id and param_id[-1].isdigit() else ''
+        new_id = '{}{}{}'.format(param_id, separator, suffixes[param_id])
+        while new_id in used:
+            suffixes[param_id] += 1
+            new_id = '{}{}{}'.format(param_id, separator, suffixes[param_id])
+        used.add(new_id)
+        ids[index] = new_id
+        suffixes[param_id] += 1
+    return ids
+
+
+def _assertion_failure(kind, value, returncode, verbosity):
+    """Return pytest assertion '(message, short traceback)' for the item.
+
+    It is the pytest 5.3 rewritten 'assert executor.KIND(KIND) == 0'
+    explanation. With '-v', the comparison diff replaces the 'where' lines.
+    """
+    if verbosity > 0:
+        message = 'assert {0} == 0\n  -{0}\n  +0'.format(returncode)
+    else:
+        method = '<bound method ItemExecutor.{} of executor>'.format(kind)
+        message = ('assert {0} == 0\n'
+                   ' +  where {0} = {1}({2})\n'
+                   ' +    where {1} = executor.{3}').format(
+                       _saferepr(returncode), method, _saferepr(value), kind)
+    # pytest only strips the exception name when its repr starts with
+    # "AssertionError('assert ", so it depends on the quotes in the message
+    if not repr(message).startswith("'"):
+        message = 'AssertionError: ' + message
+
+    lineno, source = _test_line(kind, 'assert executor.{0}({0})'.format(kind))
+    path = pytest_cmdxml.TEST_FILE
+    relpath = os.path.relpath(path)
+    if len(relpath) < len(path):
+        path = relpath
+    lines = ['{}:{}: in test_{}'.format(path, lineno, kind),
+             '    ' + source.strip()]
+    lines += ['E   ' + line for line in message.split('\n')]
+    return message, '\n'.join(lines)
+
+
+def _test_line(kind, statement):
+    """Return the 'test_KIND' line number and source starting 'statement'."""
+    with open(pytest_cmdxml.TEST_FILE) as testfd:
+        for lineno, line in enumerate(testfd, 1):
+            if line.strip().startswith(statement):
+                return lineno, line
+    return 0, statement
+
+
+def _saferepr(obj):
+    """pytest 'saferepr' for the items values and return codes."""
+    reprobj = reprlib.Repr()
+    reprobj.maxstring = REPR_MAX_SIZE
+    text = reprobj.repr(obj)
+    if len(text) > REPR_MAX_SIZE:
+        i = max(0, (REPR_MAX_SIZE - 3) // 2)
+        j = max(0, REPR_MAX_SIZE - 3 - i)
+        text = text[:i] + '...' + text[len(text) - j:]
+    return text.replace('\n', '\\n')
+
+
+def write_report(xmlpath, opts, testcases, start, jenkins=False):
+    """Write the junit-xml report as pytest 'junitxml'."""
+    failed = sum(testcase.failure is not None for testcase in testcases)
+    by_kind = collections.defaultdict(list)
+    for testcase in testcases:
+        by_kind[testcase.kind].append(testcase)
+    elements = [_testcase_element(testcase, opts.junitprefix, jenkins)
+                for kind in pytest_cmdxml.FIXTURES
+                for testcase in by_kind[kind]]
+
+    suite = _element(
+        'testsuite', ''.join(elements), name=opts.suite_name, errors=0,
+        failures=failed, skipped=0, tests=len(testcases),
+        time='{:.3f}'.format(time.time() - start),
+        timestamp=datetime.datetime.fromtimestamp(start).isoformat(),
+        hostname=platform.node())
+
+    logfile = _logfile(xmlpath)
+    os.makedirs(os.path.dirname(logfile), exist_ok=True)
+    with open(logfile, 'w', encoding='utf-8') as xmlfd:
+        xmlfd.write('<?xml version="1.0" encoding="utf-8"?>')
+        xmlfd.write(_element('testsuites', suite))
+
+
+def _logfile(xmlpath):
+    """Report path as expanded by pytest."""
+    xmlpath = os.path.expanduser(os.path.expandvars(xmlpath))
+    return os.path.normpath(os.path.abspath(xmlpath))
+
+
+def _testcase_element(testcase, prefix, jenkins):
+    """'testcase' element with the pytest 'junitxml' names."""
+    path, bracket, params = testcase.nodeid.partition('[')
+    names = path.split('::')
+    names[0] = names[0].replace('/', '.')
+    if names[0].endswith('.py'):
+        names[0] = names[0][:-len('.py')]
+    names[-1] += bracket + params
+
+    classnames = names[:-1]
+    if prefix:
+        classnames.insert(0, prefix)
+    classname = '.'.join(classnames)
+    name = names[-1]
+    # 'pytest_jenkins' only keeps 2 elements in 'classname'
+    classnames = classname.split('.')
+    if jenkins and len(classnames) > 2:
+        name = '.'.join(classnames[2:] + [name])
+        classname = '.'.join(classnames[:2])
+
+    content = ''
+    if testcase.properties:
+        content += _element('properties', ''.join(
+            _element('property', name=str(prop), value=_Raw(_bin_xml_escape(
+                str(value)))) for prop, value in testcase.properties))
+    if testcase.failure is not None:
+        message, text = testcase.failure
+        content += _element('failure', _bin_xml_escape(text),
+                            message=_Raw(_bin_xml_escape(message)))
+    if testcase.excerpt:
+        content += _element('system-err', _bin_xml_escape(testcase.excerpt))
+
+    # pytest location line number starts at 0
+    line, _ = _test_line(testcase.kind, 'def test_{}('.format(testcase.kind))
+    return _element('testcase', content, classname=classname,
+                    name=_Raw(_bin_xml_escape(name)),
+                    file=testcase.nodeid.split('::')[0], line=line - 1,
+                    time='{:.3f}'.format(testcase.duration))
+
+
+class _Raw(str):
+    """Attribute value already escaped."""
+
+
+def _element(tag, content=None, **attrs):
+    """'py.xml' element, 'content' is already escaped.
+
+    Attributes are sorted and escaped unless '_Raw', elements without content
+    are written as '<tag/>'. pytest always gives content, maybe empty, to the
+    elements with children.
+    """
+    text = '<' + tag
+    for name, value in sorted(attrs.items()):
+        if not isinstance(value, _Raw):
+            value = _xml_escape(str(value))
+        text += ' {}="{}"'.format(name, value)
+    if content is None:
+        return text + '/>'
+    return '{}>{}</{}>'.format(text, content, tag)
+
+
+def _xml_escape(text):
+    """'py.xml' escape."""
+    return XML_ESCAPE_RE.sub(lambda match: XML_ESCAPES[match.group()], text)
+
+
+def _bin_xml_escape(text):
+    """pytest 'bin_xml_escape', invalid XML characters are made visible."""
+    def repl(match):
+        char = ord(match.group())
+        if char <= 0xFF:
+            return '#x{:02X}'.format(char)
+        return '#x{:04X}'.format(char)
+    return ILLEGAL_XML.sub(repl, _xml_escape(text))
@@ -0,0 +1,74 @@
+"""Items resources metrics.
+
+Metrics measured by the backends are added as junit-xml 'property' to each
+testcase and saved in a JSON file next to the junit-xml report to track them
+between builds.
+
+JSON format:
+
+    {"prefix": "board.application.compilation",
+     "items": [{"nodeid": ..., "kind": "command", "value": ...,
+                "returncode": 0, "log": ...,
+                "wall_time": 1.2, "user_time": 0.9, "sys_time": 0.2,
+                "maxrss": 10240}]}
+
+Results replayed from the cache also have '"cached": true'.
+With the 'docker' backend, items have the 'container_*' metrics, see
+'containers.py'.
+With '--ccache-stats', items also have 'ccache_hits', 'ccache_misses' and
+'ccache_hit_rate' when they compiled something.
+"""
+
+import os
+import json
+
+# Properties order in the testcase
+METRICS = ('wall_time', 'user_time', 'sys_time', 'maxrss',
+           'container_startup', 'container_overhead', 'container_builds',
+           'ccache_hits', 'ccache_misses', 'ccache_hit_rate', 'cached')
+
+
+class Metrics():
+    """Collect the items metrics."""
+
+    def __init__(self, path, prefix=None):
+        self.path = path
+        self.prefix = prefix
+        self.items = []
+
+    def record(self, node, kind, value, result):
+        """Record 'result' metrics and add them as 'node' properties."""
+        metrics = {name: _round(metric)
+                   for name, metric in result.metrics.items()}
+        for name in METRICS:
+            if name in metrics:
+                node.user_properties.append((name, metrics[name]))
+
+        item = {
+            'nodeid': node.nodeid,
+            'kind': kind,
+            'value': value,
+            'returncode': result.returncode,
+            'log': result.log,
+        }
+        item.update(metrics)
+        self.items.append(item)
+
+    def write(self):
+        """Write the JSON file if there is a 'path'."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w') as jsonfd:
+            json.dump({'prefix': self.prefix, 'items': self.items}, jsonfd,
+                      indent=1, sort_keys=True)
+            jsonfd.write('\n')
+
+
+def _round(value, digits=6):
+    """Round float values to 'digits' to not have float representation noise.
+    """
+    if isinstance(value, float):
+        return round(value, digits)
+    return value
@@ -0,0 +1,77 @@
+"""Per item output log files.
+
+The output of each item is written directly to a log file, only a 'head' and
+'tail' window of it is put in the report, with the path to the full log.
+Memory used stays constant whatever the output size.
+"""
+
+import os
+import re
+import hashlib
+import collections
+
+# Lines longer than this are truncated in the excerpt
+MAX_LINE = 1024
+
+
+class OutputLog():
+    """Handle the items log files in 'directory'."""
+
+    def __init__(self, directory, head=20, tail=100):
+        self.directory = os.path.abspath(directory)
+        self.head = head
+        self.tail = tail
+
+    def path(self, nodeid):
+        """Return the log file path for 'nodeid'.
+
+        The name is made safe for the filesystem, a short nodeid hash keeps
+        it unique.
+        """
+        name = nodeid.rsplit('::', 1)[-1]
+        name = re.sub(r'[^\w.\[\]-]+', '_', name)[:64]
+        digest = hashlib.sha1(nodeid.encode('utf-8')).hexdigest()[:8]
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory,
+                            '{}-{}.log'.format(name, digest))
+
+    def excerpt(self, path):
+        """Return the 'head' and 'tail' lines of 'path' and its location.
+
+        The file is read line by line with a bounded line length.
+        """
+        head = []
+        tail = collections.deque(maxlen=self.tail)
+        skipped = 0
+
+        with open(path, errors='replace') as logfd:
+            for line in iter(lambda: _readline(logfd), ''):
+                if len(head) < self.head:
+                    head.append(line)
+                    continue
+                if len(tail) == tail.maxlen:
+                    skipped += 1
+                tail.append(line)
+
+        lines = head
+        if skipped:
+            lines.append('[... {} lines skipped ...]\n'.format(skipped))
+        lines.extend(tail)
+        lines.append('Full output in {}\n'.format(path))
+        return ''.join(lines)
+
+
+def _readline(logfd, max_line=MAX_LINE):
+    """Read one line, truncated to 'max_line' characters."""
+    line = logfd.readline(max_line)
+    if line.endswith('\n'):
+        return line
+    if len(line) == max_line:
+        # Drop the rest of a too long line
+        while True:
+            rest = logfd.readline(max_line)
+            if not rest or rest.endswith('\n'):
+                break
+        line += '[...]'
+    # Also terminate a last line without newline
+    return line + '\n' if line else line
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Record the BOARD.APPLICATION durations and schedule the longest first.
+
+Durations are read from the 'pytest_jenkins' junit-xml files, as written by
+'pytest.mk.post' and 'clean_all.mk.pre', and stored in a SQLite database.
+
+    junit_durations.py record durations.db output/pytest_results
+
+Each BOARD.APPLICATION duration is predicted as the mean of its last runs,
+unknown ones use the mean of all the known ones. The cells are then sorted
+longest processing time first and each one given to the least loaded worker.
+Without any recorded duration, cells are given round-robin and the predicted
+makespan is unknown.
+
+    junit_durations.py schedule durations.db --workers 4 \
+        --properties tests/environment.properties \
+        --application tests_bloom_bytes --output plan.json
+
+After the run, 'report' compares the plan predicted makespan with the
+actual makespan of the recorded run, from the testsuites timestamps, and
+with the makespan the plan would have had with the actual durations.
+
+    junit_durations.py report durations.db plan.json
+"""
+
+import sys
+import json
+import time
+import heapq
+import sqlite3
+import argparse
+import datetime
+
+import junit_merge
+
+# Number of runs used to predict a duration
+HISTORY = 5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY,
+    recorded REAL,
+    makespan REAL
+);
+CREATE TABLE IF NOT EXISTS durations (
+    run TEXT,
+    board TEXT,
+    application TEXT,
+    stage TEXT,
+    status TEXT,
+    duration REAL,
+    PRIMARY KEY (run, board, application, stage)
+);
+'''
+
+
+def positive_int(value):
+    """argparse type for integers of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: {}'.format(
+            value))
+    return number
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+PARSER.add_argument('database', help='SQLite database file')
+SUBPARSERS = PARSER.add_subparsers(dest='command')
+SUBPARSERS.required = True
+
+RECORD = SUBPARSERS.add_parser('record', help='Record a run durations')
+RECORD.add_argument('paths', nargs='+',
+                    help='junit-xml files or directories to search')
+RECORD.add_argument('--run', help='Run name, default: current time')
+
+SCHEDULE = SUBPARSERS.add_parser('schedule', help='Plan the next run')
+SCHEDULE.add_argument('--workers', type=positive_int, default=1,
+                      help='Number of concurrent workers')
+SCHEDULE.add_argument('--board', dest='boards', action='append', default=[],
+                      help='Board, can be given multiple times')
+SCHEDULE.add_argument('--properties',
+                      help="Read the boards from 'BOARDS' in this file")
+SCHEDULE.add_argument('--application', dest='applications',
+                      action='append', default=[],
+                      help='Application, can be given multiple times, '
+                           'default: the recorded ones')
+SCHEDULE.add_argument('--output', help='Write the plan to this JSON file')
+
+REPORT = SUBPARSERS.add_parser('report', help='Compare a plan with a run')
+REPORT.add_argument('plan', help="Plan JSON file from 'schedule'")
+REPORT.add_argument('--run', help='Run name, default: the last recorded')
+
+
+class DurationsDB():
+    """SQLite store of the BOARD.APPLICATION stages durations."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def record(self, run, suites):
+        """Record the 'junit_merge' 'suites' cells for 'run'.
+
+        Returns the run makespan or None if not known.
+        """
+        durations = {}
+        for suite in suites:
+            for board, application, stage, status, duration in suite.cells:
+                key = (board, application, stage)
+                previous_status, previous = durations.get(key, ('skipped', 0))
+                status = junit_merge.worst_status(previous_status, status)
+                durations[key] = (status, previous + duration)
+
+        makespan = suites_makespan(suites)
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?)',
+                              (run, time.time(), makespan))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?, ?)',
+                [(run,) + key + value for key, value in durations.items()])
+        return makespan
+
+    def predict(self, cells, history=HISTORY):
+        """Return {(board, application): duration} for 'cells'.
+
+        The mean of the last 'history' runs of each cell, the mean of all
+        the known cells for unknown ones.
+        """
+        known = {}
+        for board, application in cells:
+            rows = self.conn.execute(
+                'SELECT SUM(durations.duration) FROM durations '
+                'JOIN runs ON durations.run = runs.run '
+                'WHERE board = ? AND application = ? '
+                'GROUP BY durations.run ORDER BY runs.recorded DESC LIMIT ?',
+                (board, application, history)).fetchall()
+            if rows:
+                known[(board, application)] = (
+                    sum(row[0] for row in rows) / len(rows))
+
+        default = sum(known.values()) / len(known) if known else 0.0
+        return {cell: known.get(cell, default) for cell in cells}
+
+    def applications(self):
+        """Recorded applications."""
+        rows = self.conn.execute(
+            'SELECT DISTINCT application FROM durations ORDER BY application')
+        return [row[0] for row in rows]
+
+    def run(self, run=None):
+        """Return (run, makespan, {(board, application): duration})."""
+        if run is None:
+            row = self.conn.execute(
+                'SELECT run FROM runs ORDER BY recorded DESC LIMIT 1'
+            ).fetchone()
+            if row is None:
+                raise ValueError('No recorded run')
+            run = row[0]
+        makespan = self.conn.execute(
+            'SELECT makespan FROM runs WHERE run = ?', (run,)).fetchone()
+        if makespan is None:
+            raise ValueError('Unknown run {}'.format(run))
+        rows = self.conn.execute(
+            'SELECT board, application, SUM(duration) FROM durations '
+            'WHERE run = ? GROUP BY board, application', (run,))
+        durations = {(board, application): duration
+                     for board, application, duration in rows}
+        return run, makespan[0], durations
+
+
+def suites_makespan(suites):
+    """Time from the first testsuite start to the last testsuite end.
+
+    Returns None if the testsuites have no 'timestamp'.
+    """
+    starts = []
+    ends = []
+    for suite in suites:
+        try:
+            start = datetime.datetime.fromisoformat(suite.timestamp)
+        except ValueError:
+            return None
+        start = start.timestamp()
+        starts.append(start)
+        ends.append(start + suite.time)
+    if not starts:
+        return None
+    return max(ends) - min(starts)
+
+
+def lpt_schedule(durations, workers):
+    """Longest processing time first scheduling of 'durations'.
+
+    Ties between equally loaded workers go to the one with the fewest cells,
+    so unknown, zero, durations are distributed round-robin.
+    Returns the cells list of each worker and the makespan.
+    """
+    plan = [[] for _ in range(workers)]
+    loads = [(0.0, 0, worker) for worker in range(workers)]
+    heapq.heapify(loads)
+    for cell in sorted(durations, key=lambda c: (-durations[c], c)):
+        load, count, worker = heapq.heappop(loads)
+        plan[worker].append(cell)
+        heapq.heappush(loads, (load + durations[cell], count + 1, worker))
+    return plan, max(load for load, _, _ in loads)
+
+
+def plan_makespan(plan, durations):
+    """Makespan of 'plan' with 'durations', missing cells count as 0."""
+    return max((sum(durations.get(tuple(cell), 0.0) for cell in cells)
+                for cells in plan), default=0.0)
+
+
+def read_boards(properties):
+    """Return the 'BOARDS' list from an 'environment.properties' file."""
+    with open(properties) as propfd:
+        for line in propfd:
+            name, sep, value = line.partition('=')
+            if sep and name.strip() == 'BOARDS':
+                return value.split()
+    return []
+
+
+def record(opts, database):
+    """Record the junit-xml files durations."""
+    run = opts.run or datetime.datetime.now().isoformat()
+    suites = junit_merge.select_suites(opts.paths)
+    makespan = database.record(run, suites)
+    print('Recorded run {}: {} testsuites, makespan {}'.format(
+        run, len(suites), _seconds(makespan)))
+
+
+def schedule(opts, database):
+    """Plan the boards and applications matrix."""
+    boards = list(opts.boards)
+    if opts.properties:
+        boards += read_boards(opts.properties)
+    applications = opts.applications or database.applications()
+    cells = [(board, application)
+             for board in boards for application in applications]
+
+    durations = database.predict(cells)
+    plan, makespan = lpt_schedule(durations, opts.workers)
+    if not any(durations.values()):
+        # No recorded durations, only the cells distribution is known
+        makespan = None
+    for worker, worker_cells in enumerate(plan):
+        print('worker {}: {}'.format(worker, ' '.join(
+            '{}.{}'.format(*cell) for cell in worker_cells)))
+    print('Predicted makespan {} for {} cells on {} workers'.format(
+        _seconds(makespan), len(cells), opts.workers))
+
+    if opts.output:
+        with open(opts.output, 'w') as planfd:
+            json.dump({'workers': plan, 'makespan': makespan,
+                       'durations': [list(cell) + [duration] for cell,
+                                     duration in sorted(durations.items())]},
+                      planfd, indent=1)
+            planfd.write('\n')
+
+
+def report(opts, database):
+    """Compare a plan predicted makespan with a recorded run."""
+    with open(opts.plan) as planfd:
+        plan = json.load(planfd)
+    run, makespan, durations = database.run(opts.run)
+    replayed = plan_makespan(plan['workers'], durations)
+
+    print('Run {}'.format(run))
+    print('Predicted makespan: {}'.format(_seconds(plan['makespan'])))
+    print('Actual makespan:    {}'.format(_seconds(makespan)))
+    print('Plan with actual durations: {}'.format(_seconds(replayed)))
+
+
+def _seconds(value):
+    return 'unknown' if value is None else '{:.1f}s'.format(value)
+
+
+COMMANDS = {
+    'record': record,
+    'schedule': schedule,
+    'report': report,
+}
+
+
+def main():
+    """Run the command."""
+    opts = PARSER.parse_args()
+    database = DurationsDB(opts.database)
+    try:
+        COMMANDS[opts.command](opts, database)
+    except (OSError, ValueError) as err:
+        print(err, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
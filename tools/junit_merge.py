@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Merge junit-xml files into one report and a board x application index.
+
+Usage:
+
+    junit_merge.py --output results.xml --index index.json \
+        output/pytest_results
+
+Directories are searched for '*.xml' files. Files are read with 'iterparse'
+and written testcase by testcase, so memory does not depend on their size.
+
+Testsuites with the same name and the same testcases are duplicates, only the
+most recent one is kept, by 'timestamp' then file modification time.
+Testsuites and testcases are copied unchanged, so the 'BOARD.APPLICATION'
+classnames set by 'pytest_jenkins' are kept.
+
+The index gives for each board and application the status, the duration and
+each stage status, the stage being the first part of the testcase name
+('compilation', 'test'):
+
+    {"iotlab-m3": {"tests_bloom_bytes": {
+        "status": "failed", "time": 12.3, "tests": 2,
+        "stages": {"compilation": "passed", "test": "failed"}}}}
+
+With '--compare OLD_INDEX', the cells with a different status are printed.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import xml.etree.ElementTree as ET
+
+# Worst status first
+STATUSES = ('error', 'failed', 'passed', 'skipped')
+COUNTERS = ('tests', 'failures', 'errors', 'skipped')
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+PARSER.add_argument('paths', nargs='+',
+                    help='junit-xml files or directories to search')
+PARSER.add_argument('--output', '-o', help='Merged junit-xml file')
+PARSER.add_argument('--index', help='Index JSON file')
+PARSER.add_argument('--compare', metavar='OLD_INDEX',
+                    help='Print cells whose status changed from OLD_INDEX')
+
+
+class SuiteInfo():
+    """Testsuite summary from the first pass."""
+
+    def __init__(self, path, position, attrs):
+        self.path = path
+        self.position = position
+        self.name = attrs.get('name', '')
+        self.timestamp = attrs.get('timestamp', '')
+        self.mtime = os.stat(path).st_mtime
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.time = 0.0
+        self.cells = []
+        self._digest = hashlib.sha1()
+
+    def add_testcase(self, testcase):
+        """Update the summary with 'testcase' element."""
+        classname = testcase.get('classname', '')
+        name = testcase.get('name', '')
+        self._digest.update('{}\0{}\0'.format(classname, name).encode())
+
+        status = testcase_status(testcase)
+        duration = float(testcase.get('time', 0) or 0)
+        self.counters['tests'] += 1
+        counter = {'failed': 'failures', 'error': 'errors',
+                   'skipped': 'skipped'}.get(status)
+        if counter:
+            self.counters[counter] += 1
+        self.time += duration
+
+        board, _, application = classname.partition('.')
+        if application:
+            stage = name.split('.', 1)[0]
+            self.cells.append((board, application, stage, status, duration))
+
+    def key(self):
+        """Suites with the same key are duplicates."""
+        return self.name, self._digest.hexdigest()
+
+    def order(self):
+        """Most recent has the highest order."""
+        return self.timestamp, self.mtime
+
+
+def testcase_status(testcase):
+    """Status of a 'testcase' element."""
+    tags = {child.tag for child in testcase}
+    if 'error' in tags:
+        return 'error'
+    if 'failure' in tags:
+        return 'failed'
+    if 'skipped' in tags:
+        return 'skipped'
+    return 'passed'
+
+
+def xml_files(paths):
+    """'paths' files and '*.xml' files in 'paths' directories, sorted."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.xml'):
+                    yield os.path.join(root, name)
+
+
+def read_suites(path):
+    """Return the 'SuiteInfo' of the testsuites in 'path'."""
+    suites = []
+    suite = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if elem.tag == 'testsuite':
+            if event == 'start':
+                suite = SuiteInfo(path, len(suites), elem.attrib)
+            else:
+                suites.append(suite)
+                suite = None
+                elem.clear()
+        elif event == 'end' and elem.tag == 'testcase' and suite is not None:
+            suite.add_testcase(elem)
+            elem.clear()
+    return suites
+
+
+def select_suites(paths):
+    """Return the selected suites without duplicates, in the files order."""
+    selected = {}
+    for path in xml_files(paths):
+        try:
+            suites = read_suites(path)
+        except (OSError, ET.ParseError) as err:
+            print('Ignoring {}: {}'.format(path, err), file=sys.stderr)
+            continue
+        for suite in suites:
+            previous = selected.get(suite.key())
+            if previous is None or suite.order() >= previous.order():
+                selected[suite.key()] = suite
+    return sorted(selected.values(), key=lambda s: (s.path, s.position))
+
+
+def write_merged(suites, output):
+    """Write 'suites' to 'output' copying their elements one by one."""
+    totals = dict.fromkeys(COUNTERS, 0)
+    for suite in suites:
+        for name in COUNTERS:
+            totals[name] += suite.counters[name]
+    totals['time'] = '%.3f' % sum(suite.time for suite in suites)
+
+    with open(output, 'w', encoding='utf-8') as outfd:
+        outfd.write('<?xml version="1.0" encoding="utf-8"?>')
+        root = ET.Element('testsuites',
+                          {name: str(value) for name, value in totals.items()})
+        outfd.write(ET.tostring(root, encoding='unicode')[:-2] + '>\n')
+
+        by_path = {}
+        for suite in suites:
+            by_path.setdefault(suite.path, set()).add(suite.position)
+        for path in sorted(by_path):
+            _copy_suites(path, by_path[path], outfd)
+
+        outfd.write('</testsuites>\n')
+
+
+def _copy_suites(path, positions, outfd):
+    """Copy the testsuites at 'positions' in 'path' to 'outfd'."""
+    position = -1
+    depth = 0
+    copy = False
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if elem.tag == 'testsuite':
+            if event == 'start':
+                position += 1
+                depth = 0
+                copy = position in positions
+                if copy:
+                    start = ET.tostring(ET.Element('testsuite', elem.attrib),
+                                        encoding='unicode')
+                    outfd.write(start[:-2] + '>\n')
+            else:
+                if copy:
+                    outfd.write('</testsuite>\n')
+                copy = False
+                elem.clear()
+            continue
+
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        # Direct children of the testsuite are written and dropped
+        if depth == 0 and copy:
+            elem.tail = None
+            outfd.write(ET.tostring(elem, encoding='unicode') + '\n')
+        if depth == 0:
+            elem.clear()
+
+
+def build_index(suites):
+    """Return {board: {application: cell}} for 'suites'."""
+    index = {}
+    for suite in suites:
+        for board, application, stage, status, duration in suite.cells:
+            cell = index.setdefault(board, {}).setdefault(application, {
+                'status': 'skipped', 'time': 0.0, 'tests': 0, 'stages': {}})
+            cell['tests'] += 1
+            cell['time'] = round(cell['time'] + duration, 3)
+            cell['status'] = worst_status(cell['status'], status)
+            cell['stages'][stage] = worst_status(
+                cell['stages'].get(stage, 'skipped'), status)
+    return index
+
+
+def worst_status(status, other):
+    """Return the worst of the two statuses."""
+    return min(status, other, key=STATUSES.index)
+
+
+def compare_index(old, new):
+    """Yield 'board application old new' for cells with a different status.
+    """
+    cells = set()
+    for index in (old, new):
+        cells.update((board, application)
+                     for board, applications in index.items()
+                     for application in applications)
+    for board, application in sorted(cells):
+        old_status = old.get(board, {}).get(application, {}).get('status')
+        new_status = new.get(board, {}).get(application, {}).get('status')
+        if old_status != new_status:
+            yield '{} {} {} {}'.format(board, application, old_status,
+                                       new_status)
+
+
+def main():
+    """Merge the files and write the index."""
+    opts = PARSER.parse_args()
+    suites = select_suites(opts.paths)
+    if opts.output:
+        write_merged(suites, opts.output)
+
+    index = build_index(suites)
+    if opts.index:
+        with open(opts.index, 'w') as indexfd:
+            json.dump(index, indexfd, indent=1, sort_keys=True)
+            indexfd.write('\n')
+
+    if opts.compare:
+        with open(opts.compare) as oldfd:
+            old = json.load(oldfd)
+        changes = list(compare_index(old, index))
+        for change in changes:
+            print(change)
+        return 1 if changes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
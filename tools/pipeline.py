@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Compile the next applications while the current one is tested on the node.
+
+Each application goes through two stages, the compilation with
+'cmdxml-clean-all' from 'clean_all.mk.pre' and the test on the node with
+'flash-only pytest' from 'pytest.mk.post':
+
+* compile workers build the applications in order and put them in a bounded
+  queue of firmwares ready to flash. When the queue is full, they wait with
+  their firmware for the test stage to take one, so the builds do not get
+  ahead of the node by more than '--queue-size' plus '--compile-jobs'.
+* test workers, one per '--node', take the firmwares from the queue in the
+  order they were built and run the test with 'IOTLAB_NODE' set to their node.
+  Without '--node', one test worker uses the environment node. Failed
+  compilations are not tested.
+
+The test stage uses 'flash-only', not 'flash', so the firmware the compile
+stage built is flashed without running 'all' again.
+
+    pipeline.py --riotbase RIOT --board iotlab-m3 --queue-size 2 \
+        --node m3-1.saclay.iot-lab.info --node m3-2.saclay.iot-lab.info \
+        tests/bloom_bytes tests/xtimer_now64 examples/hello-world
+
+A step raising an exception is reported as failed, the workers continue with
+the next applications.
+
+Applications are directories relative to '--riotbase'. The commands are run
+with 'RIOT_MAKEFILES_GLOBAL_PRE' and 'RIOT_MAKEFILES_GLOBAL_POST' set to this
+directory 'makefiles.pre' and 'makefiles.post', so the junit-xml reports are
+the same as when running the stages one after the other.
+
+At the end, the utilisation of each stage is printed: the time its workers
+were busy, and the time they waited, blocked on a full queue for the compile
+stage and starved on an empty queue for the test stage.
+
+    compile: 1 worker, 6 jobs, busy 82%, blocked 18%
+    test: 1 worker, 5 jobs, busy 74%, starved 26%
+
+With '--report', the stages and applications results are written as JSON.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import queue
+import argparse
+import threading
+import traceback
+import subprocess
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+MAKEFILES_PRE = os.path.join(TOOLS_DIR, 'makefiles.pre')
+MAKEFILES_POST = os.path.join(TOOLS_DIR, 'makefiles.post')
+
+QUEUE_SIZE = 2
+COMPILE_CMD = 'make -C {appdir} cmdxml-clean-all'
+TEST_CMD = 'make -C {appdir} flash-only pytest'
+
+
+def positive_int(value):
+    """argparse type for integers of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1: {}'.format(
+            value))
+    return number
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+PARSER.add_argument('applications', nargs='+',
+                    help='Applications directories relative to RIOTBASE')
+PARSER.add_argument('--riotbase', default=os.curdir, help='RIOT directory')
+PARSER.add_argument('--board', help='BOARD given to the commands')
+PARSER.add_argument('--queue-size', type=positive_int, default=QUEUE_SIZE,
+                    help='Number of compiled firmwares waiting to be tested')
+PARSER.add_argument('--compile-jobs', type=positive_int, default=1,
+                    help='Number of concurrent compilations')
+PARSER.add_argument('--node', dest='nodes', action='append', default=[],
+                    help='IOTLAB_NODE of a test worker, can be specified '
+                         'multiple times to test on the nodes concurrently')
+PARSER.add_argument('--compile-cmd', default=COMPILE_CMD,
+                    help='Compilation command, {appdir}, {application} and '
+                         '{board} are replaced')
+PARSER.add_argument('--test-cmd', default=TEST_CMD,
+                    help="Test command, as --compile-cmd, 'flash pytest' "
+                         'also checks the build')
+PARSER.add_argument('--log-dir',
+                    help="Write each command output to "
+                         "'APPLICATION.STAGE.log' in this directory")
+PARSER.add_argument('--report', help='Write the results to this JSON file')
+
+
+class Stage():
+    """Busy and waiting times of a pipeline stage workers."""
+
+    def __init__(self, name, workers, waiting_name):
+        self.name = name
+        self.workers = workers
+        self.waiting_name = waiting_name
+        self.jobs = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy=None, waiting=0.0):
+        """Add a job 'busy' time or a 'waiting' time."""
+        with self._lock:
+            if busy is not None:
+                self.jobs += 1
+                self.busy += busy
+            self.waiting += waiting
+
+    def utilisation(self, wall):
+        """Return the busy and waiting ratios of the workers time."""
+        total = wall * self.workers
+        if not total:
+            return 0.0, 0.0
+        return self.busy / total, self.waiting / total
+
+    def summary(self, wall):
+        """Stage values for the report."""
+        busy, waiting = self.utilisation(wall)
+        return {'workers': self.workers, 'jobs': self.jobs,
+                'busy': self.busy, 'waiting': self.waiting,
+                'utilisation': busy, self.waiting_name: waiting}
+
+    def __str__(self):
+        return self.name
+
+
+class Pipeline():
+    """Run 'compile_step' and 'test_step' on the applications.
+
+    Steps are called with the application and return an exit code,
+    'test_step' also gets the node of its worker, one per 'nodes'.
+    """
+
+    def __init__(self, compile_step, test_step, queue_size=QUEUE_SIZE,
+                 compile_jobs=1, nodes=(None,)):
+        # pylint:disable=too-many-arguments
+        self.compile_step = compile_step
+        self.test_step = test_step
+        self.queue_size = queue_size
+        self.nodes = list(nodes)
+        self.compile = Stage('compile', compile_jobs, 'blocked')
+        self.test = Stage('test', len(self.nodes), 'starved')
+        self.results = {}
+        self.wall = 0.0
+
+    def run(self, applications):
+        """Run the applications and return {application: results}.
+
+        Results are the 'compile' and 'test' exit codes, None when not run.
+        """
+        self.results = {app: {'compile': None, 'test': None}
+                        for app in applications}
+        pending = queue.Queue()
+        for application in applications:
+            pending.put(application)
+        ready = queue.Queue(max(1, self.queue_size))
+
+        start = time.monotonic()
+        compilers = [threading.Thread(target=self._compile_worker,
+                                      args=(pending, ready))
+                     for _ in range(self.compile.workers)]
+        testers = [threading.Thread(target=self._test_worker,
+                                    args=(ready, node))
+                   for node in self.nodes]
+        for thread in compilers + testers:
+            thread.start()
+        for thread in compilers:
+            thread.join()
+        # One end marker per test worker, after the last firmware
+        for _ in testers:
+            ready.put(None)
+        for thread in testers:
+            thread.join()
+        self.wall = time.monotonic() - start
+        return self.results
+
+    def _compile_worker(self, pending, ready):
+        while True:
+            try:
+                application = pending.get_nowait()
+            except queue.Empty:
+                return
+            start = time.monotonic()
+            returncode = _call_step(self.compile_step, application)
+            built = time.monotonic()
+            self.compile.add(busy=built - start)
+            self.results[application]['compile'] = returncode
+            if returncode != 0:
+                continue
+            # Back-pressure, wait for the test stage when the queue is full
+            ready.put(application)
+            self.compile.add(waiting=time.monotonic() - built)
+
+    def _test_worker(self, ready, node):
+        while True:
+            start = time.monotonic()
+            application = ready.get()
+            got = time.monotonic()
+            self.test.add(waiting=got - start)
+            if application is None:
+                return
+            returncode = _call_step(self.test_step, application, node)
+            self.test.add(busy=time.monotonic() - got)
+            self.results[application]['test'] = returncode
+
+    def failed(self):
+        """Return True if a compilation or a test failed."""
+        return any(returncode for results in self.results.values()
+                   for returncode in results.values())
+
+    def summary(self):
+        """Pipeline values for the report."""
+        return {
+            'wall': self.wall,
+            'queue_size': self.queue_size,
+            'stages': {str(stage): stage.summary(self.wall)
+                       for stage in (self.compile, self.test)},
+            'applications': self.results,
+        }
+
+
+def _call_step(step, *args):
+    """Return the 'step' exit code, 1 if it raised an exception.
+
+    The workers must continue so the compile stage is not blocked on a full
+    queue without test workers.
+    """
+    try:
+        return step(*args)
+    except Exception:  # pylint:disable=broad-except
+        traceback.print_exc()
+        return 1
+
+
+class MakeStep():
+    """Run the stage command for an application."""
+
+    def __init__(self, stage, template, opts):
+        self.stage = stage
+        self.template = template
+        self.riotbase = opts.riotbase
+        self.board = opts.board
+        self.log_dir = opts.log_dir
+        self.env = dict(os.environ)
+        self.env['RIOT_MAKEFILES_GLOBAL_PRE'] = MAKEFILES_PRE
+        self.env['RIOT_MAKEFILES_GLOBAL_POST'] = MAKEFILES_POST
+        if opts.board:
+            self.env['BOARD'] = opts.board
+
+    def __call__(self, application, node=None):
+        """Run the command, with 'IOTLAB_NODE' set to 'node' if given."""
+        command = self.template.format(
+            appdir=shlex.quote(os.path.join(self.riotbase, application)),
+            application=shlex.quote(application),
+            board=shlex.quote(self.board or ''))
+        env = self.env
+        if node is not None:
+            env = dict(env, IOTLAB_NODE=node)
+        if self.log_dir is None:
+            return subprocess.call(command, shell=True, env=env,
+                                   stdin=subprocess.DEVNULL)
+        log = os.path.join(self.log_dir, '{}.{}.log'.format(
+            application.strip('/').replace('/', '_'), self.stage))
+        with open(log, 'wb') as logfd:
+            return subprocess.call(command, shell=True, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=logfd,
+                                   stderr=subprocess.STDOUT)
+
+
+def print_summary(pipeline):
+    """Print the applications results and the stages utilisation."""
+    for application, results in pipeline.results.items():
+        print('{}: compile {}, test {}'.format(
+            application, _status(results['compile']),
+            _status(results['test'])))
+    print('Wall time {:.1f}s, queue size {}'.format(
+        pipeline.wall, pipeline.queue_size))
+    for stage in (pipeline.compile, pipeline.test):
+        busy, waiting = stage.utilisation(pipeline.wall)
+        print('{}: {} worker{}, {} jobs, busy {:.0%}, {} {:.0%}'.format(
+            stage, stage.workers, 's' if stage.workers > 1 else '',
+            stage.jobs, busy, stage.waiting_name, waiting))
+
+
+def _status(returncode):
+    if returncode is None:
+        return 'not run'
+    return 'passed' if returncode == 0 else 'failed'
+
+
+def main():
+    """Run the pipeline."""
+    opts = PARSER.parse_args()
+    if opts.log_dir:
+        os.makedirs(opts.log_dir, exist_ok=True)
+
+    pipeline = Pipeline(MakeStep('compile', opts.compile_cmd, opts),
+                        MakeStep('test', opts.test_cmd, opts),
+                        queue_size=opts.queue_size,
+                        compile_jobs=opts.compile_jobs,
+                        nodes=opts.nodes or [None])
+    pipeline.run(opts.applications)
+    print_summary(pipeline)
+
+    if opts.report:
+        with open(opts.report, 'w') as reportfd:
+            json.dump(pipeline.summary(), reportfd, indent=1)
+            reportfd.write('\n')
+    return 1 if pipeline.failed() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+"""Benchmark the 'pytest_child' collection with and without its cache.
+
+A tree of test files is generated, some with supported tests and some with
+unsupported fixtures, then collected with '--collect-only':
+
+* 'cold': with '--cache-clear'
+* 'warm': with the collection cache from the previous run
+
+'testrunner' must be in PYTHONPATH as for 'pytest.mk.post'.
+
+Usage:
+
+    PYTHONPATH=RIOT/dist/pythonlibs ./bench_collection.py --files 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+SUPPORTED = '''
+import sys
+from testrunner import run
+
+
+def testfunc(child):
+    child.expect_exact('{index}')
+
+
+if __name__ == "__main__":
+    sys.exit(run(testfunc, timeout=10))
+'''
+
+UNSUPPORTED = '''
+import sys
+
+
+def test_{index}(tmpdir, monkeypatch):
+    assert tmpdir
+
+
+def helper_{index}():
+    return {index}
+'''
+
+PARSER = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawTextHelpFormatter)
+PARSER.add_argument('--files', type=int, default=500,
+                    help='Number of test files')
+PARSER.add_argument('--unsupported', type=float, default=0.5,
+                    help='Ratio of files with unsupported tests')
+PARSER.add_argument('--runs', type=int, default=3,
+                    help='Number of warm runs')
+
+
+def generate(directory, files, unsupported):
+    """Generate 'files' test files in 'directory'."""
+    for index in range(files):
+        template = UNSUPPORTED if index < files * unsupported else SUPPORTED
+        testdir = os.path.join(directory, 'test{}'.format(index), 'tests')
+        os.makedirs(testdir)
+        testfile = os.path.join(testdir, 'test_{}.py'.format(index))
+        with open(testfile, 'w') as testfd:
+            testfd.write(template.format(index=index))
+
+
+def collect(directory, *args):
+    """Return the time to collect the tests in 'directory'."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__)),
+         env.get('PYTHONPATH', '')])
+    cmd = [sys.executable, '-m', 'pytest', '-p', 'pytest_child',
+           '--collect-only', '-q', '-o', 'cache_dir=.pytest_cache']
+    cmd += list(args)
+    start = time.monotonic()
+    subprocess.run(cmd + [directory], cwd=directory, env=env, check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.monotonic() - start
+
+
+def main():
+    """Generate the tests and print the collection times."""
+    opts = PARSER.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        generate(directory, opts.files, opts.unsupported)
+        cold = collect(directory, '--cache-clear')
+        warm = min(collect(directory) for _ in range(opts.runs))
+
+    print('files: {}, unsupported: {:.0%}'.format(
+        opts.files, opts.unsupported))
+    print('cold: {:.3f}s'.format(cold))
+    print('warm: {:.3f}s ({:.0%} saved)'.format(warm, 1 - warm / cold))
+
+
+if __name__ == '__main__':
+    main()
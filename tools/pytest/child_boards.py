@@ -0,0 +1,240 @@
+"""Run the tests on multiple boards concurrently.
+
+Boards are given with '--board BOARD[=IOTLAB_NODE]', the 'child' or
+'async_child' fixture is then parametrized over them.
+
+After collection, one worker process is forked per board. Each worker runs the
+items for its board with the board environment and sends back the reports.
+The main process reports them in the collection order as if they were run
+locally, so the junit-xml and terminal output are not interleaved.
+
+For junit-xml, '{board}' in '--junit-prefix' is replaced by each report board
+to keep 'BOARD.APPLICATION' classnames. The junitxml plugin is 'config._xml'
+up to pytest 5.3 and in the config store after, running fails if it cannot be
+found.
+"""
+
+import os
+import sys
+import json
+import queue
+import threading
+import traceback
+
+import pytest
+from _pytest.reports import TestReport
+from _pytest.runner import runtestprotocol
+
+try:
+    from _pytest.junitxml import xml_key
+except ImportError:  # pytest < 5.4
+    xml_key = None  # pylint:disable=invalid-name
+
+CHILD_FIXTURES = ('child', 'async_child')
+
+
+def parse_boards(values):
+    """Return {board: env} from 'BOARD[=IOTLAB_NODE]' values.
+
+    Values can also be space or comma separated lists.
+    """
+    boards = {}
+    for value in values:
+        for board in value.replace(',', ' ').split():
+            board, _, node = board.partition('=')
+            env = {'BOARD': board}
+            if node:
+                env['IOTLAB_NODE'] = node
+            boards[board] = env
+    return boards
+
+
+def item_board(item):
+    """Return the board the item is parametrized with or None."""
+    params = getattr(getattr(item, 'callspec', None), 'params', {})
+    for fixture in CHILD_FIXTURES:
+        if fixture in params:
+            return params[fixture]
+    return None
+
+
+def junitxml(config):
+    """Return the junitxml plugin 'LogXML' object of 'config' or None.
+
+    It is 'config._xml' up to pytest 5.3, then stored with 'xml_key' in
+    'config._store', named 'config.stash' since pytest 7.
+    """
+    config_xml = getattr(config, '_xml', None)
+    if config_xml is not None or xml_key is None:
+        return config_xml
+    store = getattr(config, 'stash', None)
+    if store is None:
+        store = getattr(config, '_store', None)
+    return None if store is None else store.get(xml_key, None)
+
+
+class BoardWorker():
+    """Forked process running the items of one board."""
+
+    def __init__(self, session, board, env, items):
+        self.session = session
+        self.board = board
+        self.env = env
+        self.items = items
+        self.reports = queue.Queue()
+        self.pid = None
+        self.status = None
+        self._reader = None
+
+    def start(self):
+        """Fork the worker and start reading its reports."""
+        readfd, writefd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.pid = os.fork()
+        if self.pid == 0:  # pragma: no cover (in the worker)
+            os.close(readfd)
+            status = 1
+            try:
+                self._run(os.fdopen(writefd, 'w'))
+                status = 0
+            except BaseException:  # pylint:disable=broad-except
+                traceback.print_exc()
+            finally:
+                self._finish()
+                os._exit(status)  # pylint:disable=protected-access
+
+        os.close(writefd)
+        self._reader = threading.Thread(target=self._read,
+                                        args=(os.fdopen(readfd),), daemon=True)
+        self._reader.start()
+
+    def _run(self, output):
+        """Run the items and write their serialized results to 'output'."""
+        os.environ.update(self.env)
+        for index, item in enumerate(self.items):
+            nextitem = (self.items[index + 1]
+                        if index + 1 < len(self.items) else None)
+            reports = runtestprotocol(item, log=False, nextitem=nextitem)
+            output.write(json.dumps(self._result(item, reports)) + '\n')
+            output.flush()
+
+    def _result(self, item, reports):
+        """Return the 'item' result sent to the main process."""
+        config = self.session.config
+        reports = [config.hook.pytest_report_to_serializable(
+            config=config, report=report) for report in reports]
+        return {'nodeid': item.nodeid, 'reports': reports}
+
+    def _finish(self):
+        """Run the worker finish hook as 'os._exit' skips the cleanups."""
+        try:
+            self.session.config.hook.pytest_child_worker_finish(
+                session=self.session)
+        except BaseException:  # pylint:disable=broad-except
+            traceback.print_exc()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def _read(self, reportsfd):
+        """Put the received results in the 'reports' queue, None at the end."""
+        config = self.session.config
+        for line in reportsfd:
+            result = json.loads(line)
+            result['reports'] = [config.hook.pytest_report_from_serializable(
+                config=config, data=report) for report in result['reports']]
+            self.reports.put(result)
+        self.reports.put(None)
+        _, self.status = os.waitpid(self.pid, 0)
+
+    def join(self):
+        """Wait for the worker end and return its exit status."""
+        if self._reader is not None:
+            self._reader.join()
+        return self.status
+
+    def __str__(self):
+        return 'board {}'.format(self.board)
+
+    def get_reports(self, item):
+        """Wait for 'item' reports.
+
+        If the worker stopped before, return a failure report.
+        """
+        return self.get_result(item)['reports']
+
+    def get_result(self, item):
+        """Wait for 'item' result, as made by '_result'."""
+        result = self.reports.get()
+        if result is None:
+            # Keep the end marker for the next items
+            self.reports.put(None)
+            msg = 'Worker for {} stopped'.format(self)
+            return {'nodeid': item.nodeid,
+                    'reports': [TestReport(item.nodeid, item.location, {},
+                                           'failed', msg, 'call')]}
+        assert result['nodeid'] == item.nodeid, (result['nodeid'],
+                                                 item.nodeid)
+        return result
+
+
+def run_boards(session, boards):
+    """Run the session items on all boards concurrently."""
+    workers = {}
+    for board, env in boards.items():
+        board_items = [item for item in session.items
+                       if item_board(item) == board]
+        if board_items:
+            worker = BoardWorker(session, board, env, board_items)
+            workers.update((item.nodeid, worker) for item in board_items)
+    run_workers(session, workers)
+
+
+def run_workers(session, workers):
+    """Run the items with their worker from {nodeid: worker}.
+
+    Items that are not parametrized with a board are run first locally.
+    """
+    _check_junit_prefix(session.config)
+    items = session.items
+    local = [item for item in items if item_board(item) is None]
+    for worker in dict.fromkeys(workers.values()):
+        worker.start()
+
+    for index, item in enumerate(local):
+        nextitem = local[index + 1] if index + 1 < len(local) else None
+        item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+
+    for item in items:
+        board = item_board(item)
+        if board is None:
+            continue
+        _log_reports(item, workers[item.nodeid].get_reports(item), board)
+
+
+def _check_junit_prefix(config):
+    """Fail if the '{board}' junit prefix cannot be replaced."""
+    prefix = getattr(config.option, 'junitprefix', None) or ''
+    xmlpath = getattr(config.option, 'xmlpath', None)
+    if '{board}' in prefix and xmlpath and junitxml(config) is None:
+        raise pytest.UsageError(
+            "'{board}' in --junit-prefix needs the pytest junitxml plugin "
+            "object, not found with pytest {}".format(pytest.__version__))
+
+
+def _log_reports(item, reports, board):
+    """Report 'reports' for 'item' with the junit prefix for 'board'."""
+    hook = item.ihook
+    config_xml = junitxml(item.config)
+    prefix = getattr(config_xml, 'prefix', None)
+
+    hook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+    try:
+        if prefix:
+            config_xml.prefix = prefix.replace('{board}', board)
+        for report in reports:
+            hook.pytest_runtest_logreport(report=report)
+    finally:
+        if prefix:
+            config_xml.prefix = prefix
+    hook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
@@ -0,0 +1,103 @@
+"""Filter the collected items and cache the files without supported tests.
+
+Items are filtered in one pass on frozensets of supported fixtures and test
+names. The unsupported fixtures are only reported once, with the number of
+items they deselected.
+
+Test files where all items were deselected are saved in the pytest 'cache'
+with their modification time and size. On the next run they are ignored when
+unchanged, so they are not imported nor analysed again. This includes the
+files given explicitly on the command line, as done by 'pytest.mk.post'.
+The cache is invalidated when the supported fixtures or names change.
+"""
+
+import os
+import collections
+
+
+def filter_supported(items, supported_fixtures, supported_names):
+    """Return (selected, deselected, unsupported) for 'items'.
+
+    'unsupported' counts the deselected items for each unsupported fixture.
+    Parameters, like the board, are removed from the test name.
+    """
+    selected = []
+    deselected = []
+    unsupported = collections.Counter()
+
+    for item in items:
+        fixturenames = getattr(item, 'fixturenames', ())
+        if not supported_fixtures.issuperset(fixturenames):
+            unsupported.update(set(fixturenames) - supported_fixtures)
+            deselected.append(item)
+        elif item.name.split('[', 1)[0] in supported_names:
+            selected.append(item)
+        else:
+            deselected.append(item)
+    return selected, deselected, unsupported
+
+
+def deselected_summary(deselected, unsupported):
+    """One line summary of the deselected items."""
+    summary = 'pytest_child: deselected {} items'.format(len(deselected))
+    if unsupported:
+        summary += ', unsupported fixtures: {}'.format(', '.join(
+            '{} ({})'.format(name, count)
+            for name, count in sorted(unsupported.items())))
+    return summary
+
+
+class CollectionCache():
+    """Files without supported tests, saved in pytest 'cache' if given."""
+    KEY = 'pytest_child/collection'
+
+    def __init__(self, cache, supported_fixtures, supported_names):
+        self.cache = cache
+        self.supported = [sorted(supported_fixtures), sorted(supported_names)]
+        self.files = {}
+        if cache is not None:
+            entry = cache.get(self.KEY, {})
+            if entry.get('supported') == self.supported:
+                self.files = entry['files']
+
+    def ignore(self, path):
+        """Return True if 'path' is cached and did not change."""
+        entry = self.files.get(path)
+        return entry is not None and _file_stat(path) == entry
+
+    def update(self, selected, deselected):
+        """Record the files that only have 'deselected' items."""
+        files = {_item_file(item) for item in deselected}
+        files -= {_item_file(item) for item in selected}
+        files.discard(None)
+
+        for path in files:
+            stat = _file_stat(path)
+            if stat is not None:
+                self.files[path] = stat
+        for path in {_item_file(item) for item in selected}:
+            self.files.pop(path, None)
+
+    def save(self):
+        """Save the cached files, removing deleted ones."""
+        if self.cache is None:
+            return
+        files = {path: entry for path, entry in self.files.items()
+                 if _file_stat(path) is not None}
+        self.cache.set(self.KEY, {'supported': self.supported,
+                                  'files': files})
+
+
+def _item_file(item):
+    module = getattr(item, 'module', None)
+    filename = getattr(module, '__file__', None)
+    return os.path.abspath(filename) if filename else None
+
+
+def _file_stat(path):
+    """Return [mtime, size] of 'path', None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
@@ -0,0 +1,16 @@
+"""Hooks added by 'pytest_child'."""
+
+import pytest
+
+
+@pytest.hookspec(firstresult=True)
+def pytest_child_timeout(item):
+    """Return the 'child' timeout for 'item', None for the default one.
+
+    The default implementation uses the test file 'run' 'timeout' argument.
+    Implement it in a 'conftest.py' to override it.
+    """
+
+
+def pytest_child_worker_finish(session):
+    """Called in a board worker process after its items, before it exits."""
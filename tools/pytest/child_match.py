@@ -0,0 +1,185 @@
+"""Pattern matching helpers for 'CustomSpawn' with high rate output.
+
+* Compiled pattern lists are cached, so an 'expect' called in a loop does not
+  re-process its patterns.
+* 'BoundedExpecter' only searches the newly received data with the end of the
+  previous data:
+  - regular expressions matches are limited to 'max_match' characters
+  - exact strings only look back the longest pattern length, or only the
+    current line when no pattern has a newline
+  The data kept for the buffer and 'before' is also bounded, so memory does
+  not grow when a test produces output without matching.
+* Data received but not matched by a previous 'expect' is searched again by
+  the next one, as with pexpect, up to 'max_match' characters.
+
+Decoding is pexpect incremental decoder, done once per read of TEST_MAXREAD
+characters.
+"""
+
+from pexpect import EOF, TIMEOUT
+from pexpect.expect import Expecter
+
+# Maximum number of cached compiled pattern lists
+PATTERNS_CACHE_SIZE = 512
+# Maximum length kept in 'before'
+MAX_BEFORE = 1024 * 1024
+
+_PATTERNS_CACHE = {}
+
+
+def compile_pattern_list(spawn, patterns, compile_function):
+    """Return 'compile_function(patterns)' result, cached.
+
+    The key includes 'spawn.ignorecase' and 'encoding' as they change the
+    compilation.
+    Not hashable patterns are not cached.
+    """
+    try:
+        key = (_hashable(patterns), spawn.ignorecase, spawn.encoding)
+        return list(_PATTERNS_CACHE[key])
+    except KeyError:
+        pass
+    except TypeError:
+        return compile_function(patterns)
+
+    compiled = compile_function(patterns)
+    if len(_PATTERNS_CACHE) >= PATTERNS_CACHE_SIZE:
+        _PATTERNS_CACHE.clear()
+    _PATTERNS_CACHE[key] = tuple(compiled)
+    return compiled
+
+
+def _hashable(patterns):
+    """Patterns as a hashable key, lists are converted to tuples."""
+    if isinstance(patterns, list):
+        return tuple(patterns)
+    return patterns
+
+
+def exact_patterns(spawn, pattern_list):
+    """Prepare 'expect_exact' patterns as done by pexpect."""
+    if (isinstance(pattern_list, spawn.allowed_string_types) or
+            pattern_list in (TIMEOUT, EOF)):
+        pattern_list = [pattern_list]
+
+    # pylint:disable=protected-access
+    def prepare_pattern(pattern):
+        if pattern in (TIMEOUT, EOF):
+            return pattern
+        if isinstance(pattern, spawn.allowed_string_types):
+            return spawn._coerce_expect_string(pattern)
+        return spawn._pattern_type_err(pattern)
+
+    try:
+        pattern_list = iter(pattern_list)
+    except TypeError:
+        spawn._pattern_type_err(pattern_list)
+    return [prepare_pattern(p) for p in pattern_list]
+
+
+class BoundedExpecter(Expecter):
+    """Expecter that only searches new data and bounds the kept data.
+
+    Regular expressions matches are limited to 'max_match' characters, the
+    new data is searched with the previous 'max_match' characters.
+    Exact strings only look back the longest string length, and not before
+    the last newline when no pattern has a newline.
+    With 'max_match' None, regular expressions search the whole buffer.
+
+    Contrary to pexpect 'searchwindowsize', received data is never skipped
+    even when reading more than the window at once.
+    """
+
+    def __init__(self, spawn, searcher, max_match=None,
+                 max_before=MAX_BEFORE):
+        super().__init__(spawn, searcher, None)
+        self.max_match = max_match
+        self.overlap = self.lookback or max_match
+        self.max_before = max_before
+        self.newline = _newline(spawn, searcher)
+
+    def existing_data(self):
+        """Search all the data not consumed by the previous match.
+
+        The buffer was bounded by the previous 'expect' patterns, so when
+        'before' is longer it is searched instead, up to 'max_match'.
+        """
+        # pylint:disable=protected-access
+        spawn = self.spawn
+        window = spawn._buffer.getvalue()
+        if spawn._before.tell() > len(window):
+            window = spawn._before.getvalue()
+            if self.max_match is not None:
+                window = window[-self.max_match:]
+            spawn._buffer = spawn.buffer_type()
+            spawn._buffer.write(window)
+        return self._search(window, len(window))
+
+    def new_data(self, data):
+        """Search 'data' with the end of the previous data."""
+        # pylint:disable=protected-access
+        spawn = self.spawn
+        spawn._before.write(data)
+        spawn._buffer.write(data)
+        window = spawn._buffer.getvalue()
+        return self._search(window, len(data))
+
+    def _search(self, window, freshlen):
+        """Search 'window' and update the spawn as pexpect 'do_search'."""
+        # pylint:disable=protected-access
+        spawn = self.spawn
+        searcher = self.searcher
+        index = searcher.search(window, freshlen, None)
+        if index < 0:
+            self._bound(window)
+            return None
+
+        spawn._buffer = spawn.buffer_type()
+        spawn._buffer.write(window[searcher.end:])
+        spawn.before = spawn._before.getvalue()[
+            0:-(len(window) - searcher.start)]
+        spawn._before = spawn.buffer_type()
+        spawn._before.write(window[searcher.end:])
+        spawn.after = window[searcher.start:searcher.end]
+        spawn.match = searcher.match
+        spawn.match_index = index
+        return index
+
+    def _bound(self, window):
+        """Drop data that cannot be part of a match anymore.
+
+        'before' is cut in half when too big so it is not copied on every
+        read, it always keeps the buffer.
+        """
+        # pylint:disable=protected-access
+        spawn = self.spawn
+        keep = len(window)
+        if self.newline is not None:
+            keep = len(window) - window.rfind(self.newline) - 1
+        if self.overlap is not None:
+            keep = min(keep, self.overlap)
+        if keep < len(window):
+            window = window[len(window) - keep:]
+            spawn._buffer = spawn.buffer_type()
+            spawn._buffer.write(window)
+
+        if spawn._before.tell() > self.max_before:
+            keep = max(self.max_before // 2, len(window))
+            before = spawn._before.getvalue()[-keep:]
+            spawn._before = spawn.buffer_type()
+            spawn._before.write(before)
+
+
+def _newline(spawn, searcher):
+    """Return the newline when exact strings cannot match across lines.
+
+    None for regular expressions or when a string has a newline.
+    """
+    strings = getattr(searcher, '_strings', None)
+    if strings is None:
+        return None
+    # pylint:disable=protected-access
+    newline = spawn._coerce_expect_string('\n')
+    if any(newline in string for _, string in strings):
+        return None
+    return newline
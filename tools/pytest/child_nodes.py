@@ -0,0 +1,381 @@
+"""Lease the test nodes from a pool shared by the concurrent sessions.
+
+Nodes are given per board with '--pool-node BOARD=NODE[,NODE...]' and the
+pool state is kept in '--node-pool DIR'. A lease is a 'flock' on
+'DIR/BOARD/NODE.lock', so the sessions running at the same time, for example
+from several 'pipeline.py' test workers, each get their own nodes, and a node
+is released by the kernel if its session dies.
+
+In a session, the test modules of a board are split between the nodes leased
+for it, at most one node per module, and run concurrently with one worker per
+node as for '--board'. Each worker first runs '--pool-prepare' with the node
+environment, for example 'make flash-only'. When no node of a board is
+available, the session waits '--pool-timeout' seconds for one.
+
+A node is failed when it is unreachable, before or after its tests, when
+'--pool-prepare' fails, when its worker stops or when the 'child' connection
+setup fails. Other setup failures, like a test fixture, do not fail the node.
+It is then quarantined for '--pool-quarantine' seconds and not leased
+meanwhile, its state is in 'DIR/BOARD/NODE.json'.
+
+Backends give the node to the tests in the environment:
+
+* 'iotlab': IoT-LAB nodes, in 'IOTLAB_NODE'
+* 'pty': stand-in without testbed, each node is a pseudo terminal in 'PORT'
+  with '--pool-pty-command' running behind it as the firmware. It is
+  unreachable when the command stopped.
+"""
+
+import os
+import pty
+import sys
+import tty
+import json
+import time
+import fcntl
+import subprocess
+
+from _pytest.reports import TestReport
+
+import child_boards
+
+BACKENDS = ('iotlab', 'pty')
+POOL_TIMEOUT = 600
+QUARANTINE = 3600
+PTY_COMMAND = 'cat'
+POLL_INTERVAL = 1
+
+
+def parse_nodes(values):
+    """Return {board: [nodes]} from 'BOARD=NODE[,NODE...]' values.
+
+    Values can also be space separated lists.
+    """
+    nodes = {}
+    for value in values:
+        for board_nodes in value.split():
+            board, _, names = board_nodes.partition('=')
+            board_list = nodes.setdefault(board, [])
+            for node in names.split(','):
+                if node and node not in board_list:
+                    board_list.append(node)
+    return nodes
+
+
+def pool_from_config(config):
+    """Return the 'NodePool' for the config options or None."""
+    directory = config.getoption('node_pool')
+    if not directory:
+        return None
+    if config.getoption('pool_backend') == 'pty':
+        backend = PtyNodes(config.getoption('pool_pty_command'))
+    else:
+        backend = IotlabNodes()
+    return NodePool(directory, parse_nodes(config.getoption('pool_nodes')),
+                    backend, quarantine=config.getoption('pool_quarantine'))
+
+
+class NodePool():
+    """Nodes per board leased with a lock file in 'directory'."""
+
+    def __init__(self, directory, nodes, backend, quarantine=QUARANTINE):
+        self.directory = directory
+        self.nodes = nodes
+        self.backend = backend
+        self.quarantine = quarantine
+
+    def boards(self):
+        """Boards with nodes in the pool."""
+        return sorted(board for board, nodes in self.nodes.items() if nodes)
+
+    def lease(self, board, count=1, timeout=0):
+        """Lease up to 'count' nodes of 'board'.
+
+        Wait at most 'timeout' seconds for the first one, return the leases,
+        none when no node was available.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            leases = []
+            for node in self.nodes.get(board, []):
+                if len(leases) >= count:
+                    break
+                lease = self._try_lease(board, node)
+                if lease is not None:
+                    leases.append(lease)
+            if leases or time.monotonic() >= deadline:
+                return leases
+            time.sleep(POLL_INTERVAL)
+
+    def _try_lease(self, board, node):
+        if self.quarantined(board, node):
+            return None
+        os.makedirs(os.path.join(self.directory, board), exist_ok=True)
+        lockfd = open(self._path(board, node, '.lock'), 'a')
+        try:
+            fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockfd.close()
+            return None
+
+        # Quarantined by another session before the lock
+        if self.quarantined(board, node):
+            lockfd.close()
+            return None
+        lease = Lease(self, board, node, lockfd)
+        if not self.backend.reachable(board, node):
+            lease.release(failure='unreachable')
+            return None
+        return lease
+
+    def quarantined(self, board, node):
+        """Return True if the node is in quarantine."""
+        until = self.state(board, node).get('quarantined_until', 0)
+        return until > time.time()
+
+    def state(self, board, node):
+        """Return the node saved state."""
+        try:
+            with open(self._path(board, node, '.json')) as statefd:
+                return json.load(statefd)
+        except (OSError, ValueError):
+            return {}
+
+    def update(self, board, node, failure=None):
+        """Record the node lease result, quarantine it on 'failure'.
+
+        Must be called with the node leased.
+        """
+        state = self.state(board, node)
+        if failure is None:
+            state = {'failures': 0}
+        else:
+            state['failures'] = state.get('failures', 0) + 1
+            state['failure'] = failure
+            state['quarantined_until'] = time.time() + self.quarantine
+            print('child_nodes: {} {} quarantined {}s, {}'.format(
+                board, node, self.quarantine, failure), file=sys.stderr)
+
+        path = self._path(board, node, '.json')
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as statefd:
+            json.dump(state, statefd)
+        os.replace(tmp_path, path)
+
+    def _path(self, board, node, extension):
+        return os.path.join(self.directory, board, node + extension)
+
+    def close(self):
+        """Stop the backend."""
+        self.backend.close()
+
+
+class Lease():
+    """Node leased until 'release'."""
+
+    def __init__(self, pool, board, node, lockfd):
+        self.pool = pool
+        self.board = board
+        self.node = node
+        self.env = pool.backend.env(board, node)
+        self._lockfd = lockfd
+
+    def reachable(self):
+        """Return True if the node is still reachable."""
+        return self.pool.backend.reachable(self.board, self.node)
+
+    def release(self, failure=None):
+        """Release the node, quarantine it on 'failure'."""
+        if self._lockfd is None:
+            return
+        try:
+            self.pool.update(self.board, self.node, failure)
+        finally:
+            fcntl.flock(self._lockfd, fcntl.LOCK_UN)
+            self._lockfd.close()
+            self._lockfd = None
+
+
+class IotlabNodes():
+    """IoT-LAB nodes given to the tests in 'IOTLAB_NODE'."""
+
+    @staticmethod
+    def env(board, node):
+        """Return the node environment."""
+        return {'BOARD': board, 'IOTLAB_NODE': node}
+
+    @staticmethod
+    def reachable(board, node):
+        """Reachability is only known when flashing or connecting."""
+        # pylint:disable=unused-argument
+        return True
+
+    def close(self):
+        """Nothing to stop."""
+
+
+class PtyNodes():
+    """Pseudo terminals nodes, with 'command' as firmware behind them.
+
+    The command has the pseudo terminal master as stdin and stdout, the tests
+    open the slave given in 'PORT'.
+    """
+
+    def __init__(self, command=PTY_COMMAND):
+        self.command = command
+        self._nodes = {}
+
+    def env(self, board, node):
+        """Return the node environment."""
+        return {'BOARD': board, 'PORT': self._node(board, node).port}
+
+    def reachable(self, board, node):
+        """Return True if the node command is running."""
+        return self._node(board, node).process.poll() is None
+
+    def _node(self, board, node):
+        """Start the node on its first use."""
+        if (board, node) not in self._nodes:
+            self._nodes[(board, node)] = PtyNode(
+                self.command, dict(os.environ, BOARD=board, POOL_NODE=node))
+        return self._nodes[(board, node)]
+
+    def close(self):
+        """Stop the nodes."""
+        for node in self._nodes.values():
+            node.stop()
+        self._nodes.clear()
+
+
+class PtyNode():
+    """Command running behind a pseudo terminal."""
+
+    def __init__(self, command, env):
+        self.master, self.slave = pty.openpty()
+        # Like a serial port, no echo or line editing
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.process = subprocess.Popen(
+            command, shell=True, env=env, stdin=self.master,
+            stdout=self.master, stderr=subprocess.DEVNULL,
+            start_new_session=True)
+
+    def stop(self):
+        """Stop the command and close the pseudo terminal."""
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class NodeWorker(child_boards.BoardWorker):
+    """Board worker running the items on a leased node."""
+
+    def __init__(self, session, lease, items, prepare=None):
+        super().__init__(session, lease.board, lease.env, items)
+        self.lease = lease
+        self.prepare = prepare
+        self.failure = None
+
+    def _run(self, output):
+        """Run 'prepare' with the node environment before the items."""
+        if self.prepare:
+            subprocess.check_call(self.prepare, shell=True,
+                                  env=dict(os.environ, **self.env))
+        super()._run(output)
+
+    def _result(self, item, reports):
+        """Add if the item 'child' connection failed, set by 'pytest_child'."""
+        result = super()._result(item, reports)
+        config = self.session.config
+        result['child_failed'] = getattr(config, '_child_failed', False)
+        config._child_failed = False  # pylint:disable=protected-access
+        return result
+
+    def get_reports(self, item):
+        """Wait for 'item' reports, remember a 'child' connection failure."""
+        result = self.get_result(item)
+        if self.failure is None and result.get('child_failed'):
+            self.failure = 'child connection failed'
+        return result['reports']
+
+    def finish(self, wait=True):
+        """Wait for the worker and release the node.
+
+        Without 'wait', the node is released without checking the worker.
+        """
+        if not wait:
+            self.lease.release()
+            return
+        failure = 'worker stopped' if self.join() else self.failure
+        if failure is None and not self.lease.reachable():
+            failure = 'unreachable'
+        self.lease.release(failure)
+
+    def __str__(self):
+        return 'board {} node {}'.format(self.board, self.lease.node)
+
+
+class NoNodeWorker():
+    """Fail the items of a board without available node."""
+
+    def __init__(self, board):
+        self.board = board
+
+    def start(self):
+        """Nothing to start."""
+
+    def get_reports(self, item):
+        """Return a failure report."""
+        msg = 'No node available for board {}'.format(self.board)
+        return [TestReport(item.nodeid, item.location, {}, 'failed', msg,
+                           'call')]
+
+    def finish(self, wait=True):
+        """Nothing to release."""
+
+
+def run_nodes(session, pool, prepare=None, timeout=POOL_TIMEOUT):
+    """Run the session items on the pool nodes concurrently.
+
+    A board modules are split between up to one node per module.
+    """
+    workers = {}
+    for board in pool.boards():
+        board_items = [item for item in session.items
+                       if child_boards.item_board(item) == board]
+        if not board_items:
+            continue
+        modules = _modules(board_items)
+        leases = pool.lease(board, len(modules), timeout)
+        if not leases:
+            worker = NoNodeWorker(board)
+            workers.update((item.nodeid, worker) for item in board_items)
+            continue
+        for index, lease in enumerate(leases):
+            node_items = [item for module in modules[index::len(leases)]
+                          for item in module]
+            node_items.sort(key=board_items.index)
+            worker = NodeWorker(session, lease, node_items, prepare)
+            workers.update((item.nodeid, worker) for item in node_items)
+
+    completed = False
+    try:
+        child_boards.run_workers(session, workers)
+        completed = True
+    finally:
+        for worker in dict.fromkeys(workers.values()):
+            worker.finish(wait=completed)
+
+
+def _modules(items):
+    """Group the items by module, in the items order."""
+    modules = {}
+    for item in items:
+        modules.setdefault(item.nodeid.split('::')[0], []).append(item)
+    return list(modules.values())
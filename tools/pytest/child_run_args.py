@@ -0,0 +1,105 @@
+"""Extract the 'testrunner.run' arguments from the test files.
+
+Test files end with:
+
+    if __name__ == "__main__":
+        sys.exit(run(testfunc, timeout=10))
+
+The file is parsed with 'ast' so the formatting does not matter. Arguments
+given as literals are returned as a dict, the test function by its name:
+
+    {'testfunc': 'testfunc', 'timeout': 10}
+
+Results are cached by file path. An entry is still valid when the file
+modification time and size did not change, or when its content has the same
+sha256. The cache is stored with the pytest 'cache' when available.
+"""
+
+import os
+import ast
+import hashlib
+
+# 'testrunner.run' arguments in order
+RUN_PARAMS = ('testfunc', 'timeout', 'echo', 'traceback')
+
+
+def read_run_args(testfile):
+    """Return the 'run' call arguments in 'testfile' or None if not found."""
+    with open(testfile, 'rb') as testfd:
+        tree = ast.parse(testfd.read(), testfile)
+
+    call = _run_call(tree)
+    if call is None:
+        return None
+    return _call_args(call)
+
+
+def _run_call(tree):
+    """Return the first 'run(...)' or 'testrunner.run(...)' call."""
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == 'run':
+            return node
+        if (isinstance(func, ast.Attribute) and func.attr == 'run' and
+                isinstance(func.value, ast.Name) and
+                func.value.id == 'testrunner'):
+            return node
+    return None
+
+
+def _call_args(call):
+    """Arguments of 'call' that are literals or names."""
+    args = dict(zip(RUN_PARAMS, call.args))
+    args.update((kw.arg, kw.value) for kw in call.keywords if kw.arg)
+
+    values = {}
+    for name, value in args.items():
+        if isinstance(value, ast.Name):
+            values[name] = value.id
+            continue
+        try:
+            values[name] = ast.literal_eval(value)
+        except ValueError:
+            pass
+    return values
+
+
+class RunArgsCache():
+    """Cache 'read_run_args' results, saved in pytest 'cache' if given."""
+    KEY = 'pytest_child/run_args'
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.entries = cache.get(self.KEY, {}) if cache is not None else {}
+        self.changed = False
+
+    def get(self, testfile):
+        """Return 'read_run_args(testfile)', cached."""
+        path = os.path.abspath(testfile)
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and (entry['mtime'] == stat.st_mtime_ns and
+                                  entry['size'] == stat.st_size):
+            return entry['args']
+
+        digest = _file_digest(path)
+        if entry is None or entry['sha256'] != digest:
+            entry = {'sha256': digest, 'args': read_run_args(path)}
+        entry.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+        self.entries[path] = entry
+        self.changed = True
+        return entry['args']
+
+    def save(self):
+        """Save the entries if they changed."""
+        if self.cache is None or not self.changed:
+            return
+        self.cache.set(self.KEY, self.entries)
+        self.changed = False
+
+
+def _file_digest(path):
+    with open(path, 'rb') as pathfd:
+        return hashlib.sha256(pathfd.read()).hexdigest()
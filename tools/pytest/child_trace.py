@@ -0,0 +1,240 @@
+#! /usr/bin/env python3
+"""Record the 'child' serial traffic and replay it without the node.
+
+With '--child-record DIR', the data read from and sent to the node by each
+test module are written to a binary trace, 'DIR/MODULE.trace' or
+'DIR/BOARD/MODULE.trace' when running on multiple boards.
+
+With '--child-replay DIR', the 'child' fixture does not connect to the node
+but replays the module trace. The recorded node output is given to 'expect'
+and the data sent by the test must be the recorded one. Node output recorded
+after some sent data is only given once the test sent it. When the test sends
+something else, or more, or the trace ends, 'expect' gets an 'EOF'.
+
+'--child-replay-speed' gives the replay speed, '1' for real time and '0',
+the default, for as fast as possible. As fast as possible, 'expect' gets its
+'TIMEOUT' at once instead of waiting for it when the replay waits for data the
+test did not send, so a test runs in milliseconds. With multiple '--board',
+each board traces are replayed concurrently in its worker.
+
+The trace is a header, 'MAGIC' and the JSON metadata size and content, then
+records of the time since the previous record in microseconds, the kind and
+the data size, followed by the data.
+
+Traces can be printed with:
+
+    child_trace.py dump DIR/BOARD/tests/01-run.py.trace
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+
+MAGIC = b'CHILDTRACE1\n'
+HEADER = struct.Struct('<I')
+RECORD = struct.Struct('<IBI')
+# Records kinds
+READ, SENT, EOF = 0, 1, 2
+KINDS = {READ: 'read', SENT: 'sent', EOF: 'eof'}
+MAX_DELAY = 2 ** 32 - 1
+
+
+def trace_path(directory, nodeid, board=None):
+    """Trace path for the test module 'nodeid'."""
+    path = nodeid.split('::')[0] + '.trace'
+    if board is not None:
+        path = os.path.join(board, path)
+    return os.path.join(directory, path)
+
+
+class TraceRecorder():
+    """Write the records to a trace file."""
+
+    def __init__(self, path, metadata=None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._tracefd = open(path, 'wb')
+        header = json.dumps(dict(metadata or {}, time=time.time()))
+        header = header.encode('utf-8')
+        self._tracefd.write(MAGIC + HEADER.pack(len(header)) + header)
+        self._last = time.monotonic()
+
+    def read(self, data):
+        """Record data read from the node."""
+        self._record(READ, data)
+
+    def sent(self, data):
+        """Record data sent to the node."""
+        self._record(SENT, data)
+
+    def eof(self):
+        """Record the end of the node output."""
+        self._record(EOF, b'')
+
+    def _record(self, kind, data):
+        if self._tracefd is None:
+            return
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        now = time.monotonic()
+        delay = min(int((now - self._last) * 1e6), MAX_DELAY)
+        self._last = now
+        self._tracefd.write(RECORD.pack(delay, kind, len(data)) + data)
+
+    def close(self):
+        """Close the trace file."""
+        if self._tracefd is not None:
+            self._tracefd.close()
+            self._tracefd = None
+
+
+def read_trace(path):
+    """Return the trace metadata and its records.
+
+    Records are '(time, kind, data)' with the time since the trace start.
+    """
+    with open(path, 'rb') as tracefd:
+        if tracefd.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a child trace'.format(path))
+        size, = HEADER.unpack(tracefd.read(HEADER.size))
+        metadata = json.loads(tracefd.read(size).decode('utf-8'))
+
+        records = []
+        elapsed = 0.0
+        while True:
+            header = tracefd.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            delay, kind, size = RECORD.unpack(header)
+            elapsed += delay / 1e6
+            records.append((elapsed, kind, tracefd.read(size)))
+    return metadata, records
+
+
+class TraceReplay():
+    """Write the recorded node output to a pipe in sync with the sent data.
+
+    'readfd' is the node output, closed by its reader, the sent data is given
+    to 'sent'. 'error' is set when it differs from the recorded one.
+    """
+
+    def __init__(self, path, speed=0):
+        self.path = path
+        self.speed = speed
+        self.metadata, self._records = read_trace(path)
+        self._expected = b''.join(data for _, kind, data in self._records
+                                  if kind == SENT)
+        self.readfd, self._writefd = os.pipe()
+        self.error = None
+        self._sent = b''
+        self._waiting = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def sent(self, data):
+        """Check the data sent by the test against the recorded one."""
+        with self._cond:
+            self._sent += data
+            if not self._expected.startswith(self._sent):
+                self.error = 'Replay sent {!r}, recorded {!r}'.format(
+                    self._sent[-len(data):],
+                    self._expected[len(self._sent) - len(data):][:len(data)])
+            self._cond.notify_all()
+
+    def stalled(self):
+        """Return True if the replay waits for data not sent yet.
+
+        The node output before is already in the pipe.
+        """
+        with self._cond:
+            return self.error is not None or (
+                self._waiting is not None and len(self._sent) < self._waiting)
+
+    def _run(self):
+        expected = 0
+        origin = time.monotonic()
+        for elapsed, kind, data in self._records:
+            if kind == SENT:
+                expected += len(data)
+                continue
+            waited = self._wait_sent(expected)
+            if waited is None:
+                break
+            if waited:
+                # Keep the recorded delays from when the test sent the data
+                origin = time.monotonic() - elapsed / (self.speed or 1)
+            if self.speed:
+                time.sleep(max(0, origin + elapsed / self.speed -
+                               time.monotonic()))
+            if kind == EOF:
+                break
+            try:
+                os.write(self._writefd, data)
+            except OSError:
+                # Reader closed
+                break
+        os.close(self._writefd)
+
+    def _wait_sent(self, expected):
+        """Wait for the test to send 'expected' bytes.
+
+        Returns if it waited, None on error or when closed.
+        """
+        with self._cond:
+            waited = len(self._sent) < expected
+            while (len(self._sent) < expected and self.error is None and
+                   not self._closed):
+                self._waiting = expected
+                self._cond.wait()
+            self._waiting = None
+            if self.error is not None or self._closed:
+                return None
+            return waited
+
+    def close(self):
+        """Stop the replay, after 'readfd' is closed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+def dump(opts):
+    """Print the trace records."""
+    metadata, records = read_trace(opts.trace)
+    print(json.dumps(metadata, sort_keys=True))
+    for elapsed, kind, data in records:
+        print('{:10.6f} {:4} {!r}'.format(elapsed, KINDS.get(kind, kind),
+                                          data))
+
+
+PARSER = argparse.ArgumentParser(
+    description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+SUBPARSERS = PARSER.add_subparsers(dest='command')
+SUBPARSERS.required = True
+DUMP = SUBPARSERS.add_parser('dump', help='Print a trace')
+DUMP.add_argument('trace', help='Trace file')
+
+COMMANDS = {
+    'dump': dump,
+}
+
+
+def main():
+    """Run the command."""
+    opts = PARSER.parse_args()
+    try:
+        COMMANDS[opts.command](opts)
+    except (OSError, ValueError) as err:
+        print(err, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
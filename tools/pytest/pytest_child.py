@@ -3,33 +3,222 @@ pytest integration helper for 'testrunner'.
 
 Logging on the console while running tests can be disabled by setting
 environment variable TEST_LOG_CONSOLE=0 (default: 1)
+The console is written from a background thread so a slow console does not
+block the tests. At most TEST_CONSOLE_QUEUE chunks (default: 1024) are
+queued, then console output is dropped and summarized. The captured output
+used in the junit-xml report is always complete.
+
+Tests can be run on multiple boards concurrently with
+'--board BOARD[=IOTLAB_NODE]' given multiple times. The 'child' fixture is
+parametrized with the boards and each board runs in its own worker process.
+Use '{board}' in '--junit-prefix' to get each board in the junit classname.
+See 'child_boards.py'.
+
+Nodes can also be leased from a pool shared by the concurrent sessions with
+'--node-pool DIR' and '--pool-node BOARD=NODE[,NODE...]', a board tests are
+then run on several nodes concurrently and failed nodes are quarantined.
+'--pool-backend pty' emulates the nodes serial ports locally.
+See 'child_nodes.py'.
+
+Tests can also be coroutines using the 'async_child' fixture. It provides
+awaitable 'expect' and 'expect_exact' so one event loop can wait on many
+nodes, for example with 'asyncio.gather'.
+
+Connections to the node can be kept open between test modules by setting
+environment variable TEST_CHILD_POOL=1 (default: 0). The node is then only
+reset and the pending output flushed between modules.
+
+To handle high rate output, only new data is searched by 'expect_exact' and
+data is read by TEST_MAXREAD chunks (default: 16384). Regular expressions
+search the whole buffer as with pexpect, setting TEST_MAX_MATCH limits their
+matches to that many characters so only new data is searched too (default: 0
+for unlimited). See 'child_match.py'.
+
+The 'child' serial traffic can be recorded to a trace per test module with
+'--child-record DIR' and replayed without the node with '--child-replay DIR',
+in real time or as fast as possible. See 'child_trace.py'.
+
+Files where no test is supported are remembered in the pytest cache and not
+collected again until they change, see 'child_collect.py'.
 
 The test timeout is extracted if possible from the 'testrunner.run' timeout
-argument (text extracted)
+argument. The test file is parsed with 'ast' and the result cached in the
+pytest cache, see 'child_run_args.py'. The 'pytest_child_timeout(item)' hook
+returns the timeout used for an item and can be implemented in a
+'conftest.py' to override it.
 """
 import os
 import sys
-import re
+import time
+import queue
+import select
+import asyncio
+import threading
+import subprocess
 
 import pexpect
+from pexpect.expect import searcher_re, searcher_string
+from pexpect.fdpexpect import fdspawn
 import pytest
+from _pytest.reports import CollectReport
 
 from testrunner.spawn import setup_child, teardown_child
 
+import child_boards
+import child_collect
+import child_hooks
+import child_match
+import child_nodes
+import child_run_args
+import child_trace
+
 
 TEST_LOG_CONSOLE = bool(int(os.environ.get('TEST_LOG_CONSOLE', '1')))
+TEST_CONSOLE_QUEUE = int(os.environ.get('TEST_CONSOLE_QUEUE', '1024'))
+TEST_CHILD_POOL = bool(int(os.environ.get('TEST_CHILD_POOL', '0')))
+TEST_MAX_MATCH = int(os.environ.get('TEST_MAX_MATCH', '0'))
+TEST_MAXREAD = int(os.environ.get('TEST_MAXREAD', '16384'))
+REPLAY_POLL = 0.01
 PYTEST_PROPERTIES_VAR = 'PYTEST_PROPERTIES'
 
 
+def pytest_addhooks(pluginmanager):
+    """Add the 'pytest_child' hooks."""
+    pluginmanager.add_hookspecs(child_hooks)
+
+
+def pytest_configure(config):
+    """Load the test files 'run' arguments and collection caches."""
+    # pylint:disable=protected-access
+    cache = getattr(config, 'cache', None)
+    config._child_run_args = child_run_args.RunArgsCache(cache)
+    config._child_collection = child_collect.CollectionCache(
+        cache, SUPPORTED_FIXTURES, SUPPORTED_TEST_NAMES)
+    config._child_node_pool = child_nodes.pool_from_config(config)
+
+
+def pytest_addoption(parser):
+    """Add the boards options."""
+    parser.addoption('--board', default=[], action='append', dest='boards',
+                     metavar='BOARD[=IOTLAB_NODE]',
+                     help='Run the tests on BOARD, can be given multiple '
+                          'times to run on boards concurrently')
+    parser.addoption('--node-pool', metavar='DIR',
+                     help='Lease the nodes from the pool with its state in '
+                          'DIR, shared by the concurrent sessions')
+    parser.addoption('--pool-node', default=[], action='append',
+                     dest='pool_nodes', metavar='BOARD=NODE[,NODE...]',
+                     help='Pool nodes of BOARD, can be given multiple times')
+    parser.addoption('--pool-backend', default='iotlab',
+                     choices=child_nodes.BACKENDS,
+                     help="Pool nodes type, 'pty' emulates them locally")
+    parser.addoption('--pool-pty-command', default=child_nodes.PTY_COMMAND,
+                     metavar='CMD',
+                     help="Firmware stand-in of the 'pty' nodes")
+    parser.addoption('--pool-prepare', metavar='CMD',
+                     help="Command run for each leased node before its "
+                          "tests, like 'make flash-only'")
+    parser.addoption('--pool-timeout', default=child_nodes.POOL_TIMEOUT,
+                     type=float, metavar='SECONDS',
+                     help='Time to wait for a node of a board')
+    parser.addoption('--pool-quarantine', default=child_nodes.QUARANTINE,
+                     type=float, metavar='SECONDS',
+                     help='Time a failed node is not leased')
+    parser.addoption('--child-record', metavar='DIR',
+                     help="Record each module 'child' traffic in DIR")
+    parser.addoption('--child-replay', metavar='DIR',
+                     help="Replay the 'child' traffic recorded in DIR "
+                          "instead of using the nodes")
+    parser.addoption('--child-replay-speed', default=0, type=float,
+                     metavar='FACTOR',
+                     help='Replay speed, 1 for real time, default: 0 for as '
+                          'fast as possible')
+
+
+def pytest_generate_tests(metafunc):
+    """Parametrize 'child' or 'async_child' with the boards."""
+    boards = _boards(metafunc.config)
+    if not boards:
+        return
+    for fixture in child_boards.CHILD_FIXTURES:
+        if fixture in metafunc.fixturenames:
+            metafunc.parametrize(fixture, sorted(boards), indirect=True,
+                                 scope='module')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session):
+    """Run the items on each board or node in its own worker when given."""
+    boards = _boards(session.config)
+    if not boards:
+        return None
+
+    config = session.config
+    if session.testsfailed and not config.option.continue_on_collection_errors:
+        raise session.Interrupted('%d errors during collection' %
+                                  session.testsfailed)
+    if config.option.collectonly:
+        return True
+
+    # Session fixtures are only run in the workers
+    _set_junitxml_properties(config)
+    pool = config._child_node_pool  # pylint:disable=protected-access
+    if pool is not None:
+        child_nodes.run_nodes(session, pool,
+                              prepare=config.getoption('pool_prepare'),
+                              timeout=config.getoption('pool_timeout'))
+    else:
+        child_boards.run_boards(session, boards)
+    return True
+
+
+def _boards(config):
+    """Return the boards of the node pool or of '--board'."""
+    pool = config._child_node_pool  # pylint:disable=protected-access
+    if pool is not None:
+        return pool.boards()
+    return child_boards.parse_boards(config.getoption('boards'))
+
+
 #
 # Handling of pytest auto-wrapping of the RIOT tests
 #
 
-SUPPORTED_TEST_NAMES = {'testfunc'}
-SUPPORTED_FIXTURES = {
+SUPPORTED_TEST_NAMES = frozenset({'testfunc'})
+SUPPORTED_FIXTURES = frozenset({
     'child', 'request',
+    'async_child', 'child_pool',
     'riot_set_junitxml_properties',
-}
+})
+
+
+if int(pytest.__version__.split('.')[0]) >= 7:
+    def pytest_ignore_collect(collection_path, config):
+        """Ignore unchanged files without supported tests."""
+        # pylint:disable=protected-access
+        return config._child_collection.ignore(str(collection_path)) or None
+else:
+    def pytest_ignore_collect(path, config):
+        """Ignore unchanged files without supported tests, before pytest 7."""
+        # pylint:disable=protected-access
+        return config._child_collection.ignore(str(path)) or None
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_make_collect_report(collector):
+    """Do not import unchanged test files without supported tests.
+
+    Files given on the command line, as by 'pytest.mk.post', are not passed
+    to 'pytest_ignore_collect'.
+    """
+    if not isinstance(collector, pytest.Module):
+        return None
+    # 'path' replaces 'fspath' since pytest 7
+    path = getattr(collector, 'path', None) or collector.fspath
+    # pylint:disable=protected-access
+    if not collector.config._child_collection.ignore(str(path)):
+        return None
+    return CollectReport(collector.nodeid, 'passed', None, [])
 
 
 def pytest_collection_modifyitems(config, items):
@@ -37,62 +226,56 @@ def pytest_collection_modifyitems(config, items):
 
     * Only the 'child' fixture is currently supported
     * Only try to detect 'testfunc'
+
+    Files without supported tests are recorded in the collection cache.
     """
-    selected = items
-    deselected = []
+    selected, deselected, unsupported = child_collect.filter_supported(
+        items, SUPPORTED_FIXTURES, SUPPORTED_TEST_NAMES)
 
-    selected, deselected = _keep_supported_fixtures(selected, deselected,
-                                                    SUPPORTED_FIXTURES)
-    selected, deselected = _keep_supported_testfuncs(selected, deselected,
-                                                     SUPPORTED_TEST_NAMES)
+    if deselected:
+        print(child_collect.deselected_summary(deselected, unsupported),
+              file=sys.stderr)
+    config._child_collection.update(  # pylint:disable=protected-access
+        selected, deselected)
 
     config.hook.pytest_deselected(items=deselected)
     items[:] = selected
 
 
-def _keep_supported_fixtures(items, deselected, supported_fixtures):
-    """Keep functions that have supported suppported_fixtures."""
-    selected = []
-    supported_fixtures = set(supported_fixtures)
+def pytest_collection_finish(session):
+    """Read the test files 'run' arguments once before running the tests.
 
-    for item in items:
-        unsupported = (set(getattr(item, 'fixturenames', ())) -
-                       supported_fixtures)
-        if not unsupported:
-            selected.append(item)
-        else:
-            print('Unsupported fixtures: {}'.format(unsupported),
-                  file=sys.stderr)
-            deselected.append(item)
-    return selected, deselected
-
-
-def _keep_supported_testfuncs(items, deselected, supported_names):
-    """Keep functions that have a supported name."""
-    selected = []
-    for item in items:
-        if item.name in set(supported_names):
-            selected.append(item)
-        else:
-            deselected.append(item)
-    return selected, deselected
+    So board workers get them and they are saved in the cache.
+    """
+    # pylint:disable=protected-access
+    run_args = session.config._child_run_args
+    for testfile in {item.module.__file__ for item in session.items
+                     if getattr(item, 'module', None) is not None}:
+        try:
+            run_args.get(testfile)
+        except (OSError, SyntaxError, ValueError):
+            pass
 
 
 @pytest.fixture(scope="session", autouse=True)
 def riot_set_junitxml_properties(request, props_var=PYTEST_PROPERTIES_VAR):
     """Add properties to junitxml file."""
-    try:
-        config_xml = getattr(request.config, "_xml", None)
-    except AttributeError:
-        pass
-    else:
-        properties = os.environ.get(props_var, '').split(' ')
-        for prop in properties:
+    _set_junitxml_properties(request.config, props_var)
+
+
+def _set_junitxml_properties(config, props_var=PYTEST_PROPERTIES_VAR):
+    """Add the properties once, also called before running on the boards."""
+    config_xml = child_boards.junitxml(config)
+    if config_xml is None:
+        return
+    added = {name for name, _ in config_xml.global_properties}
+    for prop in os.environ.get(props_var, '').split():
+        if prop not in added:
             config_xml.add_global_property(prop, os.environ[prop])
 
 
-class CustomSpawn(pexpect.spawn):
-    """Convenient subclass to better catch pexpect timeout and eof errors.
+class ChildSpawnMixin():
+    """Convenient mixin to better catch pexpect timeout and eof errors.
 
     Catch the pexpect exceptions and replace the value wih the called pattern.
     At the same time, remove all traceback and context as we do not care about
@@ -101,30 +284,365 @@ class CustomSpawn(pexpect.spawn):
 
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('encoding', 'utf-8')
+        kwargs.setdefault('maxread', TEST_MAXREAD)
+        self.max_match = kwargs.pop('max_match', TEST_MAX_MATCH or None)
         super().__init__(*args, **kwargs)
 
+    def compile_pattern_list(self, patterns):
+        """Compile patterns only once for the same patterns."""
+        return child_match.compile_pattern_list(
+            self, patterns, super().compile_pattern_list)
+
     def expect(self, pattern, *args, **kwargs):
         # pylint:disable=arguments-differ
         try:
             return super().expect(pattern, *args, **kwargs)
         except (pexpect.TIMEOUT, pexpect.EOF) as exc:
-            exc.orig_value = exc.value
-            exc.value = pattern
-            raise exc.with_traceback(None) from None
+            raise _pattern_exception(exc, pattern) from None
 
-    def expect_exact(self, pattern, *args, **kwargs):
+    def expect_list(self, pattern_list, timeout=-1, searchwindowsize=-1,
+                    async_=False, **kw):
+        """Same as pexpect 'expect_list' with 'BoundedExpecter'.
+
+        An explicit 'searchwindowsize' uses the pexpect implementation.
+        """
+        # pylint:disable=arguments-differ
+        if async_ or kw or searchwindowsize != -1:
+            return super().expect_list(pattern_list, timeout,
+                                       searchwindowsize, async_, **kw)
+        if timeout == -1:
+            timeout = self.timeout
+        expecter = child_match.BoundedExpecter(
+            self, searcher_re(pattern_list), self.max_match)
+        return expecter.expect_loop(timeout)
+
+    def expect_exact(self, pattern, timeout=-1, searchwindowsize=-1):
+        """Same as pexpect 'expect_exact' with 'BoundedExpecter'.
+
+        An explicit 'searchwindowsize' uses the pexpect implementation.
+        """
         # pylint:disable=arguments-differ
         try:
-            return super().expect_exact(pattern, *args, **kwargs)
+            if searchwindowsize != -1:
+                return super().expect_exact(pattern, timeout,
+                                            searchwindowsize)
+            if timeout == -1:
+                timeout = self.timeout
+            patterns = child_match.exact_patterns(self, pattern)
+            expecter = child_match.BoundedExpecter(
+                self, searcher_string(patterns))
+            return expecter.expect_loop(timeout)
+        except (pexpect.TIMEOUT, pexpect.EOF) as exc:
+            raise _pattern_exception(exc, pattern) from None
+
+
+class CustomSpawn(ChildSpawnMixin, pexpect.spawn):
+    """Node terminal process.
+
+    Data read and sent is recorded with 'recorder' when set.
+    """
+    recorder = None
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Same as pexpect 'read_nonblocking', recorded."""
+        try:
+            data = super().read_nonblocking(size, timeout)
+        except pexpect.EOF:
+            if self.recorder is not None:
+                self.recorder.eof()
+            raise
+        if self.recorder is not None:
+            self.recorder.read(data)
+        return data
+
+    def send(self, s):
+        """Same as pexpect 'send', recorded."""
+        if self.recorder is not None:
+            self.recorder.sent(self._coerce_send_string(s))
+        return super().send(s)
+
+
+class ReplaySpawn(ChildSpawnMixin, fdspawn):
+    """Node terminal replayed from a 'child_trace.TraceReplay'.
+
+    As fast as possible, when the replay waits for data the test did not send,
+    nothing more will be read so 'expect' gets its TIMEOUT at once. The
+    awaitable 'expect' only reads when there is data so still waits for its
+    timeout. EOF is only for a replay error or the end of the trace.
+    """
+
+    def __init__(self, replay, **kwargs):
+        self.replay = replay
+        super().__init__(replay.readfd, **kwargs)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Read the replayed data."""
+        if timeout == -1:
+            timeout = self.timeout
+        if not self.replay.speed:
+            self._wait_replay(timeout)
+            timeout = 0
+        try:
+            return super().read_nonblocking(size, timeout)
+        except pexpect.EOF:
+            error = self.replay.error or 'Replay of {} ended'.format(
+                self.replay.path)
+            raise pexpect.EOF(error) from None
+
+    def _wait_replay(self, timeout):
+        """Wait for replayed data until 'timeout', EOF on a replay error.
+
+        Returns on timeout, or when the replay stalled as no data will come,
+        for 'read_nonblocking' to raise TIMEOUT.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stalled = self.replay.stalled()
+            readable, _, _ = select.select([self.child_fd], [], [],
+                                           0 if stalled else REPLAY_POLL)
+            if readable:
+                return
+            if self.replay.error is not None:
+                raise pexpect.EOF(self.replay.error)
+            if stalled:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+
+    def send(self, s):
+        """Give the data to the replay."""
+        s = self._coerce_send_string(s)
+        self._log(s, 'send')
+        data = self._encoder.encode(s, final=False)
+        self.replay.sent(data)
+        return len(data)
+
+    def close(self):
+        """Close the replayed data and stop the replay."""
+        super().close()
+        self.replay.close()
+
+
+class AsyncSpawnMixin():
+    """Mixin with awaitable 'expect' and 'expect_exact'.
+
+    The spawn file descriptor is watched by the running event loop instead of
+    blocking in 'select', and data is matched with 'BoundedExpecter'.
+    Exceptions are rewritten as in ChildSpawnMixin.
+    """
+
+    async def expect(self, pattern, timeout=-1, searchwindowsize=-1):
+        # pylint:disable=arguments-differ,invalid-overridden-method
+        searcher = searcher_re(self.compile_pattern_list(pattern))
+        return await self._expect_async(pattern, searcher, timeout,
+                                        self.max_match)
+
+    async def expect_exact(self, pattern, timeout=-1, searchwindowsize=-1):
+        # pylint:disable=arguments-differ,invalid-overridden-method
+        patterns = child_match.exact_patterns(self, pattern)
+        return await self._expect_async(pattern, searcher_string(patterns),
+                                        timeout)
+
+    async def _expect_async(self, pattern, searcher, timeout, max_match=None):
+        if timeout == -1:
+            timeout = self.timeout
+        expecter = child_match.BoundedExpecter(self, searcher, max_match)
+        try:
+            index = expecter.existing_data()
+            if index is None:
+                index = await self._wait_match(expecter, timeout)
         except (pexpect.TIMEOUT, pexpect.EOF) as exc:
-            exc.orig_value = exc.value
-            exc.value = pattern
-            raise exc.with_traceback(None) from None
+            raise _pattern_exception(exc, pattern) from None
+        return index
+
+    async def _wait_match(self, expecter, timeout):
+        """Read data when available until 'expecter' matches."""
+        loop = asyncio.get_event_loop()
+        match = loop.create_future()
+
+        def _readable():
+            if match.done():
+                return
+            try:
+                try:
+                    data = self.read_nonblocking(self.maxread, 0)
+                    index = expecter.new_data(data)
+                except pexpect.EOF as exc:
+                    index = expecter.eof(exc)
+            except pexpect.TIMEOUT:
+                # Nothing to read
+                return
+            except Exception as exc:  # pylint:disable=broad-except
+                expecter.errored()
+                match.set_exception(exc)
+                return
+            if index is not None:
+                match.set_result(index)
+
+        loop.add_reader(self.child_fd, _readable)
+        try:
+            return await asyncio.wait_for(match, timeout)
+        except asyncio.TimeoutError as exc:
+            return expecter.timeout(exc)
+        finally:
+            loop.remove_reader(self.child_fd)
+
+
+class AsyncCustomSpawn(AsyncSpawnMixin, CustomSpawn):
+    """CustomSpawn with awaitable 'expect' and 'expect_exact'."""
+
+
+class AsyncReplaySpawn(AsyncSpawnMixin, ReplaySpawn):
+    """ReplaySpawn with awaitable 'expect' and 'expect_exact'."""
+
+
+def _pattern_exception(exc, pattern):
+    """Replace 'exc' value with 'pattern' and remove its traceback."""
+    exc.orig_value = exc.value
+    exc.value = pattern
+    return exc.with_traceback(None)
+
+
+_EVENT_LOOP = None
+
+
+def event_loop():
+    """Return the event loop used for the coroutine tests."""
+    global _EVENT_LOOP  # pylint:disable=global-statement
+    if _EVENT_LOOP is None or _EVENT_LOOP.is_closed():
+        _EVENT_LOOP = asyncio.new_event_loop()
+        asyncio.set_event_loop(_EVENT_LOOP)
+    return _EVENT_LOOP
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run coroutine test functions until complete in the event loop."""
+    if not asyncio.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    # pylint:disable=protected-access
+    funcargs = {arg: pyfuncitem.funcargs[arg]
+                for arg in pyfuncitem._fixtureinfo.argnames}
+    event_loop().run_until_complete(pyfuncitem.obj(**funcargs))
+    return True
+
+
+def pytest_sessionfinish(session):
+    """Close the coroutine tests event loop and write the console output.
+
+    Also save the test files 'run' arguments and collection caches.
+    """
+    # pylint:disable=protected-access
+    session.config._child_run_args.save()
+    session.config._child_collection.save()
+    if session.config._child_node_pool is not None:
+        session.config._child_node_pool.close()
+    if _EVENT_LOOP is not None:
+        _EVENT_LOOP.close()
+    _close_console_writer()
+
+
+def pytest_child_worker_finish(session):
+    """Write the board worker console output before it exits."""
+    # pylint:disable=unused-argument
+    _close_console_writer()
+
+
+class ChildPool():
+    """Keep the 'child' connections open for the whole session.
+
+    Connections are identified by the node 'BOARD', 'PORT' and 'IOTLAB_NODE'.
+    When reused, the pending output is flushed and the node reset.
+    """
+    KEY_VARS = ('BOARD', 'PORT', 'IOTLAB_NODE')
+
+    def __init__(self):
+        self._children = {}
+
+    def get(self, timeout_kwargs, logfile, env=None):
+        """Return a connection, setup a new one if needed."""
+        env = os.environ if env is None else env
+        key = tuple(env.get(var) for var in self.KEY_VARS)
+
+        _child = self._children.get(key)
+        if _child is not None and _child.isalive():
+            _flush_child(_child)
+            _reset_node(env)
+            _child.logfile = logfile
+            _child.timeout = timeout_kwargs.get('timeout', _child.timeout)
+            return _child
+
+        if _child is not None:
+            teardown_child(_child)
+        _child = setup_child(spawnclass=CustomSpawn, logfile=logfile,
+                             env=env, **timeout_kwargs)
+        self._children[key] = _child
+        return _child
+
+    def close(self):
+        """Teardown all connections."""
+        for _child in self._children.values():
+            teardown_child(_child)
+        self._children.clear()
+
+
+def _flush_child(_child):
+    """Drop the output received since the last 'expect'."""
+    _child.logfile = None
+    try:
+        while True:
+            _child.read_nonblocking(size=4096, timeout=0)
+    except (pexpect.TIMEOUT, pexpect.EOF):
+        pass
+    _child.buffer = _child.string_type()
+    _child.before = _child.string_type()
+
+
+def _reset_node(env):
+    """Reset the node as done by 'testrunner'."""
+    try:
+        subprocess.check_output(('make', 'reset'), env=env,
+                                stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError:
+        # make reset yields error on some boards even if successful
+        pass
+
+
+@pytest.fixture(scope="session")
+def child_pool():
+    """Pool of 'child' connections reused between modules."""
+    pool = ChildPool()
+    yield pool
+    pool.close()
 
 
 @pytest.fixture(scope="module")
-def child(request, timeout=None, logconsole=TEST_LOG_CONSOLE):
-    """Implement the 'child' fixture."""
+def child(request, child_pool, timeout=None, logconsole=TEST_LOG_CONSOLE,
+          use_pool=TEST_CHILD_POOL):
+    """Implement the 'child' fixture.
+
+    With 'use_pool', the connection is taken from the 'child_pool' and only
+    reset at the end.
+    """
+    # pylint:disable=redefined-outer-name,too-many-arguments
+    pool = child_pool if use_pool else None
+    yield from _child(request, CustomSpawn, pool, timeout, logconsole)
+
+
+@pytest.fixture(scope="module")
+def async_child(request, timeout=None, logconsole=TEST_LOG_CONSOLE):
+    """Implement the 'async_child' fixture for coroutine tests.
+
+    It is not taken from the 'child_pool' as the spawn class differs.
+    """
+    # Create the loop first so the spawn uses it
+    event_loop()
+    yield from _child(request, AsyncCustomSpawn, None, timeout, logconsole)
+
+
+def _child(request, spawnclass, pool, timeout, logconsole):
+    """Setup the child, yield it and teardown it when not from 'pool'."""
+    # pylint:disable=too-many-arguments
     timeout_kwargs = {}
     timeout = _test_timeout(request, timeout)
     if timeout is not None:
@@ -132,63 +650,234 @@ def child(request, timeout=None, logconsole=TEST_LOG_CONSOLE):
 
     logfile = ConsoleAndCapture() if logconsole else sys.stdout
 
-    _child = setup_child(spawnclass=CustomSpawn,
-                         logfile=logfile, **timeout_kwargs)
+    replay_dir = request.config.getoption('child_replay')
+    if replay_dir:
+        spawn = _replay_spawn(request, spawnclass, replay_dir, logfile,
+                              timeout_kwargs)
+        yield spawn
+        print("")
+        if spawn.replay.error:
+            print(spawn.replay.error)
+        spawn.close()
+        return
 
-    yield _child
+    env = _board_env(request)
+    recorder = _recorder(request, timeout)
+
+    try:
+        if pool is not None:
+            spawn = pool.get(timeout_kwargs, logfile, env=env)
+        else:
+            spawn = setup_child(spawnclass=spawnclass, env=env,
+                                logfile=logfile, **timeout_kwargs)
+    except Exception:
+        # The node failed, not the test, for 'child_nodes' quarantine
+        request.config._child_failed = True  # pylint:disable=protected-access
+        raise
+    _record(spawn, recorder)
+
+    if pool is not None:
+        yield spawn
+        print("")
+        _record(spawn, None)
+        return
+
+    yield spawn
 
     print("")
-    teardown_child(_child)
+    _record(spawn, None)
+    teardown_child(spawn)
 
 
-def _test_timeout(request, timeout=None):
-    """Try to extract the timeout from the calling 'request' context.
+def _recorder(request, timeout):
+    """Return the module trace recorder if recording."""
+    directory = request.config.getoption('child_record')
+    if not directory:
+        return None
+    board = getattr(request, 'param', None)
+    path = child_trace.trace_path(directory, request.node.nodeid, board)
+    return child_trace.TraceRecorder(path, {
+        'nodeid': request.node.nodeid, 'timeout': timeout,
+        'board': board or os.environ.get('BOARD')})
+
+
+def _record(spawn, recorder):
+    """Set 'spawn' recorder, the already read data is recorded first.
 
-    Returns 'timeout' if not None otherwise, check the text of the script
-    to find `run` 'timeout=' argument
+    The previous recorder is closed.
     """
-    if timeout is None:
-        timeout = _read_run_timeout(request.module.__file__)
-    return timeout
+    if spawn.recorder is not None:
+        spawn.recorder.close()
+    spawn.recorder = recorder
+    if recorder is not None and spawn.buffer:
+        recorder.read(spawn.buffer)
+
+
+def _replay_spawn(request, spawnclass, directory, logfile, timeout_kwargs):
+    """Return the spawn replaying the module trace."""
+    path = child_trace.trace_path(directory, request.node.nodeid,
+                                  getattr(request, 'param', None))
+    replay = child_trace.TraceReplay(
+        path, request.config.getoption('child_replay_speed'))
+    replayclass = ReplaySpawn
+    if issubclass(spawnclass, AsyncSpawnMixin):
+        replayclass = AsyncReplaySpawn
+    spawn = replayclass(replay, **timeout_kwargs)
+    spawn.logfile = logfile
+    return spawn
+
+
+def _board_env(request):
+    """Return the environment for the board 'child' is parametrized with.
+
+    Returns None, so the current environment, when not parametrized or
+    running on a pool node as its worker has the node environment.
+    """
+    board = getattr(request, 'param', None)
+    boards = child_boards.parse_boards(request.config.getoption('boards'))
+    if board not in boards:
+        return None
+    return dict(os.environ, **boards[board])
 
 
-def _read_run_timeout(testfile):
-    """Return the 'timeout' value from the test file.
+def _test_timeout(request, timeout=None):
+    """Try to extract the timeout from the calling 'request' context.
 
-    This is a hack to extract timeout from the test file.
+    Returns 'timeout' if not None otherwise, the 'pytest_child_timeout' hook
+    result for the requesting item.
     """
-    run_args_re = re.compile(r'^    sys.exit\(run\([^,]+(.*)\)\)$')
-    timeout_re = re.compile(r'timeout=(\d+)')
+    if timeout is None:
+        # pylint:disable=protected-access
+        timeout = request.config.hook.pytest_child_timeout(
+            item=request._pyfuncitem)
+    return timeout
 
-    with open(testfile) as testfd:
-        for line in testfd:
-            args_match = run_args_re.match(line)
-            if not args_match:
-                continue
-            run_args = args_match.group(1)
 
-            # Found the 'run' function and arguments
+@pytest.hookimpl(trylast=True)
+def pytest_child_timeout(item):
+    """Return the test file 'run' 'timeout' argument."""
+    # pylint:disable=protected-access
+    return _read_run_timeout(item.module.__file__, item.config._child_run_args)
 
-            timeout_match = timeout_re.search(run_args)
-            if not timeout_match:
-                return None
-            timeout = timeout_match.group(1)
 
-            return int(timeout)
+def _read_run_timeout(testfile, run_args_cache=None):
+    """Return the 'timeout' value from the test file.
 
-    raise ValueError("Could not extract 'timeout'")
+    Returns None if 'run' has no literal 'timeout' argument.
+    """
+    run_args_cache = run_args_cache or child_run_args.RunArgsCache()
+    run_args = run_args_cache.get(testfile)
+    if run_args is None:
+        raise ValueError("Could not extract 'timeout'")
+    timeout = run_args.get('timeout')
+    return timeout if isinstance(timeout, (int, float)) else None
 
 
 class ConsoleAndCapture():
-    """Write both to Console (__stdout__) and Capture (stdout)."""
+    """Write both to Console (__stdout__) and Capture (stdout).
+
+    The capture is written directly so it is always complete. The console is
+    written by the 'ConsoleWriter' thread to not block on a slow console.
+    """
     @staticmethod
     def write(data):
         """Write data to outputs."""
         sys.stdout.write(data)
-        sys.__stdout__.write(data)
+        console_writer().write(data)
 
     @staticmethod
     def flush():
-        """Flush outputs."""
+        """Flush outputs.
+
+        The console is flushed by its thread after each batch.
+        """
         sys.stdout.flush()
-        sys.__stdout__.flush()
+
+
+class ConsoleWriter():
+    """Write to the console from a background thread.
+
+    Chunks go through a queue of at most 'maxsize' entries. The thread writes
+    all the queued chunks at once and flushes after each batch.
+    When the queue is full, chunks are dropped and replaced by a summary line
+    with the number of dropped characters.
+    """
+    SUMMARY = '\n[... {} characters dropped from the console ...]\n'
+
+    def __init__(self, console, maxsize=TEST_CONSOLE_QUEUE):
+        self.console = console
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        """Queue 'data' without blocking, drop it if the queue is full."""
+        chunk = data
+        if self.dropped:
+            chunk = self.SUMMARY.format(self.dropped) + data
+        try:
+            self._queue.put_nowait(chunk)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped += len(data)
+
+    def close(self, timeout=10):
+        """Write the queued chunks and stop the thread.
+
+        Waits at most 'timeout' seconds, and not at all if the thread already
+        stopped, for example on a console write error.
+        """
+        deadline = time.monotonic() + timeout
+        chunks = [None]
+        if self.dropped:
+            chunks.insert(0, self.SUMMARY.format(self.dropped))
+            self.dropped = 0
+        for chunk in chunks:
+            while self._thread.is_alive():
+                try:
+                    self._queue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    if time.monotonic() >= deadline:
+                        return
+        self._thread.join(max(0, deadline - time.monotonic()))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            try:
+                self.console.write(''.join(data for data in batch if data))
+                self.console.flush()
+            except OSError:
+                # Console closed, 'close' does not wait for the thread
+                return
+            if stop:
+                return
+
+
+_CONSOLE_WRITER = None
+
+
+def _close_console_writer():
+    """Close the console writer if created by the current process."""
+    if _CONSOLE_WRITER is not None and _CONSOLE_WRITER.pid == os.getpid():
+        _CONSOLE_WRITER.close()
+
+
+def console_writer():
+    """Return the console writer of the current process.
+
+    A forked board worker does not have the parent thread so it gets its own.
+    """
+    global _CONSOLE_WRITER  # pylint:disable=global-statement
+    if _CONSOLE_WRITER is None or _CONSOLE_WRITER.pid != os.getpid():
+        _CONSOLE_WRITER = ConsoleWriter(sys.__stdout__)
+    return _CONSOLE_WRITER
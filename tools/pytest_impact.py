@@ -0,0 +1,236 @@
+"""
+Skip the BOARD.APPLICATION tests not affected by the RIOT changes.
+
+After a successful build with '--impact-record', the files the application
+depends on are saved in '--impact-db' as 'BOARD/APPLICATION.json':
+
+* the sources and headers listed in the '.d' files in BINDIR, relative ones
+  are relative to APPDIR where the compiler runs
+* all the files in APPDIR
+
+Paths are relative to RIOTBASE, files outside of it are ignored.
+
+With '--impact-base REV', the files changed in RIOTBASE since REV, committed
+or not, and the untracked files are compared with the saved dependencies.
+When none of them affect the current BOARD/APPLICATION, all its tests are
+skipped with the reason in the junit-xml output. A change affects it when:
+
+* there is no saved dependencies for it
+* the file is a global build file, see 'GLOBAL_FILES'
+* the file is one of the dependencies
+* the file is not a source file and is in the directory of a dependency,
+  like a 'Makefile.dep'
+* the file is a build file, see 'BUILD_FILES', in a module with a
+  dependency, like 'cpu/CPU/ldscripts/CPU.ld' for sources in 'cpu/CPU'.
+  Linker scripts and makefiles can be in directories without sources.
+
+BOARD, APPLICATION, RIOTBASE, APPDIR and BINDIR are taken from the
+environment as exported by 'pytest.mk.post' and 'clean_all.mk.pre'.
+"""
+
+import os
+import re
+import sys
+import json
+import fnmatch
+import subprocess
+
+import pytest
+
+ENV_VARS = ('BOARD', 'APPLICATION', 'RIOTBASE', 'APPDIR', 'BINDIR')
+SOURCE_EXTENSIONS = ('.c', '.h', '.cpp', '.hpp', '.cc', '.s', '.S')
+# Files that can change every build
+GLOBAL_FILES = ('Makefile.*', 'makefiles/*', 'dist/tools/*', 'pkg/Makefile*')
+# Files used by the build without being in the '.d' files
+BUILD_FILES = ('*/Makefile*', '*.mk', '*.ld', '*/ldscripts/*')
+# Path components of a module directory, like 'cpu/CPU' or 'boards/BOARD'
+MODULE_DEPTH = 2
+
+
+def pytest_addoption(parser):
+    """Add the impact options."""
+    group = parser.getgroup('impact', 'RIOT changes impact selection')
+    group.addoption('--impact-db', metavar='DIR',
+                    help='Directory with the applications dependencies')
+    group.addoption('--impact-base', metavar='REV',
+                    help='Skip the tests not affected by the changes in '
+                         'RIOTBASE since REV')
+    group.addoption('--impact-record', action='store_true', default=False,
+                    help='Save the application dependencies after the run')
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config, items):
+    """Skip all the items if the application is not affected."""
+    database = config.getoption('impact_db')
+    base = config.getoption('impact_base')
+    if not database or not base or not items:
+        return
+
+    env = _environment()
+    try:
+        board, application = env['BOARD'], env['APPLICATION']
+        changed = changed_files(env['RIOTBASE'], base)
+    except (KeyError, OSError, subprocess.CalledProcessError) as err:
+        print('pytest_impact: not selecting, {!r}'.format(err),
+              file=sys.stderr)
+        return
+
+    deps = read_deps(database, board, application)
+    reason = affected(changed, deps)
+    if reason is not None:
+        print('pytest_impact: {}.{} affected, {}'.format(
+            board, application, reason), file=sys.stderr)
+        return
+
+    skip = pytest.mark.skip(
+        reason='{}.{} not affected by the RIOT changes since {}'.format(
+            board, application, base))
+    for item in items:
+        item.add_marker(skip)
+    config._impact_skipped = True  # pylint:disable=protected-access
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Save the dependencies after a successful run.
+
+    Nothing is saved when the items were skipped as nothing was built.
+    """
+    config = session.config
+    database = config.getoption('impact_db')
+    if not database or not config.getoption('impact_record') or exitstatus:
+        return
+    if getattr(config, '_impact_skipped', False):
+        return
+
+    env = _environment()
+    try:
+        board, application = env['BOARD'], env['APPLICATION']
+        deps = application_deps(env['RIOTBASE'], env['APPDIR'], env['BINDIR'])
+        write_deps(database, board, application, deps)
+    except (KeyError, OSError) as err:
+        print('pytest_impact: dependencies not saved, {!r}'.format(err),
+              file=sys.stderr)
+
+
+def _environment():
+    return {var: os.environ[var] for var in ENV_VARS if var in os.environ}
+
+
+def changed_files(riotbase, base):
+    """Files changed in 'riotbase' since 'base' relative to 'riotbase'.
+
+    Untracked files not ignored by git are also changes.
+    """
+    changed = set()
+    for command in (['diff', '--name-only', base, '--'],
+                    ['ls-files', '--others', '--exclude-standard']):
+        output = subprocess.check_output(['git', '-C', riotbase] + command,
+                                         universal_newlines=True)
+        changed.update(output.splitlines())
+    return changed
+
+
+def affected(changed, deps):
+    """Return why 'changed' files affect 'deps' or None if they do not."""
+    if deps is None:
+        return 'no saved dependencies'
+
+    dep_dirs = {os.path.dirname(dep) for dep in deps}
+    for path in sorted(changed):
+        if any(fnmatch.fnmatch(path, pattern) for pattern in GLOBAL_FILES):
+            return 'global file {} changed'.format(path)
+        if path in deps:
+            return 'dependency {} changed'.format(path)
+        if (not path.endswith(SOURCE_EXTENSIONS) and
+                os.path.dirname(path) in dep_dirs):
+            return 'file {} changed in a dependency directory'.format(path)
+        if (any(fnmatch.fnmatch(path, pattern) for pattern in BUILD_FILES)
+                and _module_with_deps(path, dep_dirs)):
+            return 'build file {} changed in a dependency module'.format(
+                path)
+    return None
+
+
+def _module_with_deps(path, dep_dirs):
+    """Return True if a parent directory of 'path' has dependencies.
+
+    Parents are checked up to 'MODULE_DEPTH' components, 'cpu' or 'boards'
+    alone do not count.
+    """
+    directory = os.path.dirname(path)
+    while len(directory.split('/')) >= MODULE_DEPTH:
+        prefix = directory + '/'
+        if any(dep_dir == directory or dep_dir.startswith(prefix)
+               for dep_dir in dep_dirs):
+            return True
+        directory = os.path.dirname(directory)
+    return False
+
+
+def application_deps(riotbase, appdir, bindir):
+    """Return the files in 'appdir' and in 'bindir' '.d' files.
+
+    Relative paths in the '.d' files are relative to the compiler working
+    directory, 'appdir' where 'make' runs, not to the '.d' file directory.
+    Returned paths are relative to 'riotbase', files outside are ignored.
+    """
+    riotbase = os.path.realpath(riotbase)
+    files = set()
+    for root, dirs, names in os.walk(appdir):
+        # Build directory, as BINDIR, is not an input
+        dirs[:] = [d for d in dirs if d != 'bin']
+        files.update(os.path.join(root, name) for name in names)
+
+    for root, _, names in os.walk(bindir):
+        for name in names:
+            if name.endswith('.d'):
+                files.update(_dfile_deps(os.path.join(root, name), appdir))
+
+    deps = set()
+    for path in files:
+        path = os.path.relpath(os.path.realpath(path), riotbase)
+        if not path.startswith(os.pardir):
+            deps.add(path)
+    return deps
+
+
+def _dfile_deps(path, directory):
+    """Prerequisites listed in a make dependency file.
+
+    Relative prerequisites are joined to 'directory'.
+    """
+    with open(path) as dfd:
+        content = dfd.read().replace('\\\n', ' ')
+    deps = []
+    for line in content.splitlines():
+        _, sep, prerequisites = line.partition(': ')
+        if not sep:
+            continue
+        for dep in re.split(r'(?<!\\)\s+', prerequisites.strip()):
+            if dep:
+                deps.append(os.path.join(directory, dep.replace('\\ ', ' ')))
+    return deps
+
+
+def _deps_path(database, board, application):
+    return os.path.join(database, board, application + '.json')
+
+
+def read_deps(database, board, application):
+    """Return the saved dependencies or None."""
+    try:
+        with open(_deps_path(database, board, application)) as depsfd:
+            return set(json.load(depsfd)['files'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_deps(database, board, application, deps):
+    """Save the dependencies atomically."""
+    path = _deps_path(database, board, application)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as depsfd:
+        json.dump({'files': sorted(deps)}, depsfd, indent=0)
+    os.replace(tmp_path, path)
@@ -9,8 +9,25 @@ everything else, make the output xml have as testcase:
 
 With only two elements in 'classname'.
 This was found by trial and errors in the jenkins test output.
+
+With '--junit-stream', each testcase is written to the '--junit-xml' file
+when it finishes instead of keeping all of them in memory until the end.
+The file is always a complete document, the closing tags are re-written after
+each testcase and the 'testsuite' counters updated in place.
+With '--junit-resume', testcases are appended to an existing streamed file.
+Streaming uses junitxml 'config._xml', removed in pytest 5.4, and is an error
+with newer versions.
 """
 
+import os
+import re
+import time
+import platform
+import datetime
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+import pytest
 import _pytest.junitxml
 
 
@@ -66,9 +83,198 @@ class JenkinsNodeReporter(_pytest.junitxml._NodeReporter):
         config_xml.node_reporters_ordered.append(reporter)
 
 
+class JunitStreamWriter():
+    """Write the testcases of 'config_xml' to 'path' as they finish.
+
+    It is registered as a plugin to get the tests start and reports.
+
+    File layout, the 'testsuite' tag is padded to 'HEADER_SIZE' bytes so its
+    counters can be updated in place:
+
+        <?xml version="1.0" encoding="utf-8"?><testsuites><testsuite ...   >
+        <properties>...</properties>
+        <testcase .../>
+        </testsuite></testsuites>
+    """
+    # pylint:disable=protected-access
+    XML_DECL = b'<?xml version="1.0" encoding="utf-8"?><testsuites>'
+    HEADER_SIZE = 512
+    TRAILER = b'\n</testsuite></testsuites>\n'
+    COUNTERS = ('errors', 'failures', 'skipped', 'tests')
+    COUNTER_RE = re.compile(
+        rb' (errors|failures|skipped|tests|time)="([^"]*)"')
+
+    def __init__(self, config_xml, path, resume=False):
+        self.config_xml = config_xml
+        self.path = path
+        self.resume = resume
+        self.reporters = {}
+        self.start = time.time()
+        self.base = dict.fromkeys(self.COUNTERS, 0)
+        self.base['time'] = 0.0
+        self.timestamp = datetime.datetime.now().isoformat()
+        self._file = None
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_logstart(self, nodeid):
+        """Create the 'JenkinsNodeReporter' for 'nodeid'."""
+        reporter = JenkinsNodeReporter(nodeid, self.config_xml)
+        self.config_xml.node_reporters[(nodeid, None)] = reporter
+        self.config_xml.node_reporters_ordered.append(reporter)
+        self.reporters[nodeid] = reporter
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_logreport(self, report):
+        """Write the testcase after its teardown is recorded by junitxml."""
+        yield
+        if report.when == 'teardown':
+            self.write_testcase(report.nodeid)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_sessionfinish(self):
+        """Close the file, junitxml writes its report to 'os.devnull'."""
+        self.close()
+        self.config_xml.logfile = os.devnull
+        try:
+            yield
+        finally:
+            self.config_xml.logfile = self.path
+
+    def write_testcase(self, nodeid):
+        """Write 'nodeid' testcase and drop its reporter."""
+        reporter = self.reporters.pop(nodeid, None)
+        if reporter is None:
+            return
+        self.config_xml.node_reporters_ordered.remove(reporter)
+        if self._file is None:
+            self._open()
+
+        # Testcase then trailer in one write, so the trailer is only missing
+        # if the write itself is interrupted
+        testcase = _xml_string(reporter.to_xml()).encode('utf-8')
+        self._file.seek(-len(self.TRAILER), os.SEEK_END)
+        self._file.write(b'\n' + testcase + self.TRAILER)
+        self._file.truncate()
+        self._file.seek(len(self.XML_DECL))
+        self._file.write(self._header())
+        self._file.flush()
+
+    def close(self):
+        """Write the remaining testcases and close the file."""
+        for nodeid in list(self.reporters):
+            self.write_testcase(nodeid)
+        if self._file is None:
+            self._open()
+        self._file.close()
+
+    def _open(self):
+        """Open the file, create it or resume from its counters."""
+        if self.resume and os.path.exists(self.path):
+            self._file = open(self.path, 'rb+')
+            self._read_header()
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'wb+')
+        self._file.write(self.XML_DECL + self._header())
+        properties = self.config_xml._get_global_properties_node()
+        if properties is not None and properties != '':
+            self._file.write(b'\n' + _xml_string(properties).encode('utf-8'))
+        self._file.write(self.TRAILER)
+        self._file.flush()
+
+    def _read_header(self):
+        """Read the resumed file counters and check it is complete."""
+        content = self._file.read(len(self.XML_DECL) + self.HEADER_SIZE)
+        self._file.seek(-len(self.TRAILER), os.SEEK_END)
+        if (not content.startswith(self.XML_DECL + b'<testsuite ') or
+                self._file.read() != self.TRAILER):
+            raise ValueError('{}: not a complete streamed junit-xml file, '
+                             'cannot resume'.format(self.path))
+
+        for name, value in self.COUNTER_RE.findall(content):
+            name = name.decode()
+            self.base[name] = float(value) if name == 'time' else int(value)
+
+    def _header(self):
+        """'testsuite' start tag with the current counters."""
+        stats = self.config_xml.stats
+        counters = {
+            'errors': stats['error'],
+            'failures': stats['failure'],
+            'skipped': stats['skipped'],
+            'tests': (stats['passed'] + stats['failure'] + stats['skipped'] +
+                      stats['error'] -
+                      getattr(self.config_xml, 'cnt_double_fail_tests', 0)),
+        }
+        attrs = [('name', getattr(self.config_xml, 'suite_name', 'pytest'))]
+        attrs += [(name, str(self.base[name] + counters[name]))
+                  for name in self.COUNTERS]
+        attrs += [
+            ('time', '%.3f' % (self.base['time'] + time.time() - self.start)),
+            ('timestamp', self.timestamp),
+            ('hostname', platform.node()),
+        ]
+        header = '<testsuite {}'.format(' '.join(
+            '{}={}'.format(name, quoteattr(value)) for name, value in attrs))
+        header = header.encode('utf-8')
+        if len(header) >= self.HEADER_SIZE:
+            raise ValueError('junit-xml testsuite tag longer than {} bytes'
+                             .format(self.HEADER_SIZE))
+        return header.ljust(self.HEADER_SIZE - 1) + b'>'
+
+
+def _xml_string(node):
+    """Return 'node' as a string, for 'py.xml' and 'ElementTree' nodes.
+
+    Reporters finalized by junitxml, after the teardown report, return their
+    already serialized testcase as a 'py.xml.raw'.
+    """
+    if hasattr(node, 'uniobj'):
+        return node.uniobj
+    if hasattr(node, 'unicode'):
+        return node.unicode(indent=0)
+    return ET.tostring(node, encoding='unicode')
+
+
+def pytest_addoption(parser):
+    """Add the streaming options."""
+    group = parser.getgroup('terminal reporting')
+    group.addoption('--junit-stream', action='store_true', default=False,
+                    help='Write the junit-xml testcases as they finish')
+    group.addoption('--junit-resume', action='store_true', default=False,
+                    help='With --junit-stream, append to an existing file')
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    """Register the streaming writer if requested.
+
+    Done last so junitxml already created 'config._xml'. It only exists with
+    '--junit-xml' and before pytest 5.4, streaming is an error without it.
+    """
+    # pylint:disable=protected-access
+    config._jenkins_stream = None
+    if not config.getoption('junit_stream'):
+        return
+    config_xml = getattr(config, '_xml', None)
+    if config_xml is None:
+        raise pytest.UsageError(
+            "--junit-stream needs --junit-xml and pytest 'config._xml', "
+            "removed in pytest 5.4, found pytest {}".format(
+                pytest.__version__))
+    config._jenkins_stream = JunitStreamWriter(
+        config_xml, config_xml.logfile, config.getoption('junit_resume'))
+    config.pluginmanager.register(config._jenkins_stream)
+
+
 def pytest_collection_modifyitems(config, items):
     """Replace nodes reporter to use 'JenkinsNodeReporter'.
 
     This will allow modifying testcases classname and name.
+    When streaming, reporters are created when each test starts.
     """
+    if getattr(config, '_jenkins_stream', None) is not None:
+        return
     JenkinsNodeReporter.items_use_reporter(config, items)
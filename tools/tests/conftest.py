@@ -0,0 +1,15 @@
+"""Tests of the tools, run from the 'tools' directory with:
+
+    python3 -m pytest tests
+
+The tools are not packages, their directories are added to the path as the
+makefiles do with PYTHONPATH.
+"""
+
+import os
+import sys
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in ('pytest', 'cmdxml', ''):
+    sys.path.insert(0, os.path.join(TOOLS_DIR, directory))
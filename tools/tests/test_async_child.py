@@ -0,0 +1,63 @@
+"""Tests for the awaitable 'AsyncCustomSpawn'."""
+# pylint:disable=redefined-outer-name
+
+import time
+import asyncio
+
+import pexpect
+import pytest
+
+
+@pytest.fixture
+def pytest_child():
+    """'pytest_child' module, it needs RIOT 'testrunner'."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    return pytest_child
+
+
+def _spawn(pytest_child, script):
+    return pytest_child.AsyncCustomSpawn('sh', ['-c', script], timeout=5)
+
+
+def test_gather(pytest_child):
+    """Nodes are waited for concurrently by one event loop."""
+    nodes = [_spawn(pytest_child, 'sleep 1; echo "node {}"'.format(index))
+             for index in range(4)]
+
+    async def _expect_all():
+        return await asyncio.gather(*(
+            node.expect(r'node (\d)') for node in nodes))
+
+    start = time.monotonic()
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(_expect_all()) == [0, 0, 0, 0]
+    finally:
+        loop.close()
+    assert time.monotonic() - start < 3
+    assert [node.match.group(1) for node in nodes] == ['0', '1', '2', '3']
+    for node in nodes:
+        node.close(force=True)
+
+
+def test_expect(pytest_child):
+    """Existing data, timeout and EOF as the blocking 'expect'."""
+    node = _spawn(pytest_child, 'echo "first second"; sleep 1; echo last')
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(node.expect_exact('first')) == 0
+        # ' second' is already read
+        assert loop.run_until_complete(node.expect_exact(
+            ['NOPE', 'second'])) == 1
+        assert loop.run_until_complete(node.expect(
+            ['NOPE', pexpect.TIMEOUT], timeout=0.2)) == 1
+        with pytest.raises(pexpect.TIMEOUT) as exc:
+            loop.run_until_complete(node.expect('NOPE', timeout=0.2))
+        assert exc.value.value == 'NOPE'
+        assert loop.run_until_complete(node.expect_exact('last')) == 0
+        with pytest.raises(pexpect.EOF):
+            loop.run_until_complete(node.expect_exact('NOPE'))
+    finally:
+        loop.close()
+        node.close(force=True)
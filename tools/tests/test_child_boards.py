@@ -0,0 +1,128 @@
+"""Tests for running the tests on multiple boards concurrently."""
+
+import os
+import sys
+import subprocess
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import child_boards
+
+# Plugin parametrizing 'child' with the boards as 'pytest_child' does
+CONFTEST = '''
+import pytest
+
+import child_boards
+import child_hooks
+
+BOARDS = child_boards.parse_boards(['board-a=node-1', 'board-b'])
+
+
+def pytest_addhooks(pluginmanager):
+    pluginmanager.add_hookspecs(child_hooks)
+
+
+def pytest_generate_tests(metafunc):
+    if 'child' in metafunc.fixturenames:
+        metafunc.parametrize('child', sorted(BOARDS), indirect=True,
+                             scope='module')
+
+
+@pytest.fixture(scope='module')
+def child(request):
+    return request.param
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session):
+    child_boards.run_boards(session, BOARDS)
+    return True
+'''
+
+# Each board waits for the other one, so they must run concurrently
+TESTS = '''
+import os
+import time
+
+
+def test_local():
+    assert 'BOARD' not in os.environ
+
+
+def test_concurrent(child, tmp_path_factory):
+    directory = os.environ['SYNC_DIR']
+    open(os.path.join(directory, child), 'w').close()
+    other = 'board-b' if child == 'board-a' else 'board-a'
+    deadline = time.monotonic() + 10
+    while not os.path.exists(os.path.join(directory, other)):
+        assert time.monotonic() < deadline, 'boards not run concurrently'
+        time.sleep(0.01)
+
+
+def test_env(child):
+    assert os.environ['BOARD'] == child
+    assert os.environ.get('IOTLAB_NODE') == 'node-1'
+'''
+
+
+def test_parse_boards():
+    """Boards are given one per value or as lists, with an optional node."""
+    assert child_boards.parse_boards(['a=n1, b', 'c']) == {
+        'a': {'BOARD': 'a', 'IOTLAB_NODE': 'n1'},
+        'b': {'BOARD': 'b'}, 'c': {'BOARD': 'c'}}
+
+
+def test_run_boards(tmp_path):
+    """Items run in one worker per board, reported with their own prefix."""
+    (tmp_path / 'conftest.py').write_text(CONFTEST)
+    (tmp_path / 'test_boards.py').write_text(TESTS)
+    (tmp_path / 'sync').mkdir()
+    report = tmp_path / 'report.xml'
+    env = dict(os.environ, SYNC_DIR=str(tmp_path / 'sync'),
+               PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('PYTEST_ADDOPTS', None)
+    env.pop('BOARD', None)
+    proc = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-p', 'no:cacheprovider', '-v',
+         '--assert=plain', '--junit-xml', str(report),
+         '--junit-prefix', '{board}.app', 'test_boards.py'],
+        cwd=str(tmp_path), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, timeout=60)
+    assert proc.returncode == 1, proc.stdout
+
+    testcases = ET.parse(str(report)).getroot().iter('testcase')
+    results = [(case.get('classname'), case.get('name'),
+                case.find('failure') is not None) for case in testcases]
+    # Locally run items are reported first, then in the collection order,
+    # grouped by board by the module scope
+    assert results == [
+        ('{board}.app.test_boards', 'test_local', False),
+        ('board-a.app.test_boards', 'test_concurrent[board-a]', False),
+        ('board-a.app.test_boards', 'test_env[board-a]', False),
+        ('board-b.app.test_boards', 'test_concurrent[board-b]', False),
+        ('board-b.app.test_boards', 'test_env[board-b]', True),
+    ]
+
+
+def test_junitxml_properties(tmp_path):
+    """'PYTEST_PROPERTIES' variables are junit-xml global properties."""
+    pytest.importorskip('testrunner')
+    (tmp_path / 'test_properties.py').write_text(
+        'def testfunc():\n    pass\n')
+    report = tmp_path / 'report.xml'
+    env = dict(os.environ, PYTEST_PROPERTIES='RIOT_VERSION BOARD',
+               RIOT_VERSION='2020.01', BOARD='native',
+               PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('PYTEST_ADDOPTS', None)
+    for args in ([], ['--board', 'native']):
+        subprocess.run([sys.executable, '-m', 'pytest', '-p', 'pytest_child',
+                        '-p', 'no:cacheprovider', '--assert=plain',
+                        '--junit-xml', str(report), 'test_properties.py'] +
+                       args, cwd=str(tmp_path), env=env, check=True,
+                       stdout=subprocess.DEVNULL, timeout=60)
+        properties = ET.parse(str(report)).getroot().iter('property')
+        assert [(prop.get('name'), prop.get('value'))
+                for prop in properties] == [('RIOT_VERSION', '2020.01'),
+                                            ('BOARD', 'native')]
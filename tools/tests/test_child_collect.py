@@ -0,0 +1,122 @@
+"""Tests for the 'pytest_child' collection filtering and cache."""
+
+import os
+import sys
+import types
+import subprocess
+
+import pytest
+
+import child_collect
+
+FIXTURES = frozenset({'child', 'request'})
+NAMES = frozenset({'testfunc'})
+
+
+class Item():
+    """Collected item interface."""
+
+    def __init__(self, path, name, fixturenames):
+        self.module = types.SimpleNamespace(__file__=str(path))
+        self.name = name
+        self.fixturenames = fixturenames
+
+
+class DictCache(dict):
+    """pytest 'cache' interface."""
+
+    def set(self, key, value):
+        """Store 'value' for 'key'."""
+        self[key] = value
+
+
+def test_filter_supported(tmp_path):
+    """Items are selected on their fixtures and name without parameters."""
+    items = [Item(tmp_path / 'a.py', 'testfunc', ['child']),
+             Item(tmp_path / 'a.py', 'testfunc[native]', ['child']),
+             Item(tmp_path / 'b.py', 'test_other', ['child']),
+             Item(tmp_path / 'c.py', 'testfunc', ['child', 'tmpdir']),
+             Item(tmp_path / 'c.py', 'testfunc', ['tmpdir', 'capsys'])]
+    selected, deselected, unsupported = child_collect.filter_supported(
+        items, FIXTURES, NAMES)
+    assert selected == items[:2]
+    assert deselected == items[2:]
+    assert unsupported == {'tmpdir': 2, 'capsys': 1}
+    assert child_collect.deselected_summary(deselected, unsupported) == (
+        'pytest_child: deselected 3 items, unsupported fixtures: '
+        'capsys (1), tmpdir (2)')
+
+
+def test_cache(tmp_path):
+    """Files with only deselected items are ignored until they change."""
+    supported, unsupported = tmp_path / 'a.py', tmp_path / 'b.py'
+    supported.write_text('a')
+    unsupported.write_text('b')
+    pytest_cache = DictCache()
+
+    cache = child_collect.CollectionCache(pytest_cache, FIXTURES, NAMES)
+    cache.update([Item(supported, 'testfunc', ['child'])],
+                 [Item(supported, 'test_other', ['child']),
+                  Item(unsupported, 'test_other', ['child'])])
+    cache.save()
+    assert not cache.ignore(str(supported))
+    assert cache.ignore(str(unsupported))
+
+    cache = child_collect.CollectionCache(pytest_cache, FIXTURES, NAMES)
+    assert cache.ignore(str(unsupported))
+    unsupported.write_text('bb')
+    assert not cache.ignore(str(unsupported))
+
+    # Once it has a supported test, it is not ignored anymore
+    os.utime(str(unsupported), ns=(0, 0))
+    cache.update([], [Item(unsupported, 'test_other', ['child'])])
+    assert cache.ignore(str(unsupported))
+    cache.update([Item(unsupported, 'testfunc', ['child'])], [])
+    assert not cache.ignore(str(unsupported))
+
+
+def test_cache_invalidated(tmp_path):
+    """Cached files are dropped when the supported tests change."""
+    unsupported = tmp_path / 'b.py'
+    unsupported.write_text('b')
+    pytest_cache = DictCache()
+    cache = child_collect.CollectionCache(pytest_cache, FIXTURES, NAMES)
+    cache.update([], [Item(unsupported, 'test_other', ['child'])])
+    cache.save()
+
+    cache = child_collect.CollectionCache(
+        pytest_cache, FIXTURES | {'async_child'}, NAMES)
+    assert not cache.ignore(str(unsupported))
+    cache = child_collect.CollectionCache(pytest_cache, FIXTURES,
+                                          NAMES | {'test_other'})
+    assert not cache.ignore(str(unsupported))
+
+    # Removed files are not saved
+    unsupported.unlink()
+    cache = child_collect.CollectionCache(pytest_cache, FIXTURES, NAMES)
+    cache.save()
+    assert pytest_cache[cache.KEY]['files'] == {}
+
+
+def test_command_line_file(tmp_path):
+    """A file given on the command line is not imported when unchanged."""
+    pytest.importorskip('testrunner')
+    testfile = tmp_path / 'test_other.py'
+    source = ('with open("imported", "a") as imported:\n'
+              '    imported.write("{}\\n")\n'
+              'def test_other():\n    pass\n')
+    testfile.write_text(source.format(1))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('PYTEST_ADDOPTS', None)
+
+    def _collect():
+        subprocess.run([sys.executable, '-m', 'pytest', '-p', 'pytest_child',
+                        '--assert=plain', testfile.name], cwd=str(tmp_path),
+                       env=env, check=False, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, timeout=60)
+        return (tmp_path / 'imported').read_text().split()
+
+    assert _collect() == ['1']
+    assert _collect() == ['1']
+    testfile.write_text(source.format(2))
+    assert _collect() == ['1', '2']
@@ -0,0 +1,103 @@
+"""Tests for 'child_match.BoundedExpecter'."""
+
+import pexpect
+from pexpect.expect import searcher_re, searcher_string
+import pytest
+
+import child_match
+
+
+class BoundedSpawn(pexpect.spawn):
+    """Spawn matching with 'BoundedExpecter' as 'CustomSpawn'."""
+
+    max_match = 8192
+
+    def expect_list(self, pattern_list, timeout=-1, searchwindowsize=-1,
+                    async_=False, **kw):
+        # pylint:disable=arguments-differ,unused-argument
+        expecter = child_match.BoundedExpecter(
+            self, searcher_re(pattern_list), self.max_match)
+        return expecter.expect_loop(self.timeout if timeout == -1 else timeout)
+
+    def expect_exact(self, pattern_list, timeout=-1, searchwindowsize=-1,
+                     async_=False, **kw):
+        # pylint:disable=arguments-differ,unused-argument
+        patterns = child_match.exact_patterns(self, pattern_list)
+        expecter = child_match.BoundedExpecter(self, searcher_string(patterns))
+        return expecter.expect_loop(self.timeout if timeout == -1 else timeout)
+
+
+def _spawn(spawnclass, script):
+    return spawnclass('sh', ['-c', script], encoding='utf-8', timeout=5)
+
+
+def test_unmatched_data_searched_again():
+    """Data read by a failed 'expect' is matched by the next one."""
+    for spawnclass in (pexpect.spawn, BoundedSpawn):
+        child = _spawn(spawnclass, 'printf "MARK 12\\n"; sleep 2')
+        assert child.expect_exact(['NOPE', pexpect.TIMEOUT],
+                                  timeout=0.5) == 1
+        assert child.expect(r'MARK (\d+)') == 0
+        assert child.match.group(1) == '12'
+        child.close(force=True)
+
+
+def test_custom_spawn_unmatched_data():
+    """Same with 'CustomSpawn', it needs RIOT 'testrunner'."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    child = _spawn(pytest_child.CustomSpawn, 'printf "MARK 12\\n"; sleep 2')
+    assert child.expect_exact(['NOPE', pexpect.TIMEOUT], timeout=0.5) == 1
+    assert child.expect(r'MARK (\d+)') == 0
+    assert child.match.group(1) == '12'
+    child.close(force=True)
+
+
+def test_unmatched_data_exact_then_exact():
+    """Lines skipped by an exact string without newline are kept."""
+    child = _spawn(BoundedSpawn, 'printf "first\\nsecond\\n"; sleep 2')
+    assert child.expect_exact(['NOPE', pexpect.TIMEOUT], timeout=0.5) == 1
+    assert child.expect_exact('first') == 0
+    assert child.before == ''
+    assert child.expect_exact('second') == 0
+    assert child.before == '\r\n'
+    child.close(force=True)
+
+
+def test_match_across_reads():
+    """Exact strings and regular expressions match across reads."""
+    child = _spawn(BoundedSpawn,
+                   'printf "ab"; sleep 0.2; printf "cd\\n"; sleep 0.2; '
+                   'printf "xy"; sleep 0.2; printf "z 42\\n"')
+    assert child.expect_exact('abcd') == 0
+    assert child.expect(r'xyz (\d+)') == 0
+    assert child.match.group(1) == '42'
+    child.close(force=True)
+
+
+def test_line_window():
+    """Without newline in the patterns, only the current line is kept."""
+    child = _spawn(BoundedSpawn, 'printf "one\\ntwo\\nthr"; sleep 2')
+    assert child.expect_exact(['NOPE', pexpect.TIMEOUT], timeout=0.5) == 1
+    # pylint:disable=protected-access
+    assert child._buffer.getvalue() == 'thr'
+    assert child._before.getvalue() == 'one\r\ntwo\r\nthr'
+    child.close(force=True)
+
+
+def test_custom_spawn_max_match():
+    """Regular expressions are only bounded with TEST_MAX_MATCH set."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    script = ('printf "START%05000d" 0; sleep 0.2; printf "%05000dEND\\n" 0; '
+              'sleep 2')
+    child = _spawn(pytest_child.CustomSpawn, script)
+    assert child.max_match is None
+    assert child.expect(r'START(0+)END') == 0
+    assert len(child.match.group(1)) == 10000
+    child.close(force=True)
+
+    child = pytest_child.CustomSpawn('sh', ['-c', script], timeout=1,
+                                     max_match=4096)
+    assert child.expect([r'START0+END', pexpect.TIMEOUT]) == 1
+    child.close(force=True)
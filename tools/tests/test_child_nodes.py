@@ -0,0 +1,211 @@
+"""Tests for the nodes pool with the 'pty' nodes stand-in."""
+# pylint:disable=redefined-outer-name
+
+import os
+import sys
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import child_nodes
+
+BOARD = 'native'
+NODES = ['node-1', 'node-2', 'node-3', 'node-4']
+
+
+@pytest.fixture
+def pools(tmp_path):
+    """Return pools of different sessions sharing a directory."""
+    pools = []
+
+    def _pool(nodes=NODES, command=child_nodes.PTY_COMMAND, quarantine=60):
+        pool = child_nodes.NodePool(str(tmp_path / 'pool'), {BOARD: nodes},
+                                    child_nodes.PtyNodes(command),
+                                    quarantine=quarantine)
+        pools.append(pool)
+        return pool
+
+    yield _pool
+    for pool in pools:
+        pool.close()
+
+
+def test_lease(pools):
+    """A node is leased by one session until released."""
+    first, second = pools(NODES[:2]), pools(NODES[:2])
+    leases = first.lease(BOARD)
+    assert [lease.node for lease in leases] == ['node-1']
+    assert leases[0].env['BOARD'] == BOARD
+    port = os.open(leases[0].env['PORT'], os.O_RDONLY)
+    assert os.isatty(port)
+    os.close(port)
+    assert leases[0].reachable()
+
+    other = second.lease(BOARD, 2)
+    assert [lease.node for lease in other] == ['node-2']
+    assert second.lease(BOARD) == []
+    leases[0].release()
+    assert [lease.node for lease in second.lease(BOARD)] == ['node-1']
+    assert first.state(BOARD, 'node-1') == {'failures': 0}
+    assert pools().lease('other') == []
+
+
+def test_lease_concurrent(pools, monkeypatch):
+    """Sessions leasing a board at the same time get their own nodes."""
+    monkeypatch.setattr(child_nodes, 'POLL_INTERVAL', 0.05)
+    sessions = [pools() for _ in range(len(NODES) + 1)]
+    barrier = threading.Barrier(len(sessions))
+    leases = {}
+
+    def _lease(index):
+        barrier.wait()
+        leases[index] = sessions[index].lease(BOARD, timeout=0.5)
+
+    threads = [threading.Thread(target=_lease, args=(index,))
+               for index in range(len(sessions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    nodes = [lease.node for index in sorted(leases)
+             for lease in leases[index]]
+    assert sorted(nodes) == NODES
+
+    # The session without node waits for the first released one
+    waiting = next(index for index in leases if not leases[index])
+    barrier = threading.Barrier(1)
+    thread = threading.Thread(target=_lease, args=(waiting,))
+    thread.start()
+    released = next(lease for index in leases for lease in leases[index])
+    released.release()
+    thread.join()
+    assert [lease.node for lease in leases[waiting]] == [released.node]
+
+
+def test_quarantine(pools, monkeypatch):
+    """A failed or unreachable node is not leased during the quarantine."""
+    # pylint:disable=protected-access
+    monkeypatch.setattr(child_nodes, 'POLL_INTERVAL', 0.05)
+    pool = pools(NODES[:2], command='test $POOL_NODE = node-1 && cat',
+                 quarantine=0.5)
+    pool.backend._node(BOARD, 'node-2').process.wait(5)
+    leases = pool.lease(BOARD, 2)
+    assert [lease.node for lease in leases] == ['node-1']
+    assert pool.state(BOARD, 'node-2')['failure'] == 'unreachable'
+
+    leases[0].release(failure='child connection failed')
+    state = pool.state(BOARD, 'node-1')
+    assert (state['failures'], state['failure']) == (
+        1, 'child connection failed')
+    assert pool.quarantined(BOARD, 'node-1')
+    assert pools(NODES[:1]).lease(BOARD) == []
+
+    leases = pools(NODES[:1]).lease(BOARD, timeout=2)
+    assert [lease.node for lease in leases] == ['node-1']
+    leases[0].release()
+    assert pool.state(BOARD, 'node-1') == {'failures': 0}
+
+
+# 'child' connections opening the node 'PORT', where 'POOL_NODE' is written,
+# the 'node-3' one fails
+CONFTEST = '''
+import os
+import select
+
+import pytest_child
+
+
+def setup_child(spawnclass, env, logfile, timeout=10):
+    port = os.open(os.environ['PORT'], os.O_RDWR | os.O_NOCTTY)
+    try:
+        assert select.select([port], [], [], 5)[0]
+        node = os.read(port, 64).decode().strip()
+    finally:
+        os.close(port)
+    if node == 'node-3':
+        raise RuntimeError('no answer from ' + node)
+    child = spawnclass('cat', env=env, timeout=timeout, echo=False)
+    child.logfile = logfile
+    return child
+
+
+pytest_child.setup_child = setup_child
+pytest_child.teardown_child = lambda child: child.close(force=True)
+'''
+
+# RIOT test module, the 'run' timeout is used by 'child'
+MODULE = '''
+import os
+import sys
+import time
+
+from testrunner import run
+
+{0}
+
+if __name__ == '__main__':
+    sys.exit(run(testfunc, timeout=10))
+'''
+
+# Modules on the first two nodes wait for each other
+CONCURRENT = '''
+def testfunc(child):
+    directory = os.environ['SYNC_DIR']
+    open(os.path.join(directory, '{0}'), 'w').close()
+    deadline = time.monotonic() + 10
+    while not os.path.exists(os.path.join(directory, '{1}')):
+        assert time.monotonic() < deadline, 'nodes not used concurrently'
+        time.sleep(0.01)
+    child.sendline('ping')
+    child.expect_exact('ping')
+'''
+
+MODULES = {
+    'test_a.py': MODULE.format(CONCURRENT.format('a', 'b')),
+    'test_b.py': MODULE.format(CONCURRENT.format('b', 'a')),
+    'test_c.py': MODULE.format('def testfunc(child):\n    pass'),
+    # The worker stops without reporting
+    'test_d.py': MODULE.format('def testfunc(child):\n    os._exit(3)'),
+}
+
+
+def test_run_nodes(tmp_path, pools):
+    """Modules run concurrently on the nodes, released at the end.
+
+    Nodes are quarantined when the 'child' setup failed or when the worker
+    stopped.
+    """
+    pytest.importorskip('testrunner')
+    for name, source in dict(MODULES, **{'conftest.py': CONFTEST}).items():
+        (tmp_path / name).write_text(source)
+    (tmp_path / 'sync').mkdir()
+    env = dict(os.environ, SYNC_DIR=str(tmp_path / 'sync'),
+               PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('PYTEST_ADDOPTS', None)
+    report = tmp_path / 'report.xml'
+    proc = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-p', 'pytest_child',
+         '-p', 'no:cacheprovider', '--assert=plain', '--junit-xml',
+         str(report), '--node-pool', str(tmp_path / 'pool'),
+         '--pool-backend', 'pty', '--pool-timeout', '0',
+         '--pool-pty-command', 'echo $POOL_NODE; exec cat',
+         '--pool-node', '{}={}'.format(BOARD, ','.join(NODES))] +
+        sorted(MODULES), cwd=str(tmp_path), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, timeout=60)
+    assert proc.returncode == 1, proc.stdout
+
+    testcases = ET.parse(str(report)).getroot().iter('testcase')
+    assert [(case.get('classname'), [child.tag for child in case
+                                     if child.tag in ('failure', 'error')])
+            for case in testcases] == [
+                ('test_a', []), ('test_b', []), ('test_c', ['error']),
+                ('test_d', ['failure'])]
+
+    pool = pools()
+    assert [pool.state(BOARD, node).get('failure') for node in NODES] == [
+        None, None, 'child connection failed', 'worker stopped']
+    assert [lease.node for lease in pool.lease(BOARD, len(NODES))] == [
+        'node-1', 'node-2']
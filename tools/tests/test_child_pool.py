@@ -0,0 +1,67 @@
+"""Tests for the 'child' connections kept between modules."""
+# pylint:disable=redefined-outer-name
+
+import select
+
+import pexpect
+import pytest
+
+
+@pytest.fixture
+def pytest_child(monkeypatch):
+    """'pytest_child' with 'cat' as node and a recorded 'make reset'."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    resets = []
+
+    def setup_child(spawnclass, logfile, env, timeout=10):
+        child = spawnclass('cat', env=env, timeout=timeout, echo=False)
+        child.logfile = logfile
+        return child
+
+    monkeypatch.setattr(pytest_child, 'setup_child', setup_child)
+    monkeypatch.setattr(pytest_child, 'teardown_child',
+                        lambda child: child.close(force=True))
+    monkeypatch.setattr(pytest_child, '_reset_node',
+                        lambda env: resets.append(env['BOARD']))
+    monkeypatch.setattr(pytest_child, 'resets', resets, raising=False)
+    return pytest_child
+
+
+def test_reused(pytest_child):
+    """A node connection is reused, flushed and the node reset."""
+    pool = pytest_child.ChildPool()
+    env = {'BOARD': 'native', 'PATH': '/bin:/usr/bin'}
+    child = pool.get({'timeout': 5}, None, env=env)
+    child.sendline('pending')
+    assert child.expect_exact('pending') == 0
+    child.sendline('not read')
+    # Wait for the output not read by the test
+    assert select.select([child.child_fd], [], [], 5)[0]
+
+    assert pool.get({'timeout': 3}, None, env=dict(env)) is child
+    assert pytest_child.resets == ['native']
+    assert child.timeout == 3
+    child.sendline('next')
+    assert child.expect_exact(['not read', 'next']) == 1
+
+    other = pool.get({}, None, env=dict(env, BOARD='samr21-xpro'))
+    assert other is not child
+    assert pytest_child.resets == ['native']
+    pool.close()
+    assert not child.isalive() and not other.isalive()
+
+
+def test_replaced(pytest_child):
+    """A connection that died is replaced by a new one."""
+    pool = pytest_child.ChildPool()
+    env = {'BOARD': 'native', 'PATH': '/bin:/usr/bin'}
+    child = pool.get({'timeout': 5}, None, env=env)
+    child.sendeof()
+    assert child.expect(pexpect.EOF) == 0
+    child.wait()
+
+    new = pool.get({'timeout': 5}, None, env=env)
+    assert new is not child and new.isalive()
+    assert pytest_child.resets == []
+    pool.close()
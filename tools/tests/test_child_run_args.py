@@ -0,0 +1,72 @@
+"""Tests for the 'testrunner.run' arguments extraction and cache."""
+
+import os
+
+import pytest
+
+import child_run_args
+
+
+@pytest.mark.parametrize('source,args', [
+    ('sys.exit(run(testfunc, timeout=10))',
+     {'testfunc': 'testfunc', 'timeout': 10}),
+    ('sys.exit(run(testfunc, 60, False))',
+     {'testfunc': 'testfunc', 'timeout': 60, 'echo': False}),
+    ('sys.exit(testrunner.run(\n    testfunc,\n    timeout=TIMEOUT * 2,\n'
+     '    echo=True))',
+     {'testfunc': 'testfunc', 'echo': True}),
+    ('sys.exit(other.run(testfunc, timeout=10))', None),
+    ('def testfunc(child):\n    pass', None),
+])
+def test_read_run_args(tmp_path, source, args):
+    """Literal and name arguments of the 'run' call are returned."""
+    testfile = tmp_path / '01-run.py'
+    testfile.write_text('import sys\n{}\n'.format(source))
+    assert child_run_args.read_run_args(str(testfile)) == args
+
+
+class DictCache(dict):
+    """pytest 'cache' interface."""
+
+    def set(self, key, value):
+        """Store 'value' for 'key'."""
+        self[key] = value
+
+
+def test_cache(tmp_path, monkeypatch):
+    """Files are parsed again only when their content changed."""
+    parsed = []
+    read_run_args = child_run_args.read_run_args
+
+    def _read_run_args(path):
+        parsed.append(path)
+        return read_run_args(path)
+
+    monkeypatch.setattr(child_run_args, 'read_run_args', _read_run_args)
+    testfile = tmp_path / '01-run.py'
+    testfile.write_text('run(testfunc, timeout=10)\n')
+    path = str(testfile)
+
+    pytest_cache = DictCache()
+    cache = child_run_args.RunArgsCache(pytest_cache)
+    assert cache.get(path)['timeout'] == 10
+    assert cache.get(path)['timeout'] == 10
+    assert len(parsed) == 1
+
+    # Same content with another modification time, only the digest is read
+    os.utime(path, ns=(0, 0))
+    assert cache.get(path)['timeout'] == 10
+    assert len(parsed) == 1
+
+    # Same size, another content
+    testfile.write_text('run(testfunc, timeout=20)\n')
+    os.utime(path, ns=(10 ** 9, 10 ** 9))
+    assert cache.get(path)['timeout'] == 20
+    assert len(parsed) == 2
+
+    cache.save()
+    assert not cache.changed
+    cache = child_run_args.RunArgsCache(pytest_cache)
+    assert cache.get(path)['timeout'] == 20
+    assert len(parsed) == 2
+    assert not cache.changed
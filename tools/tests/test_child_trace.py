@@ -0,0 +1,84 @@
+"""Tests for the 'child' traffic record and replay."""
+# pylint:disable=redefined-outer-name
+
+import os
+import time
+
+import pexpect
+import pytest
+
+import child_trace
+
+
+def _trace(path, records):
+    """Write a trace with the '(kind, data)' records."""
+    recorder = child_trace.TraceRecorder(str(path), {'board': 'native'})
+    for kind, data in records:
+        getattr(recorder, kind)(data)
+    recorder.close()
+    return str(path)
+
+
+@pytest.fixture
+def trace(tmp_path):
+    """Node output 'hello', the test sends 'cmd' then the node says 'ok'."""
+    return _trace(tmp_path / 'tests' / '01-run.py.trace',
+                  [('read', b'hello\n'), ('sent', b'cmd\n'),
+                   ('read', b'ok\n')])
+
+
+@pytest.fixture
+def pytest_child():
+    """'pytest_child' module, it needs RIOT 'testrunner'."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    return pytest_child
+
+
+def test_read_trace(trace):
+    """Records are read back with their kind and data."""
+    metadata, records = child_trace.read_trace(trace)
+    assert metadata['board'] == 'native'
+    assert [(kind, data) for _, kind, data in records] == [
+        (child_trace.READ, b'hello\n'), (child_trace.SENT, b'cmd\n'),
+        (child_trace.READ, b'ok\n')]
+
+
+def test_trace_replay(trace):
+    """Output after the sent data is only given once the test sent it."""
+    replay = child_trace.TraceReplay(trace)
+    assert os.read(replay.readfd, 100) == b'hello\n'
+    while not replay.stalled():
+        time.sleep(0.01)
+    replay.sent(b'cmd\n')
+    assert os.read(replay.readfd, 100) == b'ok\n'
+    assert os.read(replay.readfd, 100) == b''
+    assert replay.error is None
+    os.close(replay.readfd)
+    replay.close()
+
+
+def test_replay_timeout(trace, pytest_child):
+    """Waiting for output the test did not ask for is a TIMEOUT, at once."""
+    spawn = pytest_child.ReplaySpawn(child_trace.TraceReplay(trace),
+                                     timeout=10)
+    start = time.monotonic()
+    assert spawn.expect_exact(['NOPE', pexpect.TIMEOUT]) == 1
+    assert time.monotonic() - start < 5
+    assert spawn.expect_exact('hello') == 0
+    spawn.sendline('cmd')
+    assert spawn.expect_exact('ok') == 0
+    assert spawn.expect_exact([pexpect.EOF, 'NOPE']) == 0
+    spawn.close()
+
+
+def test_replay_sent_error(trace, pytest_child):
+    """Sending other data than the recorded one is an EOF with the error."""
+    spawn = pytest_child.ReplaySpawn(child_trace.TraceReplay(trace),
+                                     timeout=10)
+    assert spawn.expect_exact('hello') == 0
+    spawn.sendline('other')
+    with pytest.raises(pexpect.EOF) as exc:
+        spawn.expect_exact('ok')
+    assert 'Replay sent' in str(exc.value.orig_value)
+    spawn.close()
@@ -0,0 +1,71 @@
+"""Tests for the 'cmdxml' coprocess backend."""
+# pylint:disable=redefined-outer-name,protected-access
+
+import os
+
+import pytest
+
+from pytest_cmdxml.backends import CoprocessBackend
+
+
+@pytest.fixture
+def backend():
+    """Coprocess backend, closed after the test."""
+    backend = CoprocessBackend()
+    yield backend
+    backend.close()
+
+
+def _run(backend, tmp_path, command, name='log'):
+    """Return the 'command' exit code and output."""
+    log = str(tmp_path / name)
+    result = backend.command(command, log)
+    with open(log) as logfd:
+        return result.returncode, logfd.read()
+
+
+@pytest.mark.parametrize('command,returncode', [
+    ('true', 0),
+    ('false; true', 1),
+    ('exit 4', 4),
+    ('func() { return 3; }\nfunc', 3),
+    ('func() { return 3; }\nfunc || echo ignored', 0),
+])
+def test_exit_code(backend, tmp_path, command, returncode):
+    """Commands are executed as with 'bash -xe'."""
+    assert _run(backend, tmp_path, command)[0] == returncode
+
+
+def test_trace_output(backend, tmp_path):
+    """The output and the trace are in the log, without the 'set'."""
+    assert _run(backend, tmp_path, 'echo hello') == (
+        0, '++ echo hello\nhello\n')
+
+
+def test_isolated(backend, tmp_path):
+    """Items do not share variables, functions or working directory."""
+    assert _run(backend, tmp_path, 'VAR=1; func() { :; }; cd /')[0] == 0
+    returncode, output = _run(backend, tmp_path,
+                              'echo "${VAR:-unset}:$(type -t func):$PWD"')
+    assert returncode == 0
+    assert output.splitlines()[-1] == 'unset::{}'.format(os.getcwd())
+
+
+def test_protocol(backend, tmp_path):
+    """Commands and log paths are sent NUL terminated, as they are."""
+    command = 'printf "%s|" "a b" \'$HOME\'\necho\necho "last line"'
+    assert _run(backend, tmp_path, command, name='log with spaces\n') == (
+        0, '++ printf \'%s|\' \'a b\' \'$HOME\'\na b|$HOME|++ echo\n\n'
+        '++ echo \'last line\'\nlast line\n')
+
+
+def test_restart(backend, tmp_path):
+    """A dead coprocess fails its item and is replaced for the next ones."""
+    assert _run(backend, tmp_path, 'true')[0] == 0
+    coprocess = backend._local.coprocess
+    with pytest.raises(RuntimeError, match='bash coprocess died'):
+        _run(backend, tmp_path, 'kill -9 $$')
+    assert not coprocess.alive()
+    assert _run(backend, tmp_path, 'echo again') == (
+        0, '++ echo again\nagain\n')
+    assert backend._local.coprocess is not coprocess
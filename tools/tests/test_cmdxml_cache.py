@@ -0,0 +1,88 @@
+"""Tests for the 'cmdxml' results cache."""
+# pylint:disable=redefined-outer-name,protected-access
+
+import os
+
+import pytest
+
+from pytest_cmdxml.backends import Result
+from pytest_cmdxml.cache import ResultCache
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """Sources directory with a build output directory."""
+    sources = tmp_path / 'src'
+    (sources / 'bin').mkdir(parents=True)
+    (sources / 'main.c').write_text('int main(void) {}\n')
+    (sources / 'bin' / 'main.o').write_text('object\n')
+    return sources
+
+
+def _cache(tmp_path, inputs, **kwargs):
+    return ResultCache(str(tmp_path / 'cache'), env_vars=('BOARD',),
+                       inputs=[str(inputs)],
+                       ignore=[str(inputs / 'bin')], **kwargs)
+
+
+def test_key(tmp_path, inputs, monkeypatch):
+    """The key changes with the command, environment and inputs only."""
+    monkeypatch.setenv('BOARD', 'native')
+    key = _cache(tmp_path, inputs).key('command', 'make')
+    assert _cache(tmp_path, inputs).key('command', 'make') == key
+    assert _cache(tmp_path, inputs).key('command', 'make all') != key
+
+    (inputs / 'bin' / 'main.o').write_text('new object\n')
+    assert _cache(tmp_path, inputs).key('command', 'make') == key
+
+    monkeypatch.setenv('BOARD', 'samr21-xpro')
+    assert _cache(tmp_path, inputs).key('command', 'make') != key
+    monkeypatch.setenv('BOARD', 'native')
+
+    (inputs / 'main.c').write_text('int main(void) { return 1; }\n')
+    assert _cache(tmp_path, inputs).key('command', 'make') != key
+
+
+def test_key_script(tmp_path, inputs):
+    """Scripts are keyed by their content, not their path."""
+    script = tmp_path / 'script.sh'
+    script.write_text('make\n')
+    key = _cache(tmp_path, inputs).key('script', str(script))
+    script.write_text('make all\n')
+    assert _cache(tmp_path, inputs).key('script', str(script)) != key
+
+
+def test_get_put(tmp_path, inputs):
+    """Stored results are replayed, with their excerpt as log."""
+    cache = _cache(tmp_path, inputs)
+    key = cache.key('command', 'false')
+    log = str(tmp_path / 'item.log')
+    assert cache.get(key, log) is None
+
+    cache.put(key, Result(1, log, 'failed\n', {'wall_time': 2.0}))
+    result = cache.get(key, log)
+    assert (result.returncode, result.log) == (1, log)
+    assert result.excerpt.endswith('\nfailed\n')
+    assert result.metrics == {'wall_time': 2.0, 'cached': True}
+    with open(log) as logfd:
+        assert logfd.read() == result.excerpt
+
+    assert _cache(tmp_path, inputs, refresh=True).get(key, log) is None
+
+
+def test_evict(tmp_path, inputs):
+    """Least recently used entries are removed above the maximum size."""
+    cache = _cache(tmp_path, inputs)
+    log = str(tmp_path / 'item.log')
+    keys = [cache.key('command', str(index)) for index in range(4)]
+    for index, key in enumerate(keys):
+        cache.put(key, Result(0, log, 'x' * 100))
+        os.utime(cache._path(key), (1000 + index, 1000 + index))
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(keys[0], log) is not None
+    size = os.path.getsize(cache._path(keys[0]))
+
+    # Entries sizes differ by the 'created' time digits
+    _cache(tmp_path, inputs, max_size=2 * size + 10).close()
+    assert [cache.get(key, log) is not None for key in keys] == [
+        True, False, False, True]
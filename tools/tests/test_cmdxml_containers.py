@@ -0,0 +1,98 @@
+"""Tests for the 'cmdxml' warm containers backend with the 'local' runtime."""
+# pylint:disable=redefined-outer-name
+
+import os
+
+import pytest
+
+from pytest_cmdxml import containers
+
+
+@pytest.fixture
+def lock_dir(tmp_path, monkeypatch):
+    """Directory of the names lock files."""
+    lock_dir = tmp_path / 'locks'
+    lock_dir.mkdir()
+    monkeypatch.setattr(containers, 'LOCK_DIR', str(lock_dir))
+    return lock_dir
+
+
+def _backend(tmp_path, **kwargs):
+    return containers.ContainerBackend(runtime='local',
+                                       volumes=[str(tmp_path)], **kwargs)
+
+
+def test_lease_names(tmp_path, lock_dir):
+    """Sessions with the same configuration lease different names."""
+    first, second = _backend(tmp_path), _backend(tmp_path)
+    # pylint:disable=protected-access
+    names = [first._container().name, second._container().name]
+    assert [name.rsplit('-', 1)[1] for name in names] == ['0', '1']
+    assert first._container().name == names[0]
+    assert sorted(os.listdir(str(lock_dir))) == [n + '.lock' for n in names]
+
+    first.close()
+    assert os.listdir(str(lock_dir)) == [names[1] + '.lock']
+    third = _backend(tmp_path)
+    assert third._container().name == names[0]
+    second.close()
+    third.close()
+    assert os.listdir(str(lock_dir)) == []
+
+
+def test_lease_removed_file(tmp_path, lock_dir):
+    """A lock on a file removed since it was opened is not a lease."""
+    # pylint:disable=protected-access
+    path = str(lock_dir / 'name.lock')
+    with open(path, 'w') as lockfd:
+        assert containers._same_file(lockfd, path)
+        os.unlink(path)
+        assert not containers._same_file(lockfd, path)
+        with open(path, 'w'):
+            assert not containers._same_file(lockfd, path)
+
+
+def _execute(backend, tmp_path, command):
+    result = backend.command(command, str(tmp_path / 'log'))
+    return result.returncode, result.metrics
+
+
+def test_recycle(tmp_path, lock_dir):
+    """The container is started again after 'recycle' items."""
+    # pylint:disable=unused-argument
+    backend = _backend(tmp_path, recycle=2)
+    runs = [_execute(backend, tmp_path, 'true') for _ in range(3)]
+    backend.close()
+
+    assert [metrics['container_builds'] for _, metrics in runs] == [1, 2, 1]
+    assert ['container_startup' in metrics for _, metrics in runs] == [
+        True, False, True]
+    for _, metrics in runs:
+        assert metrics['container_overhead'] >= 0
+        assert metrics['wall_time'] >= 0
+        assert metrics.get('container_startup', 0) >= 0
+
+
+def test_replaced_after_failure(tmp_path, lock_dir):
+    """The container is started again after a failed item."""
+    # pylint:disable=unused-argument
+    backend = _backend(tmp_path)
+    runs = [_execute(backend, tmp_path, command)
+            for command in ('true', 'false', 'true')]
+    backend.close()
+
+    assert [(returncode, metrics['container_builds'],
+             'container_startup' in metrics)
+            for returncode, metrics in runs] == [
+                (0, 1, True), (1, 2, False), (0, 1, True)]
+
+
+def test_runtime_not_found(tmp_path, lock_dir):
+    """A missing runtime is reported when starting the container."""
+    # pylint:disable=unused-argument
+    backend = _backend(tmp_path)
+    backend.runtime = str(tmp_path / 'missing-runtime')
+    with pytest.raises(RuntimeError, match='missing-runtime not found'):
+        _execute(backend, tmp_path, 'true')
+    backend.close()
+    assert os.listdir(str(lock_dir)) == []
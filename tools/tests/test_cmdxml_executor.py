@@ -0,0 +1,74 @@
+"""Tests for the 'cmdxml' items executor."""
+
+import argparse
+import threading
+
+import pytest
+
+import pytest_cmdxml
+from pytest_cmdxml.backends import Result
+from pytest_cmdxml.executor import Executor
+from pytest_cmdxml.metrics import Metrics
+from pytest_cmdxml.output import OutputLog
+
+
+class BarrierBackend():
+    """Backend whose items all wait for each other, 'jobs' at a time."""
+
+    def __init__(self, jobs):
+        self.barrier = threading.Barrier(jobs, timeout=10)
+        self.started = []
+
+    def command(self, command, log):
+        """Write 'command' to 'log' once 'jobs' items are running."""
+        self.started.append(command)
+        self.barrier.wait()
+        with open(log, 'w') as logfd:
+            logfd.write(command + '\n')
+        return Result(int(command), log)
+
+    def close(self):
+        """Nothing to release."""
+
+
+class _Parser():
+    """'pytest_addoption' parser interface on an argparse parser."""
+
+    def __init__(self, parser):
+        self.addoption = parser.add_argument
+
+
+class _Node():
+    def __init__(self, nodeid):
+        self.nodeid = nodeid
+        self.user_properties = []
+
+
+def test_jobs_concurrent_in_order(tmp_path):
+    """Items run together and each test gets its own result, in order."""
+    backend = BarrierBackend(jobs=4)
+    executor = Executor(backend, OutputLog(str(tmp_path)), Metrics(None),
+                        jobs=4)
+    commands = [str(returncode) for returncode in range(8)]
+    executor.start([('cmd{}'.format(command), 'command', command)
+                    for command in commands])
+    results = [executor.run(_Node('cmd{}'.format(command)), 'command',
+                            command)
+               for command in commands]
+    executor.stop()
+    # A sequential execution would break the barrier
+    assert not backend.barrier.broken
+    assert [result.returncode for result in results] == list(range(8))
+    assert [result.excerpt.splitlines()[0] for result in results] == commands
+    assert [item['nodeid'] for item in executor.metrics.items] == [
+        'cmd{}'.format(command) for command in commands]
+
+
+@pytest.mark.parametrize('value', ['0', '-1'])
+def test_jobs_invalid(value):
+    """'--jobs' must be at least 1."""
+    parser = argparse.ArgumentParser()
+    pytest_cmdxml.pytest_addoption(_Parser(parser))
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--jobs', value])
+    assert parser.parse_args(['--jobs', '3']).jobs == 3
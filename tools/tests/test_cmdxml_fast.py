@@ -0,0 +1,93 @@
+"""Tests for 'cmdxml --fast' reports compared to the pytest ones."""
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import pytest_cmdxml
+import bench_startup
+from pytest_cmdxml import fast
+
+# 'cmdxml --fast' writes the pytest 5.3 report, its assertion rewriting does
+# not work after python 3.9
+PYTEST_53 = (pytest.__version__.startswith('5.3.') and
+             sys.version_info < (3, 10))
+
+COMMANDS = ['true', 'echo "<it\'s>"; printf "\\x01"; false', 'true']
+SCRIPT = os.path.join(os.path.dirname(bench_startup.CMDXML), 'script.sh')
+
+
+@pytest.fixture(autouse=True)
+def pythonpath(monkeypatch):
+    """'pytest_jenkins' in PYTHONPATH as for 'clean_all.mk.pre'."""
+    tools = os.path.dirname(os.path.dirname(bench_startup.CMDXML))
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(
+        [tools, os.environ.get('PYTHONPATH', '')]))
+    monkeypatch.delenv('PYTEST_ADDOPTS', raising=False)
+
+
+def _run_fast(tmp_path, monkeypatch, commands, *args):
+    """Run 'fast' with the installed pytest supported, return the report."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fast, 'supported_pytest', lambda: True)
+    args = ['--verbosity=1', '--junit-xml=report.xml', '--tb=short',
+            '--output-dir=output'] + bench_startup.FLAGS + list(args)
+    for command in commands:
+        args += ['--command', command]
+    returncode = fast.run(args + pytest_cmdxml.PYTEST_ARGS)
+    return returncode, (tmp_path / 'report.xml').read_text()
+
+
+def test_supported_pytest():
+    """Only pytest 5.3 is supported, pytest is used otherwise."""
+    assert fast.supported_pytest() == PYTEST_53
+    if not PYTEST_53:
+        assert fast.run(pytest_cmdxml.PYTEST_ARGS) is None
+
+
+def test_fast_report(tmp_path, monkeypatch):
+    """One testcase per item with the pytest 5.3 'xunit1' content."""
+    _, report = _run_fast(tmp_path, monkeypatch, COMMANDS, '--script',
+                          SCRIPT)
+    suite = ET.fromstring(report)[0]
+    assert (suite.get('tests'), suite.get('failures')) == ('4', '1')
+    testcases = list(suite)
+    assert [case.get('name') for case in testcases] == [
+        'compilation.pytest_cmdxml.cmdxml.test_command[true0]',
+        'compilation.pytest_cmdxml.cmdxml.test_command[{}]'.format(
+            COMMANDS[1].encode('unicode_escape').decode('ascii')),
+        'compilation.pytest_cmdxml.cmdxml.test_command[true1]',
+        'compilation.pytest_cmdxml.cmdxml.test_script[{}]'.format(SCRIPT)]
+    for case in testcases:
+        assert case.get('classname') == 'BOARD.APPLICATION'
+        assert case.get('file') == 'pytest_cmdxml/cmdxml.py'
+        assert 'Full output in' in case.find('system-err').text
+    assert testcases[1].find('failure').text.endswith(
+        'E   assert 1 == 0\nE     -1\nE     +0')
+    assert '#x01' in testcases[1].find('system-err').text
+
+
+@pytest.mark.skipif(not PYTEST_53, reason='needs pytest 5.3, python < 3.10')
+@pytest.mark.parametrize('args', [[], ['-q'], ['-vv']])
+def test_fast_same_as_pytest(tmp_path, args):
+    """Reports are the same, without the values depending on the run."""
+    _, report = bench_startup.run(str(tmp_path), 'pytest', COMMANDS, *args)
+    _, fast = bench_startup.run(str(tmp_path), 'fast', COMMANDS, '--fast',
+                                *args)
+    assert bench_startup.normalize(fast) == bench_startup.normalize(report)
+
+
+@pytest.mark.parametrize('commands,returncode,summary', [
+    (['true'], 0, '1 passed in '),
+    (['false'], 1, '1 failed in '),
+    (['false', 'true', 'true'], 1, '1 failed, 2 passed in '),
+    ([], 5, 'no tests ran in '),
+])
+def test_fast_summary(tmp_path, monkeypatch, capsys, commands, returncode,
+                      summary):
+    """The outcomes counts are printed as pytest, without the zero ones."""
+    # pylint:disable=too-many-arguments
+    assert _run_fast(tmp_path, monkeypatch, commands)[0] == returncode
+    assert capsys.readouterr().out.splitlines()[-1].startswith(summary)
@@ -0,0 +1,100 @@
+"""Tests for the 'pytest_child' background console writer."""
+# pylint:disable=redefined-outer-name
+
+import time
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def pytest_child():
+    """'pytest_child' module, it needs RIOT 'testrunner'."""
+    pytest.importorskip('testrunner')
+    import pytest_child  # pylint:disable=import-outside-toplevel
+    return pytest_child
+
+
+class SlowConsole():
+    """Console blocking its writes until 'release' is set."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.output = []
+
+    def write(self, data):
+        """Block until released, or raise 'error'."""
+        self.writing.set()
+        if self.error is not None:
+            raise self.error
+        assert self.release.wait(10)
+        self.output.append(data)
+
+    @staticmethod
+    def flush():
+        """Nothing buffered."""
+
+
+def test_drop_summary(pytest_child):
+    """Above 'maxsize' queued chunks, data is dropped and summarized."""
+    console = SlowConsole()
+    writer = pytest_child.ConsoleWriter(console, maxsize=2)
+    writer.write('a')
+    assert console.writing.wait(10)
+    for data in ('b', 'c', 'dddd', 'ee'):
+        writer.write(data)
+    assert writer.dropped == 6
+
+    console.release.set()
+    # Until the thread emptied the queue, the retries are also dropped
+    retries = 0
+    writer.write('f')
+    while writer.dropped:
+        retries += 1
+        assert retries < 10000
+        time.sleep(0.001)
+        writer.write('f')
+    writer.close()
+    assert ''.join(console.output) == 'abc{}f'.format(
+        writer.SUMMARY.format(6 + retries))
+
+
+def test_close_summary(pytest_child):
+    """Data dropped since the last write is summarized when closing."""
+    console = SlowConsole()
+    writer = pytest_child.ConsoleWriter(console, maxsize=1)
+    writer.write('a')
+    assert console.writing.wait(10)
+    writer.write('b')
+    writer.write('ccc')
+    console.release.set()
+    writer.close()
+    assert ''.join(console.output) == 'ab' + writer.SUMMARY.format(3)
+
+
+def test_close_deadline(pytest_child):
+    """Closing a blocked console returns after the timeout."""
+    console = SlowConsole()
+    writer = pytest_child.ConsoleWriter(console, maxsize=1)
+    writer.write('a')
+    assert console.writing.wait(10)
+    writer.write('b')
+    start = time.monotonic()
+    writer.close(timeout=0.3)
+    assert 0.3 <= time.monotonic() - start < 5
+    console.release.set()
+
+
+def test_close_stopped(pytest_child):
+    """Closing does not wait when the thread stopped on a console error."""
+    console = SlowConsole(error=OSError('closed'))
+    writer = pytest_child.ConsoleWriter(console, maxsize=1)
+    writer.write('a')
+    assert console.writing.wait(10)
+    writer.write('b')
+    writer.write('c')
+    start = time.monotonic()
+    writer.close(timeout=5)
+    assert time.monotonic() - start < 1
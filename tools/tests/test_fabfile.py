@@ -0,0 +1,200 @@
+"""Tests for the server setup fabfile helpers, run without a server."""
+# pylint:disable=redefined-outer-name
+
+import os
+import re
+import sys
+import time
+import hashlib
+import subprocess
+
+import pytest
+
+SETUP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'setup')
+sys.path.insert(0, SETUP_DIR)
+
+pytest.importorskip('fabric')
+fabfile = pytest.importorskip('fabfile')
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    """Bundle directory with debs, wheels and its checksums."""
+    files = {'debs/vim.deb': b'vim', 'debs/Packages': b'Package: vim\n',
+             'wheels/pytest.whl': b'\0' * (3 << 20),
+             fabfile.BUNDLE_SOURCES: b'deb file:/bundle debs/\n'}
+    for relpath, content in files.items():
+        (tmp_path / relpath).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / relpath).write_bytes(content)
+    fabfile._write_checksums(str(tmp_path))  # pylint:disable=protected-access
+    return tmp_path, files
+
+
+def _sha256sum_check(bundle_dir):
+    """Verify the checksums as '_bundle_available' does on the server."""
+    return subprocess.run(['sha256sum', '--check', '--quiet',
+                           fabfile.BUNDLE_CHECKSUMS], cwd=str(bundle_dir),
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+def test_checksums(bundle):
+    """Sorted 'sha256sum' lines for the bundle files except the sums."""
+    bundle_dir, files = bundle
+    sums = (bundle_dir / fabfile.BUNDLE_CHECKSUMS).read_text()
+    assert sums == ''.join(
+        '{0}  {1}\n'.format(hashlib.sha256(files[relpath]).hexdigest(),
+                            relpath) for relpath in sorted(files))
+    # pylint:disable=protected-access
+    assert fabfile._sha256(str(bundle_dir / 'wheels/pytest.whl')) == (
+        hashlib.sha256(files['wheels/pytest.whl']).hexdigest())
+
+    # Re-written without its own checksum
+    fabfile._write_checksums(str(bundle_dir))
+    assert (bundle_dir / fabfile.BUNDLE_CHECKSUMS).read_text() == sums
+
+
+def test_checksums_verification(bundle, monkeypatch):
+    """A modified file is detected before and after the copy."""
+    bundle_dir, _ = bundle
+    assert _sha256sum_check(bundle_dir)
+
+    (bundle_dir / 'debs/vim.deb').write_bytes(b'vi')
+    assert not _sha256sum_check(bundle_dir)
+
+    def _remote(*args, **kwargs):
+        raise AssertionError('remote operation {0!r} {1!r}'.format(
+            args, kwargs))
+
+    for name in ('run', 'sudo', 'put'):
+        monkeypatch.setattr(fabfile, name, _remote)
+    with pytest.raises(SystemExit):
+        fabfile.push_bundle(str(bundle_dir))
+
+
+class Result(str):
+    """'run' result interface."""
+
+    def __new__(cls, output, return_code):
+        result = super().__new__(cls, output)
+        result.return_code = return_code
+        result.failed = return_code != 0
+        return result
+
+
+@pytest.fixture
+def local_run(monkeypatch):
+    """Run the batches with the local 'bash'."""
+    def _run(command, **_):
+        proc = subprocess.run(['bash', '-c', command], check=False,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              universal_newlines=True)
+        return Result(proc.stdout, proc.returncode)
+
+    monkeypatch.setattr(fabfile, 'run', _run)
+    monkeypatch.setitem(fabfile.env, 'batch_dry_run', False)
+
+
+def test_batch(tmp_path, local_run):
+    """Steps share the shell variables, files are sent in the script."""
+    local = tmp_path / 'local'
+    local.write_text('content\n')
+    batch = fabfile.Batch('batch')
+    batch.run('dest={0}/remote'.format(tmp_path))
+    batch.put(str(local), '$dest/file', mode=0o600)
+    batch.run('cat "$dest/file"', name='cat')
+    # A line with only the marker is output
+    batch.run('echo {0}; echo end'.format(batch.marker), name='marker')
+    steps = batch.execute()
+
+    assert [(step.name, step.return_code, step.output) for step in steps] == [
+        ('dest={0}/remote'.format(tmp_path), 0, ''),
+        ('put {0} $dest/file'.format(local), 0, ''),
+        ('cat', 0, 'content'),
+        ('marker', 0, 'end')]
+    assert not batch.skipped
+    assert (tmp_path / 'remote' / 'file').read_text() == 'content\n'
+    assert (tmp_path / 'remote' / 'file').stat().st_mode & 0o777 == 0o600
+
+
+def test_batch_unless(tmp_path, local_run):
+    """No step is run when the 'unless' command succeeds."""
+    batch = fabfile.Batch('batch', unless='test -d {0}'.format(tmp_path))
+    batch.run('touch {0}/done'.format(tmp_path))
+    steps = batch.execute()
+    assert batch.skipped
+    assert steps[0].return_code is None
+    assert not (tmp_path / 'done').exists()
+
+
+@pytest.mark.parametrize('command', ['echo failed; (exit 3)',
+                                     'echo failed; exit 3'])
+def test_batch_failure(tmp_path, local_run, command):
+    """The batch aborts at the first failed step without 'warn_only'.
+
+    A step exiting the script gets the script exit code.
+    """
+    batch = fabfile.Batch('batch')
+    batch.run('echo one')
+    batch.run('false', warn_only=True)
+    batch.run(command, name='failing')
+    batch.run('touch {0}/never'.format(tmp_path))
+    with pytest.raises(SystemExit):
+        batch.execute()
+    assert [(step.return_code, step.output) for step in batch.steps] == [
+        (0, 'one'), (1, ''), (3, 'failed'), (None, '')]
+    assert not (tmp_path / 'never').exists()
+
+
+# Steps that need another step done first
+SETUP_DEPENDENCIES = [
+    ('setup_sudo_and_ssh_key', 'setup_ci_home'),
+    ('create_partition', 'mount_builds_directory'),
+    ('mount_builds_directory', 'setup_ci_home'),
+    ('mount_builds_directory', 'setup_ccache'),
+    ('_push_local_bundle', 'update'),
+    ('update', 'upgrade'),
+    ('update', 'install_all_packages'),
+    ('install_all_packages', 'setup_ccache'),
+    ('install_all_packages', 'apt_cache_clean'),
+]
+
+
+def test_setup_steps_order():
+    """Each step runs after the ones it needs."""
+    names = [step.__name__ for step, _ in fabfile.SETUP_STEPS]
+    assert len(set(names)) == len(names)
+    for before, after in SETUP_DEPENDENCIES:
+        assert names.index(before) < names.index(after), (before, after)
+
+
+def test_setup(tmp_path, monkeypatch, capsys):
+    """Hosts are setup in parallel, the steps timings are printed."""
+    def _step(name):
+        def _run(**kwargs):
+            host = fabfile.env.host_string
+            with open(str(tmp_path / host), 'a') as logfd:
+                logfd.write('{0} {1}\n'.format(name, kwargs))
+            time.sleep(0.5)
+        _run.__name__ = name
+        return _run
+
+    monkeypatch.setattr(fabfile, 'SETUP_STEPS', [
+        (_step('first'), {}), (_step('second'), {'max_age': 60})])
+    monkeypatch.setitem(fabfile.env, 'hosts', ['host-a', 'host-b'])
+    start = time.time()
+    fabfile.setup()
+    assert time.time() - start < 1.9
+
+    for host in ('host-a', 'host-b'):
+        assert (tmp_path / host).read_text() == (
+            "first {}\nsecond {'max_age': 60}\n")
+    output = capsys.readouterr().out
+    output = re.sub(r'^\[.*?\] ', '', output, flags=re.M)
+    output = re.sub(r'\d+\.\d', 'N', output).splitlines()
+    assert output[-6:] == ['host-a: Ns', '    first                        Ns',
+                           '    second                       Ns',
+                           'host-b: Ns', '    first                        Ns',
+                           '    second                       Ns']
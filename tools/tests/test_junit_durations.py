@@ -0,0 +1,97 @@
+"""Tests for the durations database and the longest first scheduling."""
+
+import sys
+import json
+
+import pytest
+
+import junit_durations
+
+BOARDS = ('iotlab-m3', 'native')
+
+
+def _write_results(path, durations, start='2020-01-01T10:00:00'):
+    """One file per '{(board, application): duration}' compilation suite."""
+    path.mkdir(parents=True, exist_ok=True)
+    for (board, application), duration in durations.items():
+        classname = '{}.{}'.format(board, application)
+        (path / '{}.xml'.format(classname)).write_text(
+            '<testsuites><testsuite name="{0}" timestamp="{1}">'
+            '<testcase classname="{0}" name="compilation.test_command" '
+            'time="{2}"/></testsuite></testsuites>'.format(
+                classname, start, duration))
+    return str(path)
+
+
+def _main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['junit_durations.py'] + list(args))
+    return junit_durations.main()
+
+
+def test_lpt():
+    """Longest cells first, each to the least loaded worker."""
+    durations = {('a', 'x'): 7, ('a', 'y'): 5, ('b', 'x'): 4,
+                 ('b', 'y'): 3, ('c', 'x'): 3}
+    plan, makespan = junit_durations.lpt_schedule(durations, 2)
+    assert plan == [[('a', 'x'), ('b', 'y')],
+                    [('a', 'y'), ('b', 'x'), ('c', 'x')]]
+    assert makespan == 12
+    assert junit_durations.plan_makespan(
+        plan, {('a', 'x'): 1, ('a', 'y'): 10}) == 10
+
+
+def test_lpt_unknown():
+    """Without durations, cells are given round-robin."""
+    cells = [(board, str(index)) for board in BOARDS for index in range(3)]
+    plan, makespan = junit_durations.lpt_schedule(
+        dict.fromkeys(cells, 0.0), 4)
+    assert [len(cells) for cells in plan] == [2, 2, 1, 1]
+    assert makespan == 0.0
+
+
+def test_record_schedule_report(tmp_path, monkeypatch, capsys):
+    """Recorded durations are used for the plan, compared with a run."""
+    database = str(tmp_path / 'durations.db')
+    plan = str(tmp_path / 'plan.json')
+    schedule = ('schedule', '--board', 'iotlab-m3', '--board', 'native',
+                '--workers', '2', '--output', plan)
+
+    # Nothing recorded yet
+    assert _main(monkeypatch, database, *schedule,
+                 '--application', 'tests_a', '--application', 'tests_b') == 0
+    assert 'Predicted makespan unknown for 4 cells' in capsys.readouterr().out
+    with open(plan) as planfd:
+        assert [len(cells) for cells in json.load(planfd)['workers']] == [
+            2, 2]
+
+    for run, duration in (('run1', 10.0), ('run2', 20.0)):
+        results = _write_results(tmp_path / run, {
+            ('iotlab-m3', 'tests_a'): duration,
+            ('native', 'tests_a'): 2.0,
+            ('native', 'tests_b'): 4.0})
+        assert _main(monkeypatch, database, 'record', '--run', run,
+                     results) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == (
+        'Recorded run run2: 3 testsuites, makespan 20.0s')
+
+    # 'iotlab-m3 tests_b' is not known, it gets the mean of the others
+    assert _main(monkeypatch, database, *schedule) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        'worker 0: iotlab-m3.tests_a',
+        'worker 1: iotlab-m3.tests_b native.tests_b native.tests_a',
+        'Predicted makespan 15.0s for 4 cells on 2 workers']
+
+    assert _main(monkeypatch, database, 'report', plan) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        'Run run2',
+        'Predicted makespan: 15.0s',
+        'Actual makespan:    20.0s',
+        'Plan with actual durations: 20.0s']
+
+
+@pytest.mark.parametrize('workers', ['0', '-1'])
+def test_workers_invalid(tmp_path, monkeypatch, workers):
+    """At least one worker is needed."""
+    with pytest.raises(SystemExit):
+        _main(monkeypatch, str(tmp_path / 'durations.db'), 'schedule',
+              '--workers', workers)
@@ -0,0 +1,112 @@
+"""Tests for the junit-xml files merge and index."""
+
+import sys
+import json
+import xml.etree.ElementTree as ET
+
+import junit_merge
+
+
+def _suite(name, timestamp, testcases):
+    """Testsuite with '(classname, name, status)' testcases."""
+    lines = ['<testsuite name="{}" timestamp="{}">'.format(name, timestamp)]
+    for classname, testname, status in testcases:
+        lines.append('<testcase classname="{}" name="{}" time="1.5">'.format(
+            classname, testname))
+        if status != 'passed':
+            lines.append('<{} message="{}">text</{}>'.format(
+                status, status, status))
+        lines.append('</testcase>')
+    lines.append('</testsuite>')
+    return '\n'.join(lines)
+
+
+def _write(path, *suites):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n'
+                    '{}\n</testsuites>\n'.format('\n'.join(suites)))
+
+
+def _main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['junit_merge.py'] + list(args))
+    return junit_merge.main()
+
+
+def _results(tmp_path):
+    """Results where the 'native' suite is there twice, and an invalid file.
+    """
+    compilation = [('native.tests_a', 'compilation.test_command', 'passed')]
+    _write(tmp_path / 'results' / 'native' / 'old.xml',
+           _suite('native.tests_a', '2020-01-01T00:00:00', compilation))
+    _write(tmp_path / 'results' / 'native' / 'new.xml',
+           _suite('native.tests_a', '2020-01-02T00:00:00',
+                  [compilation[0][:2] + ('failure',)]))
+    _write(tmp_path / 'results' / 'm3' / 'tests.xml',
+           _suite('iotlab-m3.tests_a', '2020-01-01T00:00:00', [
+               ('iotlab-m3.tests_a', 'compilation.test_command', 'passed'),
+               ('iotlab-m3.tests_a', 'test.testfunc', 'error')]),
+           _suite('iotlab-m3.tests_b', '2020-01-01T00:00:00', [
+               ('iotlab-m3.tests_b', 'compilation.test_command',
+                'skipped')]))
+    (tmp_path / 'results' / 'partial.xml').write_text('<testsuites><test')
+    return str(tmp_path / 'results')
+
+
+def test_merge(tmp_path, monkeypatch, capsys):
+    """Duplicated suites are kept once, the most recent one."""
+    output = tmp_path / 'merged.xml'
+    assert _main(monkeypatch, _results(tmp_path), '--output',
+                 str(output)) == 0
+    assert 'Ignoring {}'.format(tmp_path / 'results' / 'partial.xml') in (
+        capsys.readouterr().err)
+
+    root = ET.parse(str(output)).getroot()
+    assert (root.get('tests'), root.get('failures'), root.get('errors'),
+            root.get('skipped'), root.get('time')) == (
+                '4', '1', '1', '1', '6.000')
+    assert [(suite.get('name'), suite.get('timestamp'))
+            for suite in root] == [
+                ('iotlab-m3.tests_a', '2020-01-01T00:00:00'),
+                ('iotlab-m3.tests_b', '2020-01-01T00:00:00'),
+                ('native.tests_a', '2020-01-02T00:00:00')]
+    testcase = root[2][0]
+    assert testcase.attrib == {'classname': 'native.tests_a',
+                               'name': 'compilation.test_command',
+                               'time': '1.5'}
+    assert testcase.find('failure').text == 'text'
+
+
+def test_index(tmp_path, monkeypatch):
+    """Cells have the worst status of the board application testcases."""
+    index = tmp_path / 'index.json'
+    assert _main(monkeypatch, _results(tmp_path), '--index', str(index)) == 0
+    assert json.loads(index.read_text()) == {
+        'iotlab-m3': {
+            'tests_a': {'status': 'error', 'time': 3.0, 'tests': 2,
+                        'stages': {'compilation': 'passed',
+                                   'test': 'error'}},
+            'tests_b': {'status': 'skipped', 'time': 1.5, 'tests': 1,
+                        'stages': {'compilation': 'skipped'}}},
+        'native': {
+            'tests_a': {'status': 'failed', 'time': 1.5, 'tests': 1,
+                        'stages': {'compilation': 'failed'}}}}
+
+
+def test_compare(tmp_path, monkeypatch, capsys):
+    """Cells with another status than in the old index are printed."""
+    results = _results(tmp_path)
+    old = tmp_path / 'old.json'
+    assert _main(monkeypatch, results, '--index', str(old)) == 0
+    assert _main(monkeypatch, results, '--compare', str(old)) == 0
+    capsys.readouterr()
+
+    index = json.loads(old.read_text())
+    index['native']['tests_a']['status'] = 'passed'
+    del index['iotlab-m3']['tests_b']
+    index['samr21-xpro'] = {'tests_a': {'status': 'passed'}}
+    old.write_text(json.dumps(index))
+    assert _main(monkeypatch, results, '--compare', str(old)) == 1
+    assert capsys.readouterr().out.splitlines() == [
+        'iotlab-m3 tests_b None skipped',
+        'native tests_a passed failed',
+        'samr21-xpro tests_a passed None']
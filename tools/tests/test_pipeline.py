@@ -0,0 +1,55 @@
+"""Tests for the 'pipeline.py' stages workers."""
+
+import threading
+
+import pytest
+
+import pipeline
+
+
+def test_nodes_per_test_worker():
+    """Each test worker runs the tests on its own node."""
+    tested = {}
+    lock = threading.Lock()
+
+    def test_step(application, node):
+        with lock:
+            tested[application] = node
+        return 0
+
+    nodes = ['m3-1', 'm3-2']
+    runner = pipeline.Pipeline(lambda application: 0, test_step,
+                               nodes=nodes)
+    results = runner.run(['app{}'.format(i) for i in range(6)])
+    assert all(result == {'compile': 0, 'test': 0}
+               for result in results.values())
+    assert set(tested.values()) <= set(nodes)
+    assert runner.test.workers == 2
+
+
+def test_test_step_exception():
+    """A test step raising does not block the compile stage."""
+    def test_step(application, node):
+        raise RuntimeError(application, node)
+
+    runner = pipeline.Pipeline(lambda application: 0, test_step,
+                               queue_size=1)
+    thread = threading.Thread(target=runner.run,
+                              args=(['app{}'.format(i) for i in range(5)],),
+                              daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert all(result == {'compile': 0, 'test': 1}
+               for result in runner.results.values())
+    assert runner.failed()
+
+
+@pytest.mark.parametrize('option', ['--compile-jobs', '--queue-size'])
+@pytest.mark.parametrize('value', ['0', '-1'])
+def test_invalid_counts(option, value):
+    """At least one compile worker and one queued firmware are needed."""
+    with pytest.raises(SystemExit):
+        pipeline.PARSER.parse_args([option, value, 'tests/app'])
+    assert getattr(pipeline.PARSER.parse_args([option, '1', 'tests/app']),
+                   option[2:].replace('-', '_')) == 1
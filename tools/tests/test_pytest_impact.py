@@ -0,0 +1,144 @@
+"""Tests for the selection of the applications affected by RIOT changes."""
+# pylint:disable=redefined-outer-name
+
+import subprocess
+
+import pytest
+
+import pytest_impact
+
+
+def _git(riotbase, *args):
+    subprocess.check_output(['git', '-C', str(riotbase)] + list(args),
+                            stderr=subprocess.STDOUT)
+
+
+@pytest.fixture
+def riotbase(tmp_path):
+    """RIOT git tree with one committed application and module."""
+    riotbase = tmp_path / 'RIOT'
+    for path in ('tests/app/main.c', 'tests/app/Makefile', 'sys/mod/mod.c',
+                 'sys/include/mod.h', 'cpu/cpu1/periph.c', '.gitignore'):
+        (riotbase / path).parent.mkdir(parents=True, exist_ok=True)
+        (riotbase / path).write_text(path + '\n')
+    (riotbase / '.gitignore').write_text('bin/\n')
+    _git(riotbase, 'init', '-q')
+    _git(riotbase, 'add', '.')
+    _git(riotbase, '-c', 'user.name=test', '-c', 'user.email=test@test',
+         'commit', '-q', '-m', 'base')
+    _git(riotbase, 'tag', 'base')
+    return riotbase
+
+
+def test_changed_files(riotbase):
+    """Committed, not committed and untracked not ignored files."""
+    (riotbase / 'sys/mod/mod.c').write_text('changed\n')
+    _git(riotbase, '-c', 'user.name=test', '-c', 'user.email=test@test',
+         'commit', '-q', '-a', '-m', 'change')
+    (riotbase / 'sys/include/mod.h').write_text('changed\n')
+    (riotbase / 'sys/mod/new.c').write_text('new\n')
+    (riotbase / 'bin').mkdir()
+    (riotbase / 'bin' / 'ignored.o').write_text('ignored\n')
+    assert pytest_impact.changed_files(str(riotbase), 'base') == {
+        'sys/mod/mod.c', 'sys/include/mod.h', 'sys/mod/new.c'}
+
+
+@pytest.mark.parametrize('changed,reason', [
+    ({'sys/other/other.c', 'doc/README.md'}, None),
+    ({'Makefile.include'}, 'global file Makefile.include changed'),
+    ({'sys/mod/mod.c'}, 'dependency sys/mod/mod.c changed'),
+    ({'sys/mod/Makefile.dep'},
+     'file sys/mod/Makefile.dep changed in a dependency directory'),
+    ({'sys/mod/other.c'}, None),
+    ({'cpu/cpu1/ldscripts/cpu1.ld'},
+     'build file cpu/cpu1/ldscripts/cpu1.ld changed in a dependency module'),
+    ({'cpu/cpu2/ldscripts/cpu2.ld'}, None),
+    ({'cpu/Makefile.features'}, None),
+])
+def test_affected(changed, reason):
+    """Why a change affects the dependencies, None if not."""
+    deps = {'tests/app/main.c', 'sys/mod/mod.c', 'cpu/cpu1/periph.c'}
+    assert pytest_impact.affected(changed, deps) == reason
+    assert pytest_impact.affected(changed, None) == 'no saved dependencies'
+
+
+def test_application_deps(riotbase, tmp_path):
+    """Application files and '.d' prerequisites, relative to APPDIR."""
+    appdir = riotbase / 'tests' / 'app'
+    bindir = appdir / 'bin' / 'native'
+    (bindir / 'app').mkdir(parents=True)
+    (bindir / 'app' / 'main.d').write_text(
+        '{0}/app/main.o: {1}/main.c \\\n ../../sys/include/mod.h \\\n'
+        ' /usr/include/stdio.h\n{1}/main.c:\n'.format(bindir, appdir))
+    (bindir / 'mod').mkdir()
+    (bindir / 'mod' / 'mod.d').write_text(
+        '{0}/mod/mod.o: {1}/sys/mod/mod.c\n'.format(bindir, riotbase))
+    deps = pytest_impact.application_deps(str(riotbase), str(appdir),
+                                          str(bindir))
+    assert deps == {'tests/app/main.c', 'tests/app/Makefile',
+                    'sys/include/mod.h', 'sys/mod/mod.c'}
+
+    pytest_impact.write_deps(str(tmp_path / 'db'), 'native', 'app', deps)
+    assert pytest_impact.read_deps(str(tmp_path / 'db'), 'native',
+                                   'app') == deps
+    assert pytest_impact.read_deps(str(tmp_path / 'db'), 'native',
+                                   'other') is None
+
+
+class Config():
+    """pytest config interface."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def getoption(self, name):
+        """Return option 'name' value."""
+        return self.options[name]
+
+
+class Item():
+    """Collected item interface."""
+
+    def __init__(self):
+        self.markers = []
+
+    def add_marker(self, marker):
+        """Record 'marker'."""
+        self.markers.append(marker)
+
+
+@pytest.fixture
+def impact(riotbase, tmp_path, monkeypatch):
+    """Environment of 'native' 'app' with its saved dependencies."""
+    for var, value in (('BOARD', 'native'), ('APPLICATION', 'app'),
+                       ('RIOTBASE', str(riotbase))):
+        monkeypatch.setenv(var, value)
+    database = str(tmp_path / 'db')
+    pytest_impact.write_deps(database, 'native', 'app',
+                             {'tests/app/main.c', 'sys/mod/mod.c'})
+    return Config(impact_db=database, impact_base='base')
+
+
+def _select(config):
+    items = [Item(), Item()]
+    pytest_impact.pytest_collection_modifyitems(config, items)
+    return [[marker.kwargs['reason'] for marker in item.markers]
+            for item in items]
+
+
+def test_skip(impact, riotbase):
+    """All items are skipped when the application is not affected."""
+    (riotbase / 'sys' / 'other.c').write_text('new\n')
+    reason = 'native.app not affected by the RIOT changes since base'
+    assert _select(impact) == [[reason], [reason]]
+
+    (riotbase / 'sys' / 'mod' / 'mod.c').write_text('changed\n')
+    assert _select(impact) == [[], []]
+
+
+@pytest.mark.parametrize('var', ['BOARD', 'APPLICATION', 'RIOTBASE'])
+def test_skip_no_environment(impact, monkeypatch, capsys, var):
+    """Without the environment, the items are not selected."""
+    monkeypatch.delenv(var)
+    assert _select(impact) == [[], []]
+    assert 'pytest_impact: not selecting' in capsys.readouterr().err
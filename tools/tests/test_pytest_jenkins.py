@@ -0,0 +1,93 @@
+"""Tests for 'pytest_jenkins' streaming mode on a real pytest session."""
+
+import os
+import sys
+import subprocess
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import pytest_jenkins
+
+OLD_PYTEST = tuple(int(v) for v in pytest.__version__.split('.')[:2]) < (5, 4)
+
+TESTS = '''
+import pytest
+
+
+@pytest.mark.parametrize('index', range({count}))
+def test_case(index):
+    print('output', index)
+    assert index % 3
+'''
+
+
+def _session(directory, *args, count=3):
+    """Run 'count' tests in 'directory' with 'pytest_jenkins'."""
+    testfile = os.path.join(str(directory), 'test_stream.py')
+    with open(testfile, 'w') as testfd:
+        testfd.write(TESTS.format(count=count))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(pytest_jenkins.__file__),
+         os.environ.get('PYTHONPATH', '')]))
+    cmd = [sys.executable, '-m', 'pytest', '--assert=plain',
+           '-p', 'no:cacheprovider', '-p', 'pytest_jenkins',
+           '--junit-xml=report.xml', '--junit-prefix=BOARD.APP.test',
+           '-o', 'junit_family=xunit1', testfile] + list(args)
+    return subprocess.run(cmd, cwd=str(directory), env=env, check=False,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True)
+
+
+def _testsuite(directory):
+    return ET.parse(os.path.join(str(directory), 'report.xml')).getroot()[0]
+
+
+def _testcases(directory):
+    """Testcases as strings, without times and whitespace between them."""
+    testcases = []
+    for testcase in _testsuite(directory).iter('testcase'):
+        testcase.attrib.pop('time')
+        testcase.tail = None
+        testcases.append(ET.tostring(testcase))
+    return testcases
+
+
+@pytest.mark.skipif(not OLD_PYTEST, reason="needs pytest 'config._xml'")
+def test_stream_and_resume(tmp_path):
+    """Streamed report is the same as junitxml one, then resumed."""
+    result = _session(tmp_path, '--junit-stream')
+    assert 'INTERNALERROR' not in result.stdout, result.stdout
+    suite = _testsuite(tmp_path)
+    assert suite.get('tests') == '3'
+    assert suite.get('failures') == '1'
+    testcases = list(suite.iter('testcase'))
+    assert [(case.get('classname'), case.get('name'))
+            for case in testcases] == [
+                ('BOARD.APP', 'test.test_stream.test_case[{}]'.format(index))
+                for index in range(3)]
+    assert testcases[1].find('system-out').text == 'output 1\n'
+    assert testcases[0].find('failure') is not None
+
+    _session(tmp_path, '--junit-stream', '--junit-resume')
+    suite = _testsuite(tmp_path)
+    assert suite.get('tests') == '6'
+    assert suite.get('failures') == '2'
+    assert len(list(suite.iter('testcase'))) == 6
+
+
+@pytest.mark.skipif(not OLD_PYTEST, reason="needs pytest 'config._xml'")
+def test_stream_same_as_junitxml(tmp_path):
+    """Testcases are the same as the junitxml report ones."""
+    _session(tmp_path)
+    expected = _testcases(tmp_path)
+    _session(tmp_path, '--junit-stream')
+    assert _testcases(tmp_path) == expected
+
+
+@pytest.mark.skipif(OLD_PYTEST, reason="streaming supported")
+def test_stream_unsupported(tmp_path):
+    """Streaming fails loudly without 'config._xml'."""
+    result = _session(tmp_path, '--junit-stream')
+    assert result.returncode != 0
+    assert '--junit-stream needs --junit-xml' in result.stdout